@@ -14,20 +14,49 @@ Usage:
     python batch_process.py --route hilo       # Process specific route
     python batch_process.py --resume           # Resume from last run
     python batch_process.py --status           # Show processing status
+    python batch_process.py --plan --route hilo  # Estimate requests, time and disk (dry run)
+    python batch_process.py --priority mauna_kea,hilo_bayfront  # These routes first
+    python batch_process.py --export-tiles     # Also export cubemap tiles for streaming
+    python batch_process.py --pipelined        # Overlap download/stitch/model stages
+    python batch_process.py --trace run.json   # Stage timings for chrome://tracing / Perfetto
+
+Multi-node (shared panoramas/ directory):
+    python batch_process.py --shard 0/3        # On each node, i = 0..N-1
+    python batch_process.py --lease            # Or claim locations via lease files (joins the current lease run)
+    python batch_process.py --lease --lease-run reprocess-2  # Start/join a new lease run, same name on every node
+    python batch_process.py --merge            # Afterwards, merge node results
 """
 
 import os
+import re
 import sys
 import json
+import time
+import socket
+import shutil
+import hashlib
 import argparse
 import logging
+import threading
+from collections import Counter, defaultdict, deque
+from statistics import median
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict, field
 
 # Import the full pipeline
-from full_pipeline import FullPipeline, PipelineResult
+from full_pipeline import (
+    FullPipeline, PipelineResult, PipelineScheduler, STAGES,
+    ARTIFACT_SUFFIXES, STAGE_ARTIFACTS,
+    add_depth_arguments, add_stage_arguments, stage_workers_from_args
+)
+from depth_estimation import DEPTH_MODELS
+from location_catalog import LocationCatalog, open_catalog, processed_fields
+from tracing import tracer, add_trace_arguments, start_tracing, export_traces
+from memory_governor import MB, add_memory_arguments
+from export_tiles import export_all
 
 # Setup logging
 LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
@@ -38,10 +67,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Multi-node processing
+LEASE_TTL = 15 * 60  # Seconds without renewal before another node may reclaim
+LEASE_RUN_FILE = "run"  # Current lease run id, in the lease directory
+LOCK_TIMEOUT = 120  # Seconds to wait for the catalog merge lock
+
+# Progress journal
+JOURNAL_NAME = "batch_progress.jsonl"
+JOURNAL_COMPACT_BYTES = 64 * 1024 * 1024  # Compact after a run beyond this size
+
+# Location ordering: "tours" finishes whole routes as early as possible,
+# "catalog" keeps locations.json order
+ORDERS = ("tours", "catalog")
+
+# Dry-run planning (--plan)
+PLAN_HISTORY = 200  # Most recent recorded timings / outputs sampled per stage
+# Fallbacks for stages without recorded history
+DEFAULT_STAGE_SECONDS = {
+    "prepare": 0.5, "download": 8.0, "stitch": 4.0,
+    "upscale": 150.0, "estimate_depth": 30.0, "finalize": 0.1,
+}
+DEFAULT_STAGE_BYTES = {
+    "download": 1.5 * MB,  # 18 tiles of 640x640
+    "stitch": 3 * MB,  # 4096x2048 JPEG
+    "upscale": 35 * MB,  # 16384x8192 JPEG
+    "estimate_depth": 40 * MB,  # 16384x8192 PNG
+}
+
 
 @dataclass
 class BatchProgress:
-    """Tracks batch processing progress"""
+    """
+    Tracks batch processing progress.
+    
+    Per-location results are written to the ProgressJournal as they
+    happen; `results` is only filled when reading a legacy
+    batch_progress.json.
+    """
     total_locations: int = 0
     processed: int = 0
     successful: int = 0
@@ -51,6 +113,7 @@ class BatchProgress:
     end_time: str = ""
     results: List[Dict] = field(default_factory=list)
     errors: List[Dict] = field(default_factory=list)
+    routes_completed: List[Dict] = field(default_factory=list)
     
     def to_dict(self) -> Dict:
         return asdict(self)
@@ -60,24 +123,544 @@ class BatchProgress:
         return cls(**data)
 
 
+def slugify(name: str) -> str:
+    """Filesystem-safe location key"""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+
+
+def shard_of(name: str, count: int) -> int:
+    """Stable shard index for a location, identical on every node"""
+    return int(hashlib.md5(name.encode()).hexdigest(), 16) % count
+
+
+def processed_loc_id(loc: Dict) -> Optional[str]:
+    """Output ID of a processed location, from its catalog panorama path"""
+    name = Path(loc.get("panorama_path") or "").name
+    return name[:-len("_panorama.jpg")] if name.endswith("_panorama.jpg") else None
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m {int(seconds % 60):02d}s"
+    return f"{int(seconds // 3600)}h {int(seconds % 3600 // 60):02d}m"
+
+
+def format_bytes(size: float) -> str:
+    return f"{size / MB / 1024:.2f} GB" if size >= 1024 * MB else f"{size / MB:.1f} MB"
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse 'i/N' into (i, N)"""
+    index, count = (int(v) for v in value.split("/"))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be in 0..{count - 1}: {value}")
+    return index, count
+
+
+@contextmanager
+def exclusive_lock(path: Path, timeout: float = LOCK_TIMEOUT, stale_after: float = LEASE_TTL):
+    """
+    Cross-node lock via exclusive file creation.
+    
+    A lock older than stale_after is assumed to belong to a crashed node
+    and is broken.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - path.stat().st_mtime > stale_after:
+                    logger.warning(f"Breaking stale lock: {path}")
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"Timed out waiting for lock: {path}")
+            time.sleep(1)
+    
+    try:
+        os.write(fd, f"{socket.gethostname()} {os.getpid()}\n".encode())
+        os.close(fd)
+        yield
+    finally:
+        path.unlink(missing_ok=True)
+
+
+class LeaseManager:
+    """
+    Claims locations through lease files in a shared directory.
+    
+    A lease is created exclusively and renewed (mtime touched) by a
+    heartbeat thread while its location is processed. A lease not renewed
+    for `ttl` seconds belongs to a crashed node and may be reclaimed.
+    Finished locations get a .done marker holding the lease run id and are
+    not claimed again within that run; markers of other runs are ignored.
+    
+    Args:
+        run_id: Lease run shared by all nodes. Without one, nodes join the
+            run recorded in the lease directory, starting one if there is none.
+        new_run: Start a new lease run even though one is recorded
+    """
+    
+    def __init__(self, lease_dir: Path, node_id: str, ttl: float = LEASE_TTL,
+                 run_id: Optional[str] = None, new_run: bool = False):
+        self.lease_dir = Path(lease_dir)
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+        self.node_id = node_id
+        self.ttl = ttl
+        self.held = set()
+        self.skipped_done = 0  # Claims refused because done in this run
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.run_id = self._start_run(run_id, new_run)
+    
+    def _start_run(self, run_id: Optional[str], new_run: bool) -> str:
+        """
+        Join or start the lease run that .done markers are scoped to.
+        
+        The recorded run is only replaced when a run is named or a new one
+        requested; otherwise the first node to start records one and all
+        others join it.
+        """
+        path = self.lease_dir / LEASE_RUN_FILE
+        try:
+            current = path.read_text().strip() or None
+        except FileNotFoundError:
+            current = None
+        asked = run_id is not None or new_run
+        if not asked and current:
+            logger.info(f"Lease run: {current} (joined)")
+            return current
+        if run_id is None:
+            run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{self.node_id}"
+        if run_id == current:
+            logger.info(f"Lease run: {run_id} (joined)")
+            return run_id
+        
+        tmp = path.with_name(f".{path.name}.{self.node_id}.{os.getpid()}.tmp")
+        tmp.write_text(run_id + "\n")
+        try:
+            if asked:
+                os.replace(tmp, path)
+            else:
+                # First node to record a run wins; the others join it
+                try:
+                    os.link(tmp, path)
+                except FileExistsError:
+                    run_id = path.read_text().strip()
+                    logger.info(f"Lease run: {run_id} (joined)")
+                    return run_id
+        finally:
+            tmp.unlink(missing_ok=True)
+        
+        if current:
+            logger.info(f"Lease run: {run_id} (replaces {current})")
+        else:
+            logger.info(f"Lease run: {run_id}")
+        return run_id
+    
+    def _path(self, name: str) -> Path:
+        return self.lease_dir / f"{slugify(name)}.lease"
+    
+    def _done_path(self, name: str) -> Path:
+        return self.lease_dir / f"{slugify(name)}.done"
+    
+    def _break_expired(self, path: Path) -> bool:
+        """Move an expired lease aside; True if this node broke it"""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return True
+        if time.time() - stat.st_mtime < self.ttl:
+            return False
+        
+        # Only one node's rename succeeds. If the file renamed is not the
+        # expired one, another node reclaimed it first: put it back.
+        stale = path.with_name(f"{path.name}.{self.node_id}.stale")
+        try:
+            os.rename(path, stale)
+        except FileNotFoundError:
+            return True
+        if os.stat(stale).st_ino != stat.st_ino:
+            try:
+                os.link(stale, path)
+            except FileExistsError:
+                pass
+            os.unlink(stale)
+            return False
+        
+        os.unlink(stale)
+        logger.warning(f"Reclaiming expired lease: {path.name}")
+        return True
+    
+    def is_done(self, name: str) -> bool:
+        """Whether a location was finished in this lease run"""
+        try:
+            marker = json.loads(self._done_path(name).read_text())
+        except (OSError, ValueError):
+            return False  # No marker, or one from before markers held a run id
+        return isinstance(marker, dict) and marker.get("run") == self.run_id
+    
+    def claim(self, name: str) -> bool:
+        """Try to take the lease for a location"""
+        if self.is_done(name):
+            with self._lock:
+                self.skipped_done += 1
+            return False
+        
+        path = self._path(name)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if not self._break_expired(path):
+                    return False
+                continue
+            
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    "node": self.node_id,
+                    "pid": os.getpid(),
+                    "claimed": datetime.now().isoformat()
+                }, f)
+            with self._lock:
+                self.held.add(name)
+            return True
+        return False
+    
+    def release(self, name: str, done: bool = False):
+        """Give up a lease, marking the location done if it succeeded"""
+        if done:
+            self._done_path(name).write_text(
+                json.dumps({"run": self.run_id, "node": self.node_id}) + "\n")
+        with self._lock:
+            self.held.discard(name)
+        self._path(name).unlink(missing_ok=True)
+    
+    def renew(self):
+        """Touch all held leases"""
+        with self._lock:
+            held = list(self.held)
+        for name in held:
+            try:
+                os.utime(self._path(name))
+            except FileNotFoundError:
+                logger.warning(f"Lost lease for {name}")
+    
+    def claimed(self, locations: Iterable[Dict]) -> Iterator[Dict]:
+        """Yield only the locations this node manages to claim, lazily"""
+        for loc in locations:
+            if self.claim(loc.get("name", "Unknown")):
+                yield loc
+        if self.skipped_done:
+            logger.info(f"Skipped {self.skipped_done} locations already done in lease run "
+                        f"{self.run_id} (start a new run with --lease-run NAME or --force)")
+    
+    def start(self):
+        """Start the heartbeat thread"""
+        def heartbeat():
+            while not self._stop.wait(self.ttl / 3):
+                self.renew()
+        
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+    
+    def stop(self):
+        """Stop the heartbeat and release unfinished leases"""
+        self._stop.set()
+        with self._lock:
+            held = list(self.held)
+        for name in held:
+            self.release(name)
+
+
+def tour_order(locations: List[Dict], routes: Dict[str, Dict], done: Iterable[str] = (),
+               priority: Iterable[str] = ()) -> List[Dict]:
+    """
+    Order locations so that whole routes are finished as early as possible.
+    
+    Routes are taken greedily, the one with the fewest unprocessed stops
+    first (ties: the one whose stops are shared by the most routes), so
+    the first complete tour needs the least work; routes with stops that
+    cannot be done in this run (not selected, not processed) come last.
+    A route's already processed stops go along with it, as they are
+    cheap re-runs. Within a route, stops shared by more routes run first,
+    as they advance other tours too. Routes (by key or name) and
+    locations listed in priority come before all others, in the given
+    order. Locations on no route are processed last, in catalog order.
+    
+    Args:
+        locations: Locations to process, in catalog order
+        routes: The catalog's routes section
+        done: Names of locations already processed
+        priority: Route keys, route names or location names
+    """
+    by_name = {loc.get("name"): loc for loc in locations}
+    done = set(done)
+    shared = Counter(stop for route in routes.values() for stop in route.get("stops", []))
+    route_keys = {route.get("name", key): key for key, route in routes.items()}
+    ordered, queued = [], set()
+    
+    def left(key: str) -> List[str]:
+        return [stop for stop in routes[key].get("stops", [])
+                if stop in by_name and stop not in queued]
+    
+    def cost(key: str) -> List[str]:
+        return [stop for stop in left(key) if stop not in done]
+    
+    def take(names: List[str]):
+        for name in sorted(names, key=lambda n: -shared[n]):
+            if name not in queued:
+                queued.add(name)
+                ordered.append(by_name[name])
+    
+    for item in priority:
+        key = item if item in routes else route_keys.get(item)
+        if key is not None:
+            take(left(key))
+        elif item in by_name:
+            take([item])
+        else:
+            logger.warning(f"Priority entry is neither a route nor a selected location: {item}")
+    
+    blocked = {
+        key: any(stop not in by_name and stop not in done for stop in route.get("stops", []))
+        for key, route in routes.items()
+    }
+    position = {key: i for i, key in enumerate(routes)}
+    pending = [key for key in routes if left(key)]
+    while pending:
+        key = min(pending, key=lambda k: (blocked[k], len(cost(k)),
+                                          -sum(shared[s] for s in cost(k)), position[k]))
+        take(left(key))
+        pending = [k for k in pending if left(k)]
+    
+    ordered.extend(loc for loc in locations if loc.get("name") not in queued)
+    return ordered
+
+
+class RouteTracker:
+    """Detects routes whose last outstanding stop has just been processed"""
+    
+    def __init__(self, routes: Dict[str, Dict], done: Iterable[str] = ()):
+        self.routes = routes
+        self.stops = {key: set(route.get("stops", [])) for key, route in routes.items()}
+        self.done = set(done)
+        self.complete = {key for key, stops in self.stops.items() if stops and stops <= self.done}
+        self._lock = threading.Lock()
+    
+    def mark(self, name: str) -> List[str]:
+        """Record a processed location; returns the routes it completed"""
+        with self._lock:
+            self.done.add(name)
+            completed = [key for key, stops in self.stops.items()
+                         if key not in self.complete and name in stops and stops <= self.done]
+            self.complete.update(completed)
+        return completed
+
+
+class ProgressJournal:
+    """
+    Append-only JSONL log of batch events.
+    
+    Every record is one line, flushed and fsync'd when written, so a killed
+    run loses at most the record in flight; a torn last line is ignored
+    when reading. Readers stream the file one record at a time.
+    
+    Records:
+        {"event": "run_start", "time", "total_locations", "skipped"}
+        {"event": "location", "time", "location", "status", "result"|"error"}
+        {"event": "route_complete", "time", "route", "name", "stops", "elapsed"}
+        {"event": "run_end", "time", "interrupted"}
+    """
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = None
+        self._lock = threading.Lock()
+    
+    def append(self, event: str, **fields):
+        """Append and fsync one record"""
+        record = {"event": event, "time": datetime.now().isoformat(), **fields}
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'a')
+                # Terminate a torn last line so it doesn't swallow this record
+                if self._file.tell() > 0:
+                    with open(self.path, 'rb') as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            self._file.write("\n")
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+    
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def exists(self) -> bool:
+        return self.path.exists()
+    
+    def records(self) -> Iterator[Dict]:
+        """Stream records, skipping torn or corrupt lines"""
+        if not self.path.exists():
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+    
+    def last_run(self) -> Optional[BatchProgress]:
+        """Counters and errors of the most recent run"""
+        progress = None
+        for record in self.records():
+            event = record.get("event")
+            if event == "run_start":
+                progress = BatchProgress(
+                    total_locations=record.get("total_locations", 0),
+                    processed=record.get("skipped", 0),
+                    skipped=record.get("skipped", 0),
+                    start_time=record["time"]
+                )
+            elif progress is None:
+                continue
+            elif event == "location":
+                progress.processed += 1
+                if record.get("status") == "success":
+                    progress.successful += 1
+                else:
+                    progress.failed += 1
+                    progress.errors.append({
+                        "location": record.get("location"),
+                        "error": record.get("error") or "",
+                        "timestamp": record["time"]
+                    })
+            elif event == "route_complete":
+                progress.routes_completed.append({
+                    "route": record.get("route"),
+                    "name": record.get("name"),
+                    "elapsed": record.get("elapsed", 0.0)
+                })
+            elif event == "run_end":
+                progress.end_time = record["time"]
+        return progress
+    
+    def completed(self) -> set:
+        """Names of locations whose latest record is a success"""
+        done = set()
+        for record in self.records():
+            if record.get("event") != "location":
+                continue
+            if record.get("status") == "success":
+                done.add(record.get("location"))
+            else:
+                done.discard(record.get("location"))
+        return done
+    
+    def successes(self) -> Iterator[Dict]:
+        """Stream successful location records"""
+        for record in self.records():
+            if record.get("event") == "location" and record.get("status") == "success":
+                yield record
+    
+    def compact(self):
+        """
+        Rewrite the journal as the latest success per location from earlier
+        runs followed by the most recent run's records verbatim.
+        """
+        self.close()
+        if not self.path.exists():
+            return
+        
+        latest = {}
+        last_run_offset = 0
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = {}
+                if record.get("event") == "run_start":
+                    last_run_offset = offset
+                offset += len(line)
+            
+            f.seek(0)
+            while f.tell() < last_run_offset:
+                line = f.readline()
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("event") == "location":
+                    latest[record.get("location")] = line
+            
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp, 'wb') as out:
+                for line in latest.values():
+                    if json.loads(line).get("status") == "success":
+                        out.write(line)
+                f.seek(last_run_offset)
+                shutil.copyfileobj(f, out)
+                out.flush()
+                os.fsync(out.fileno())
+        
+        before = self.path.stat().st_size
+        os.replace(tmp, self.path)
+        logger.info(f"Compacted progress journal: {before // 1024} KB -> "
+                    f"{self.path.stat().st_size // 1024} KB")
+
+
 class BatchProcessor:
     """
     Batch processor for Big Island VR panoramas.
     
-    Processes all locations in the locations.json database,
-    tracking progress and handling errors gracefully.
+    Processes all locations in the location catalog (imported from
+    locations.json), tracking progress and handling errors gracefully.
     """
     
-    def __init__(self, output_base: Path, locations_file: Path = None):
+    def __init__(self, output_base: Path, locations_file: Path = None,
+                 pipeline_options: Dict[str, Any] = None,
+                 node_id: Optional[str] = None):
         self.output_base = Path(output_base)
         self.locations_file = locations_file or (self.output_base / "locations.json")
-        self.progress_file = self.output_base / "batch_progress.json"
+        self._catalog = None
+        self.progress_file = self.output_base / "batch_progress.json"  # Legacy
         self.log_file = self.output_base / "batch_log.txt"
+        self.nodes_dir = self.output_base / "nodes"
+        
+        # On a shared filesystem, each node keeps its own journal and log;
+        # merge_node_results() folds them into the shared catalog
+        self.node_id = node_id
+        progress_dir = self.output_base
+        if node_id:
+            progress_dir = self.nodes_dir / node_id
+            progress_dir.mkdir(parents=True, exist_ok=True)
+            self.log_file = progress_dir / "batch_log.txt"
+        self.journal = ProgressJournal(progress_dir / JOURNAL_NAME)
+        self.route_tracker: Optional[RouteTracker] = None  # Set during process_all()
+        self.panoramas: List[str] = []  # Panoramas of this run's successes
         
         # Initialize pipeline
         self.pipeline = FullPipeline(
             output_base=self.output_base,
-            skip_existing=True
+            skip_existing=True,
+            **(pipeline_options or {})
         )
         
         # Setup file logging
@@ -85,22 +668,23 @@ class BatchProcessor:
         file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
         logger.addHandler(file_handler)
     
-    def load_locations(self) -> Dict[str, Any]:
-        """Load locations database"""
-        if not self.locations_file.exists():
-            logger.error(f"Locations file not found: {self.locations_file}")
-            return {}
-        
-        with open(self.locations_file) as f:
-            return json.load(f)
+    @property
+    def catalog(self) -> LocationCatalog:
+        """Location catalog, imported from locations_file on first use"""
+        if self._catalog is None:
+            self._catalog = open_catalog(self.locations_file)
+        return self._catalog
     
-    def save_progress(self, progress: BatchProgress):
-        """Save progress to file for resume capability"""
-        with open(self.progress_file, 'w') as f:
-            json.dump(progress.to_dict(), f, indent=2)
+    def export_locations(self):
+        """Write locations.json from the catalog"""
+        self.catalog.export_json(self.locations_file)
+        logger.info(f"Exported catalog to {self.locations_file}")
     
     def load_progress(self) -> Optional[BatchProgress]:
-        """Load progress from previous run"""
+        """Load progress of the last run from the journal (or a legacy file)"""
+        if self.journal.exists():
+            return self.journal.last_run()
+        
         if not self.progress_file.exists():
             return None
         
@@ -112,6 +696,16 @@ class BatchProcessor:
             logger.warning(f"Could not load progress file: {e}")
             return None
     
+    def completed_locations(self) -> set:
+        """Names of locations that finished successfully in earlier runs"""
+        if self.journal.exists():
+            return self.journal.completed()
+        
+        progress = self.load_progress()
+        if progress:
+            return {r.get("location_name") for r in progress.results}
+        return set()
+    
     def get_processed_locations(self) -> set:
         """Get set of already-processed location IDs"""
         processed = set()
@@ -125,9 +719,113 @@ class BatchProcessor:
         
         return processed
     
+    def _outputs_missing(self, loc: Dict) -> bool:
+        """
+        Whether a location recorded as processed lost its outputs; it is
+        then processed again (cheaply, from its checkpointed stages).
+        """
+        missing = [path for path in (loc.get("panorama_path"), loc.get("depth_path"))
+                   if path and not Path(path).exists()]
+        if missing:
+            logger.info(f"Outputs of {loc.get('name')} are missing ({missing[0]}), "
+                        f"processing again")
+        return bool(missing)
+    
+    def processed_names(self) -> set:
+        """Locations processed before now: journaled successes and catalog state"""
+        return self.completed_locations() | {
+            loc.get("name") for loc in self.catalog.locations(processed=True)
+        }
+    
+    def _order_locations(self, locations: List[Dict], order: str,
+                         priority: Optional[List[str]], done: Iterable[str]) -> List[Dict]:
+        if order == "catalog":
+            return locations
+        return tour_order(locations, self.catalog.routes(), done, priority or ())
+    
+    def _record_route(self, progress: BatchProgress, key: str):
+        """Report and journal a route whose stops are now all processed"""
+        route = self.route_tracker.routes[key]
+        name = route.get("name", key)
+        elapsed = round((datetime.now() - datetime.fromisoformat(progress.start_time))
+                        .total_seconds(), 1)
+        progress.routes_completed.append({"route": key, "name": name, "elapsed": elapsed})
+        self.journal.append("route_complete", route=key, name=name,
+                            stops=len(route.get("stops", [])), elapsed=elapsed)
+        logger.info(f"✓ Route complete: {name} ({len(route.get('stops', []))} stops) "
+                    f"after {format_duration(elapsed)}")
+    
+    def _record_result(self, progress: BatchProgress, loc: Dict, result: PipelineResult,
+                       leases: Optional[LeaseManager] = None):
+        """Record one location's result and journal it"""
+        name = loc.get("name", "Unknown")
+        progress.processed += 1
+        if leases:
+            leases.release(name, done=result.success)
+        
+        if result.success:
+            progress.successful += 1
+            self.panoramas.append(result.panorama_path)
+            with tracer.span("record", cat="io", location=name):
+                self.journal.append("location", location=name, status="success",
+                                    result=asdict(result))
+                
+                # Nodes leave the shared catalog to merge_node_results()
+                if not self.node_id:
+                    self.catalog.mark_processed(name, result.panorama_path, result.depth_path)
+            
+            for key in self.route_tracker.mark(name) if self.route_tracker else ():
+                self._record_route(progress, key)
+        else:
+            self._record_failure(progress, name, result.error)
+            logger.error(f"Failed: {result.error}")
+    
+    def _record_failure(self, progress: BatchProgress, name: str, error: str):
+        progress.failed += 1
+        progress.errors.append({
+            "location": name,
+            "error": error,
+            "timestamp": datetime.now().isoformat()
+        })
+        self.journal.append("location", location=name, status="failed", error=error)
+    
+    def _select_locations(self, route_filter: Optional[str] = None,
+                          shard: Optional[Tuple[int, int]] = None) -> Optional[List[Dict]]:
+        """Catalog locations of a route and shard, or None if there are none to select"""
+        # Load locations
+        if self.catalog.is_empty():
+            logger.error(f"No locations in catalog (locations file: {self.locations_file})")
+            return None
+        
+        # Filter by route if specified
+        if route_filter:
+            routes = self.catalog.routes()
+            if route_filter not in routes:
+                logger.error(f"Route not found: {route_filter}")
+                logger.info(f"Available routes: {list(routes.keys())}")
+                return None
+            
+            locations = self.catalog.locations(route=route_filter)
+            logger.info(f"Processing route '{route_filter}': {len(locations)} locations")
+        else:
+            locations = self.catalog.locations()
+        
+        if shard:
+            index, count = shard
+            locations = [l for l in locations if shard_of(l.get("name", ""), count) == index]
+            logger.info(f"Shard {index}/{count}: {len(locations)} locations")
+        
+        return locations
+    
     def process_all(self, route_filter: str = None, 
                     resume: bool = False,
-                    force: bool = False) -> BatchProgress:
+                    force: bool = False,
+                    stage_workers: Optional[Dict[str, int]] = None,
+                    shard: Optional[Tuple[int, int]] = None,
+                    leases: Optional[LeaseManager] = None,
+                    order: str = "tours",
+                    priority: Optional[List[str]] = None,
+                    export_tiles: bool = False) -> BatchProgress:
         """
         Process all locations in the database.
         
@@ -135,35 +833,33 @@ class BatchProcessor:
             route_filter: Only process locations in this route
             resume: Resume from last interrupted run
             force: Reprocess even if already done
+            stage_workers: Run stages pipelined (PipelineScheduler) with
+                these worker counts instead of one location at a time
+            shard: (index, count) - only process this node's share
+            leases: Claim each location through a lease before processing
+            order: "tours" to finish whole routes as early as possible
+                (tour_order), or "catalog" for locations.json order
+            priority: Route keys/names or locations to process first (tours order)
+            export_tiles: Export each processed panorama as cubemap tiles
+                (export_tiles.py) into <output>/cubemaps once processing ends
+        
+        Each route is reported (and journaled) once its last stop is done.
+        Each success is committed to the catalog as it happens. With a
+        node_id, the catalog is left untouched; run merge_node_results()
+        once all nodes are done.
         
         Returns:
             BatchProgress with results
         """
-        # Load locations
-        data = self.load_locations()
-        if not data:
+        locations = self._select_locations(route_filter, shard)
+        if locations is None:
             return BatchProgress()
         
-        locations = data.get("locations", [])
-        routes = data.get("routes", {})
-        
-        # Filter by route if specified
-        if route_filter:
-            route_locations = routes.get(route_filter, [])
-            if not route_locations:
-                logger.error(f"Route not found: {route_filter}")
-                logger.info(f"Available routes: {list(routes.keys())}")
-                return BatchProgress()
-            
-            locations = [l for l in locations if l["name"] in route_locations]
-            logger.info(f"Processing route '{route_filter}': {len(locations)} locations")
-        
         # Load previous progress for resume
         already_processed = set()
         if resume:
-            prev_progress = self.load_progress()
-            if prev_progress:
-                already_processed = {r.get("location_name") for r in prev_progress.results}
+            already_processed = self.completed_locations()
+            if already_processed:
                 logger.info(f"Resuming: {len(already_processed)} locations already processed")
         
         # Check for existing processed files
@@ -182,82 +878,281 @@ class BatchProcessor:
         logger.info(f"BATCH PROCESSING: {len(locations)} LOCATIONS")
         logger.info("=" * 70)
         
+        pending = []
         for i, loc in enumerate(locations, 1):
             name = loc.get("name", "Unknown")
             
-            # Skip if already processed
-            if name in already_processed:
+            # Skip if already processed (and its outputs are still there)
+            if name in already_processed and not self._outputs_missing(loc):
                 logger.info(f"[{i}/{len(locations)}] Skipping (already processed): {name}")
                 progress.skipped += 1
                 progress.processed += 1
                 continue
-            
-            logger.info(f"\n[{i}/{len(locations)}] Processing: {name}")
-            
+            pending.append(loc)
+        
+        self.panoramas = []
+        # Locations about to be reprocessed do not count as done yet
+        done = self.processed_names() - {loc.get("name", "Unknown") for loc in pending}
+        pending = self._order_locations(pending, order, priority, done)
+        self.route_tracker = RouteTracker(self.catalog.routes(), done)
+        
+        self.journal.append("run_start", total_locations=len(locations),
+                            skipped=progress.skipped)
+        interrupted = False
+        
+        if leases:
+            leases.start()
+            pending = leases.claimed(pending)
+        
+        if stage_workers is not None:
+            scheduler = PipelineScheduler(self.pipeline, stage_workers)
             try:
-                result = self.pipeline.process_location(
-                    name=name,
-                    lat=loc.get("lat"),
-                    lng=loc.get("lng"),
-                    pano_id=loc.get("pano_id"),
-                    description=loc.get("description", "")
+                scheduler.run(
+                    pending,
+                    on_result=lambda loc, result: self._record_result(
+                        progress, loc, result, leases)
                 )
-                
-                progress.processed += 1
-                
-                if result.success:
-                    progress.successful += 1
-                    progress.results.append(asdict(result))
-                    
-                    # Update locations.json with paths
-                    loc["panorama_path"] = result.panorama_path
-                    loc["depth_path"] = result.depth_path
-                    loc["processed"] = True
-                    loc["processed_date"] = datetime.now().isoformat()
-                else:
-                    progress.failed += 1
-                    progress.errors.append({
-                        "location": name,
-                        "error": result.error,
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    logger.error(f"Failed: {result.error}")
-                
-                # Save progress after each location
-                self.save_progress(progress)
+            except KeyboardInterrupt:
+                logger.info("\n\nInterrupted by user. Progress saved.")
+                interrupted = True
+            pending = []
+        
+        for loc in pending:
+            name = loc.get("name", "Unknown")
+            logger.info(f"\n[{progress.processed + 1}/{len(locations)}] Processing: {name}")
+            
+            try:
+                with tracer.span("location", cat="batch", location=name):
+                    result = self.pipeline.process_location(
+                        name=name,
+                        lat=loc.get("lat"),
+                        lng=loc.get("lng"),
+                        pano_id=loc.get("pano_id"),
+                        description=loc.get("description", "")
+                    )
+                self._record_result(progress, loc, result, leases)
                 
             except KeyboardInterrupt:
                 logger.info("\n\nInterrupted by user. Progress saved.")
-                progress.end_time = datetime.now().isoformat()
-                self.save_progress(progress)
+                interrupted = True
                 break
                 
             except Exception as e:
                 logger.error(f"Unexpected error processing {name}: {e}")
-                progress.failed += 1
-                progress.errors.append({
-                    "location": name,
-                    "error": str(e),
-                    "timestamp": datetime.now().isoformat()
-                })
-                self.save_progress(progress)
+                self._record_failure(progress, name, str(e))
+                if leases:
+                    leases.release(name)
+        
+        if leases:
+            leases.stop()
+        
+        if export_tiles and self.panoramas and not interrupted:
+            export_all(self.panoramas, self.output_base / "cubemaps")
         
         # Finalize
         progress.end_time = datetime.now().isoformat()
-        self.save_progress(progress)
-        
-        # Update locations.json with results
-        data["locations"] = locations
-        data["last_batch_run"] = datetime.now().isoformat()
+        self.journal.append("run_end", interrupted=interrupted)
+        self.journal.close()
+        if self.journal.path.stat().st_size > JOURNAL_COMPACT_BYTES:
+            self.journal.compact()
         
-        with open(self.locations_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        if self.node_id:
+            logger.info(f"Node results saved to {self.journal.path}; "
+                        f"run with --merge once all nodes finish")
+        else:
+            self.catalog.set_section("last_batch_run", datetime.now().isoformat())
         
         # Print summary
         self._print_summary(progress)
+        self.pipeline.governor.log_summary()
         
         return progress
     
+    def merge_node_results(self) -> BatchProgress:
+        """
+        Merge every node's journal into the location catalog.
+        
+        All updates are applied in one catalog transaction, under a lock
+        file as well since SQLite locking is unreliable over NFS. The
+        merged counts (of each node's last run) are journaled in the
+        shared journal as a "merge" record.
+        """
+        merged = BatchProgress(start_time="", end_time="")
+        updates = {}
+        
+        for journal_path in sorted(self.nodes_dir.glob(f"*/{JOURNAL_NAME}")):
+            journal = ProgressJournal(journal_path)
+            progress = journal.last_run()
+            if progress is None:
+                continue
+            
+            logger.info(f"{journal_path.parent.name}: {progress.successful} successful, "
+                        f"{progress.failed} failed")
+            merged.total_locations += progress.total_locations
+            merged.processed += progress.processed
+            merged.successful += progress.successful
+            merged.failed += progress.failed
+            merged.skipped += progress.skipped
+            merged.errors.extend(progress.errors)
+            if progress.start_time and (not merged.start_time or progress.start_time < merged.start_time):
+                merged.start_time = progress.start_time
+            if progress.end_time > merged.end_time:
+                merged.end_time = progress.end_time
+            
+            for record in journal.successes():
+                updates[record["location"]] = (record["result"], record["time"])
+        
+        with exclusive_lock(self.catalog.path.with_name(self.catalog.path.name + ".lock")):
+            self.catalog.update_locations({
+                name: processed_fields(result["panorama_path"], result["depth_path"], finished)
+                for name, (result, finished) in updates.items()
+            })
+            self.catalog.set_section("last_batch_run", datetime.now().isoformat())
+        
+        self.journal.append(
+            "merge", nodes=len(list(self.nodes_dir.glob(f"*/{JOURNAL_NAME}"))),
+            locations=len(updates), successful=merged.successful, failed=merged.failed
+        )
+        self.journal.close()
+        
+        logger.info(f"Merged {len(updates)} locations into {self.catalog.path}")
+        self._print_summary(merged)
+        return merged
+    
+    def _journals(self) -> List[ProgressJournal]:
+        """The shared journal and every node's journal"""
+        paths = [self.output_base / JOURNAL_NAME, *sorted(self.nodes_dir.glob(f"*/{JOURNAL_NAME}"))]
+        return [ProgressJournal(path) for path in paths if path.exists()]
+    
+    def stage_history(self) -> Dict[str, List[float]]:
+        """
+        Recorded seconds per stage of the latest successes in all journals,
+        leaving out stages that were served from the artifact store.
+        """
+        history = defaultdict(lambda: deque(maxlen=PLAN_HISTORY))
+        for journal in self._journals():
+            for record in journal.successes():
+                metadata = (record.get("result") or {}).get("metadata") or {}
+                if "cached_stages" not in metadata and metadata.get("skipped"):
+                    continue  # Recorded before cached stages were; nothing ran
+                cached = set(metadata.get("cached_stages", ()))
+                for stage, seconds in (metadata.get("timings") or {}).items():
+                    if STAGE_ARTIFACTS.get(stage) not in cached:
+                        history[stage].append(seconds)
+        return {stage: list(seconds) for stage, seconds in history.items()}
+    
+    def output_sizes(self) -> Dict[str, List[int]]:
+        """Bytes written per stage by recent locations: tile sets and stored artifacts"""
+        sizes = defaultdict(list)
+        newest_first = lambda path: -path.stat().st_mtime
+        
+        tile_dirs = sorted((d for d in self.pipeline.tiles_dir.iterdir() if d.is_dir()),
+                           key=newest_first)
+        for tile_dir in tile_dirs[:PLAN_HISTORY]:
+            size = sum(tile.stat().st_size for tile in tile_dir.glob("*.jpg"))
+            if size:
+                sizes["download"].append(size)
+        
+        store = self.pipeline.store
+        stages = {artifact: stage for stage, artifact in STAGE_ARTIFACTS.items()}
+        for index in sorted(store.index_dir.glob("*.json"), key=newest_first)[:PLAN_HISTORY]:
+            for artifact, entry in (store.load_index(index.stem) or {}).items():
+                try:
+                    path = store.path(entry["key"], ARTIFACT_SUFFIXES[artifact])
+                    sizes[stages[artifact]].append(path.stat().st_size)
+                except (KeyError, OSError):
+                    continue  # Unknown stage, or no output (e.g. upscaling failed)
+        return sizes
+    
+    def plan(self, route_filter: str = None, resume: bool = False,
+             shard: Optional[Tuple[int, int]] = None, order: str = "tours",
+             priority: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Estimate what process_all() would do, without network access or
+        loading any model.
+        
+        Locations are listed in processing order. Stages to run come from
+        FullPipeline.plan_location(). Time per stage
+        is the median of recorded timings and disk per stage the mean size
+        of existing outputs, with defaults where there is no history. Links
+        in stitched/, upscaled/, depth/ and processed/ are not counted since
+        they are hardlinks into the artifact store.
+        
+        Returns:
+            Totals: locations, skipped, requests, seconds, bytes and runs per stage
+        """
+        locations = self._select_locations(route_filter, shard)
+        if locations is None:
+            return {}
+        done = self.completed_locations() if resume else set()
+        rerun = {loc.get("name", "Unknown") for loc in locations} - done
+        locations = self._order_locations(locations, order, priority,
+                                          self.processed_names() - rerun)
+        
+        history = self.stage_history()
+        seconds = {
+            stage: median(history[stage]) if history.get(stage) else DEFAULT_STAGE_SECONDS[stage]
+            for stage in STAGES
+        }
+        sizes = self.output_sizes()
+        stage_bytes = {
+            stage: sum(sizes[stage]) / len(sizes[stage]) if sizes.get(stage) else default
+            for stage, default in DEFAULT_STAGE_BYTES.items()
+        }
+        
+        totals = {"locations": len(locations), "skipped": 0, "requests": 0, "metadata_requests": 0,
+                  "seconds": 0.0, "bytes": 0.0, "runs": dict.fromkeys(STAGES, 0)}
+        
+        print("\n" + "=" * 100)
+        print(f"BATCH PLAN: {len(locations)} LOCATIONS (dry run)")
+        print("=" * 100)
+        print(f"{'Location':<32} {'Stages to run':<32} {'Requests':>8} {'Time':>10} {'Disk':>10}  Note")
+        
+        for loc in locations:
+            name = loc.get("name", "Unknown")
+            if name in done:
+                totals["skipped"] += 1
+                print(f"{name[:32]:<32} {'- (completed, resumed)':<32}")
+                continue
+            
+            plan = self.pipeline.plan_location(
+                name, lat=loc.get("lat"), lng=loc.get("lng"),
+                pano_id=loc.get("pano_id"), loc_id=processed_loc_id(loc)
+            )
+            loc_seconds = sum(seconds[stage] for stage in plan.run)
+            loc_bytes = sum(stage_bytes.get(stage, 0) for stage in plan.run)
+            
+            totals["requests"] += plan.requests
+            totals["metadata_requests"] += "prepare" in plan.run
+            totals["seconds"] += loc_seconds
+            totals["bytes"] += loc_bytes
+            for stage in plan.run:
+                totals["runs"][stage] += 1
+            
+            work = [STAGE_ARTIFACTS.get(stage, stage) for stage in plan.run
+                    if stage not in ("prepare", "finalize")]
+            print(f"{name[:32]:<32} {' '.join(work) or '- (cached)':<32} {plan.requests:>8} "
+                  f"{format_duration(loc_seconds):>10} {format_bytes(loc_bytes):>10}  {plan.note}")
+        
+        print("-" * 100)
+        print(f"  Street View requests: {totals['requests']} "
+              f"({totals['metadata_requests']} metadata, "
+              f"{totals['requests'] - totals['metadata_requests']} tiles)")
+        print(f"\n  {'Stage':<16} {'Runs':>6} {'Per run':>10} {'Total':>10}  Source")
+        for stage in STAGES:
+            runs = totals["runs"][stage]
+            source = (f"median of {len(history[stage])} recorded" if history.get(stage)
+                      else "default")
+            print(f"  {stage:<16} {runs:>6} {format_duration(seconds[stage]):>10} "
+                  f"{format_duration(runs * seconds[stage]):>10}  {source}")
+        print(f"\n  Estimated time:  {format_duration(totals['seconds'])} (one location at a time)")
+        print(f"  Disk to write:   {format_bytes(totals['bytes'])}")
+        if totals["skipped"]:
+            print(f"  Skipped:         {totals['skipped']} (completed in earlier runs)")
+        print("=" * 100)
+        
+        return totals
+    
     def _print_summary(self, progress: BatchProgress):
         """Print processing summary"""
         print("\n" + "=" * 70)
@@ -268,6 +1163,10 @@ class BatchProcessor:
         print(f"  Successful:      {progress.successful}")
         print(f"  Failed:          {progress.failed}")
         print(f"  Skipped:         {progress.skipped}")
+        if progress.routes_completed:
+            first = progress.routes_completed[0]
+            print(f"  Routes complete: {len(progress.routes_completed)} "
+                  f"(first: {first['name']} after {format_duration(first['elapsed'])})")
         
         if progress.start_time and progress.end_time:
             start = datetime.fromisoformat(progress.start_time)
@@ -286,39 +1185,41 @@ class BatchProcessor:
     
     def show_status(self):
         """Show current processing status"""
-        data = self.load_locations()
-        if not data:
+        if self.catalog.is_empty():
             print("No locations database found.")
             return
         
-        locations = data.get("locations", [])
-        routes = data.get("routes", {})
-        
-        processed = sum(1 for l in locations if l.get("processed"))
-        with_coverage = sum(1 for l in locations if l.get("pano_id"))
+        counts = self.catalog.counts()
+        routes = self.catalog.route_progress()
         
         print("\n" + "=" * 60)
         print("BIG ISLAND VR - PROCESSING STATUS")
         print("=" * 60)
-        print(f"\nTotal locations:    {len(locations)}")
-        print(f"With Street View:   {with_coverage}")
-        print(f"Processed:          {processed}")
-        print(f"Remaining:          {len(locations) - processed}")
+        print(f"\nTotal locations:    {counts['total']}")
+        print(f"With Street View:   {counts['with_pano']}")
+        print(f"Processed:          {counts['processed']}")
+        print(f"Remaining:          {counts['total'] - counts['processed']}")
         
         print(f"\nRoutes ({len(routes)}):")
-        for route_name, route_locs in routes.items():
-            route_processed = sum(
-                1 for name in route_locs 
-                if any(l.get("processed") and l["name"] == name for l in locations)
-            )
-            print(f"  {route_name}: {route_processed}/{len(route_locs)} processed")
+        for route in routes:
+            print(f"  {route['route']}: {route['processed']}/{route['total']} processed")
         
-        # Check for progress file
+        # Check for progress journal
         progress = self.load_progress()
         if progress:
             print(f"\nLast batch run: {progress.start_time}")
+            print(f"  Successful: {progress.successful}, failed: {progress.failed}, "
+                  f"skipped: {progress.skipped}")
             if progress.errors:
                 print(f"  Errors: {len(progress.errors)}")
+            for route in progress.routes_completed:
+                print(f"  Route complete: {route['name']} after {format_duration(route['elapsed'])}")
+        
+        for journal_path in sorted(self.nodes_dir.glob(f"*/{JOURNAL_NAME}")):
+            node_progress = ProgressJournal(journal_path).last_run()
+            if node_progress:
+                print(f"  Node {journal_path.parent.name}: {node_progress.successful} successful, "
+                      f"{node_progress.failed} failed (started {node_progress.start_time})")
         
         print("=" * 60)
 
@@ -341,6 +1242,40 @@ def main():
                         help="Output directory")
     parser.add_argument("--locations", "-l", type=str,
                         help="Locations JSON file")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="Process only shard I of N (multi-node)")
+    parser.add_argument("--lease", action="store_true",
+                        help="Claim locations via lease files in <output>/leases (multi-node)")
+    parser.add_argument("--lease-ttl", type=float, default=LEASE_TTL,
+                        help=f"Seconds before a crashed node's lease is reclaimed (default: {LEASE_TTL})")
+    parser.add_argument("--lease-run", type=str, metavar="NAME",
+                        help="Start or join this lease run, same name on every node; locations "
+                             "done in it are not claimed again (default: join the recorded run; "
+                             "--force starts a new one, so name the run to restart several nodes)")
+    parser.add_argument("--node-id", type=str,
+                        help="Node name for per-node results (default: hostname)")
+    parser.add_argument("--merge", action="store_true",
+                        help="Merge per-node results into locations.json")
+    parser.add_argument("--order", choices=ORDERS, default="tours",
+                        help="tours: finish whole routes as early as possible; "
+                             "catalog: locations.json order (default: tours)")
+    parser.add_argument("--priority", type=lambda s: [p.strip() for p in s.split(",") if p.strip()],
+                        metavar="ROUTE,...",
+                        help="Routes (key or name) or locations to process first, in order")
+    parser.add_argument("--export-tiles", action="store_true",
+                        help="Export processed panoramas as cubemap tile pyramids "
+                             "into <output>/cubemaps")
+    parser.add_argument("--plan", action="store_true",
+                        help="Estimate requests, time and disk for the selected locations "
+                             "without processing them")
+    parser.add_argument("--compact", action="store_true",
+                        help="Compact the progress journal and exit")
+    parser.add_argument("--export-json", action="store_true",
+                        help="Write locations.json from the catalog (after processing, if any)")
+    add_depth_arguments(parser)
+    add_stage_arguments(parser)
+    add_memory_arguments(parser)
+    add_trace_arguments(parser)
     parser.add_argument("--verbose", "-v", action="store_true",
                         help="Verbose output")
     
@@ -348,6 +1283,7 @@ def main():
     
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
+    start_tracing(args)
     
     # Determine paths
     if args.output:
@@ -360,10 +1296,21 @@ def main():
     else:
         locations_file = output_base / "locations.json"
     
+    node_id = None
+    if args.shard or args.lease:
+        node_id = args.node_id or socket.gethostname()
+    
     # Initialize processor
     processor = BatchProcessor(
         output_base=output_base,
-        locations_file=locations_file
+        locations_file=locations_file,
+        pipeline_options={
+            "depth_model_id": DEPTH_MODELS[args.depth_model],
+            "depth_latency_budget": args.depth_budget,
+            "depth_backend": args.depth_backend,
+            "memory_budget_mb": args.memory_budget,
+        },
+        node_id=node_id
     )
     
     # Show status
@@ -371,12 +1318,43 @@ def main():
         processor.show_status()
         return 0
     
+    if args.merge:
+        processor.merge_node_results()
+        if args.export_json:
+            processor.export_locations()
+        return 0
+    
+    if args.compact:
+        processor.journal.compact()
+        return 0
+    
+    if args.plan:
+        processor.plan(route_filter=args.route, resume=args.resume, shard=args.shard,
+                       order=args.order, priority=args.priority)
+        return 0
+    
+    leases = None
+    if args.lease:
+        leases = LeaseManager(output_base / "leases", node_id, ttl=args.lease_ttl,
+                              run_id=args.lease_run, new_run=args.force and not args.lease_run)
+    
     # Process
-    progress = processor.process_all(
-        route_filter=args.route,
-        resume=args.resume,
-        force=args.force
-    )
+    with tracer.span("batch", cat="batch", node=node_id):
+        progress = processor.process_all(
+            route_filter=args.route,
+            resume=args.resume,
+            force=args.force,
+            stage_workers=stage_workers_from_args(args) if args.pipelined else None,
+            shard=args.shard,
+            leases=leases,
+            order=args.order,
+            priority=args.priority,
+            export_tiles=args.export_tiles
+        )
+    export_traces(args)
+    
+    if args.export_json and not node_id:
+        processor.export_locations()
     
     # Exit code based on success
     if progress.failed > 0:
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for Big Island VR
+
+Times the pipeline's CPU hot paths on synthetic equirectangular panoramas,
+depth maps and Street View tile sets at 2K/4K/8K, so performance changes
+are measured rather than guessed. No network, models or real panoramas
+are needed.
+
+Results are written as JSON and compared against a saved baseline; a
+benchmark whose median time grows by more than the threshold is reported
+as a regression (exit code 1).
+
+Usage:
+    python benchmark.py                          # All benchmarks at 2K/4K/8K
+    python benchmark.py --sizes 2k,4k --only mask
+    python benchmark.py --save-baseline          # Record the current timings as baseline
+    python benchmark.py --threshold 0.05         # Fail on >5% slowdowns
+    python benchmark.py --list
+"""
+
+import re
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import statistics
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+import cv2
+
+from depth_estimation import normalize_depth
+from full_pipeline import (
+    DEFAULT_TILE_SIZE, TILE_HEADINGS, TILE_PITCHES, stitch_equirectangular
+)
+from generate_transitions import (
+    create_transition_mask, depth_warp, generate_transition_frames,
+    imwrite_params, morph_transition
+)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+SIZES = {"2k": 2048, "4k": 4096, "8k": 8192}  # Panorama widths (2:1)
+DEFAULT_REPEATS = 3
+DEFAULT_FRAMES = 5  # Frames per generate_transition_frames call
+REGRESSION_THRESHOLD = 0.10  # Allowed median slowdown vs baseline
+RESULTS_VERSION = 1
+
+BENCHMARK_DIR = Path(__file__).parent.parent / "benchmarks"
+RESULTS_FILE = BENCHMARK_DIR / "latest.json"
+BASELINE_FILE = BENCHMARK_DIR / "baseline.json"
+
+logging.getLogger("full_pipeline").setLevel(logging.WARNING)
+
+
+# ============================================================================
+# Synthetic inputs
+# ============================================================================
+
+@dataclass
+class SyntheticInputs:
+    """Deterministic test data for one panorama size"""
+    width: int
+    img1: np.ndarray  # RGB uint8 (H, W, 3)
+    img2: np.ndarray
+    depth1: np.ndarray  # uint8 (H, W), 255 = near
+    depth2: np.ndarray
+    raw_depth: np.ndarray  # float32 model-style prediction
+    tiles_dir: Path
+    work_dir: Path
+    
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.img1.shape[:2]
+
+
+def synthetic_panorama(width: int, seed: int = 0) -> np.ndarray:
+    """
+    Equirectangular test image with sky, horizon and ground bands,
+    smooth structure and fine noise, so encoders and optical flow see
+    content resembling a real panorama rather than flat colour.
+    """
+    height = width // 2
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 2 * np.pi, width, dtype=np.float32)[None, :]
+    
+    structure = (
+        np.sin(x * 7 + seed) * np.cos(y * 11) * 40
+        + np.sin(x * 31 + y * 17) * 15
+    )
+    base = np.where(y < 0.45, 200 - y * 120, 90 + (y - 0.45) * 60)
+    image = np.empty((height, width, 3), dtype=np.float32)
+    for c, tint in enumerate((0.8, 0.9, 1.1)):
+        image[..., c] = base * tint + structure
+    image += rng.normal(0, 6, image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def synthetic_depth(width: int, seed: int = 0) -> np.ndarray:
+    """Depth map: far sky, ground approaching the camera, a few near blobs"""
+    height = width // 2
+    rng = np.random.default_rng(seed + 1000)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    
+    depth = np.where(y < 0.45, 10.0, 40 + (y - 0.45) * 380).astype(np.float32)
+    depth = np.broadcast_to(depth, (height, width)).copy()
+    for _ in range(6):
+        cx, cy, r = rng.uniform(0, 1), rng.uniform(0.4, 0.8), rng.uniform(0.03, 0.08)
+        blob = np.exp(-(((x - cx) * 2) ** 2 + (y - cy) ** 2) / (2 * r * r))
+        depth += blob * 150
+    return np.clip(depth, 0, 255).astype(np.uint8)
+
+
+def synthetic_tiles(out_dir: Path, seed: int = 0,
+                    tile_size: int = DEFAULT_TILE_SIZE) -> List[Path]:
+    """Street View style tile set (tile_h{heading}_p{pitch}.jpg)"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    source = synthetic_panorama(tile_size * 2, seed)
+    tiles = []
+    for i, heading in enumerate(TILE_HEADINGS):
+        for pitch in TILE_PITCHES:
+            # Any tile_size x tile_size window will do; offsets vary content
+            x0 = (i * tile_size // 3) % tile_size
+            tile = source[:, x0:x0 + tile_size]
+            path = out_dir / f"tile_h{heading:03d}_p{pitch:+03d}.jpg"
+            Image.fromarray(tile).save(path, quality=90)
+            tiles.append(path)
+    return tiles
+
+
+def make_inputs(width: int, work_dir: Path) -> SyntheticInputs:
+    work_dir.mkdir(parents=True, exist_ok=True)
+    synthetic_tiles(work_dir / "tiles")
+    depth1 = synthetic_depth(width, 0)
+    return SyntheticInputs(
+        width=width,
+        img1=synthetic_panorama(width, 0),
+        img2=synthetic_panorama(width, 1),
+        depth1=depth1,
+        depth2=synthetic_depth(width, 1),
+        raw_depth=depth1.astype(np.float32) * 0.37 + 2.5,
+        tiles_dir=work_dir / "tiles",
+        work_dir=work_dir
+    )
+
+
+# ============================================================================
+# Benchmarks
+# ============================================================================
+
+def benchmark_cases(frames: int = DEFAULT_FRAMES) -> Dict[str, Callable[[SyntheticInputs], Any]]:
+    """Benchmark name -> function of the synthetic inputs"""
+    cases = {
+        "stitch_equirectangular": lambda s: stitch_equirectangular(
+            s.tiles_dir, s.work_dir / "stitched.jpg", s.width),
+        "depth_warp": lambda s: depth_warp(s.img1, s.depth1, 0.5),
+    }
+    
+    for style in ("fade", "wipe", "radial"):
+        cases[f"mask_{style}"] = lambda s, style=style: create_transition_mask(s.shape, 0.5, style)
+    
+    for mode in ("depth_warp", "crossfade", "morph"):
+        cases[f"frames_{mode}"] = lambda s, mode=mode: generate_transition_frames(
+            s.img1, s.img2, s.depth1, s.depth2, num_frames=frames, mode=mode)
+    
+    cases.update({
+        "morph_transition": lambda s: morph_transition(s.img1, s.img2, 0.5),
+        "normalize_depth": lambda s: normalize_depth(s.raw_depth),
+        # Stitched panorama save (full_pipeline.stitch_equirectangular)
+        "save_jpeg_pil": lambda s: Image.fromarray(s.img1).save(
+            s.work_dir / "pil.jpg", quality=95, optimize=True),
+        # Depth map save (DepthEstimator.estimate)
+        "save_png_pil": lambda s: Image.fromarray(s.depth1, mode='L').save(
+            s.work_dir / "pil.png", optimize=True),
+        # Upscaler output and transition frame sequences
+        "imwrite_jpg": lambda s: cv2.imwrite(
+            str(s.work_dir / "cv.jpg"), s.img1, imwrite_params("jpg")),
+        "imwrite_png": lambda s: cv2.imwrite(
+            str(s.work_dir / "cv.png"), s.img1, imwrite_params("png")),
+        "imwrite_webp": lambda s: cv2.imwrite(
+            str(s.work_dir / "cv.webp"), s.img1, imwrite_params("webp")),
+    })
+    return cases
+
+
+def time_case(fn: Callable[[SyntheticInputs], Any], inputs: SyntheticInputs,
+              repeats: int = DEFAULT_REPEATS) -> Dict[str, float]:
+    """Run once to warm up, then time `repeats` runs"""
+    fn(inputs)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(inputs)
+        timings.append(time.perf_counter() - start)
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "mean": statistics.mean(timings),
+        "repeats": repeats,
+    }
+
+
+def machine_info() -> Dict[str, Any]:
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cv2_threads": cv2.getNumThreads(),
+    }
+
+
+def run_benchmarks(sizes: List[str], only: Optional[str] = None,
+                   repeats: int = DEFAULT_REPEATS,
+                   frames: int = DEFAULT_FRAMES) -> Dict[str, Any]:
+    """
+    Run the selected benchmarks at each size.
+    
+    Returns:
+        Results dict; results["results"] maps "<name>@<size>" to timings
+    """
+    cases = benchmark_cases(frames)
+    if only:
+        cases = {name: fn for name, fn in cases.items() if re.search(only, name)}
+    
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bivr-bench-") as tmp:
+        for size in sizes:
+            width = SIZES[size]
+            print(f"\n{size.upper()} ({width}x{width // 2})")
+            inputs = make_inputs(width, Path(tmp) / size)
+            
+            for name, fn in cases.items():
+                key = f"{name}@{size}"
+                try:
+                    results[key] = time_case(fn, inputs, repeats)
+                except Exception as e:
+                    print(f"  {name:<24} Error: {e}")
+                    continue
+                print(f"  {name:<24} {results[key]['median'] * 1000:>10.1f} ms")
+            
+            del inputs
+    
+    return {
+        "version": RESULTS_VERSION,
+        "created": datetime.now().isoformat(),
+        "machine": machine_info(),
+        "settings": {"repeats": repeats, "frames": frames},
+        "results": results,
+    }
+
+
+# ============================================================================
+# Baseline comparison
+# ============================================================================
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any],
+            threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Compare median timings against a baseline.
+    
+    Returns:
+        One row per current benchmark with status "regression", "improved",
+        "ok" or "new" (not in the baseline)
+    """
+    rows = []
+    base_results = baseline.get("results", {})
+    for key, timing in current["results"].items():
+        row = {"benchmark": key, "median": timing["median"]}
+        base = base_results.get(key)
+        if base is None:
+            row["status"] = "new"
+        else:
+            ratio = timing["median"] / base["median"] if base["median"] else float("inf")
+            row.update(baseline=base["median"], ratio=ratio)
+            if ratio > 1 + threshold:
+                row["status"] = "regression"
+            elif ratio < 1 - threshold:
+                row["status"] = "improved"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], threshold: float):
+    print(f"\nBaseline comparison (threshold {threshold:.0%})")
+    print(f"  {'Benchmark':<32} {'Baseline ms':>12} {'Now ms':>10} {'Change':>8}")
+    for row in rows:
+        now = row["median"] * 1000
+        if row["status"] == "new":
+            print(f"  {row['benchmark']:<32} {'-':>12} {now:>10.1f} {'new':>8}")
+            continue
+        change = f"{(row['ratio'] - 1):+.0%}"
+        flag = {"regression": "  REGRESSION", "improved": "  improved"}.get(row["status"], "")
+        print(f"  {row['benchmark']:<32} {row['baseline'] * 1000:>12.1f} "
+              f"{now:>10.1f} {change:>8}{flag}")
+
+
+def load_results(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results: Dict[str, Any], path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark Big Island VR hot paths on synthetic panoramas"
+    )
+    parser.add_argument("--sizes", type=str, default=",".join(SIZES),
+                        help=f"Comma-separated sizes from {', '.join(SIZES)} (default: all)")
+    parser.add_argument("--only", type=str,
+                        help="Only benchmarks whose name matches this regex")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help=f"Timed runs per benchmark (default: {DEFAULT_REPEATS})")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES,
+                        help=f"Frames per transition benchmark (default: {DEFAULT_FRAMES})")
+    parser.add_argument("--output", type=str, default=str(RESULTS_FILE),
+                        help="Results JSON (default: benchmarks/latest.json)")
+    parser.add_argument("--baseline", type=str, default=str(BASELINE_FILE),
+                        help="Baseline JSON to compare against (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Also write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help=f"Median slowdown counted as a regression (default: {REGRESSION_THRESHOLD})")
+    parser.add_argument("--list", action="store_true", help="List benchmarks and exit")
+    
+    args = parser.parse_args()
+    
+    if args.list:
+        for name in benchmark_cases():
+            print(name)
+        return 0
+    
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        print(f"Unknown sizes: {', '.join(unknown)} (choose from {', '.join(SIZES)})")
+        return 1
+    
+    results = run_benchmarks(sizes, args.only, args.repeats, args.frames)
+    save_results(results, Path(args.output))
+    
+    baseline_path = Path(args.baseline)
+    baseline = load_results(baseline_path)
+    regressions = []
+    if baseline is not None:
+        if baseline.get("machine") != results["machine"]:
+            print("\nWarning: baseline was recorded on a different machine or library versions")
+        rows = compare(results, baseline, args.threshold)
+        print_comparison(rows, args.threshold)
+        regressions = [row for row in rows if row["status"] == "regression"]
+    elif not args.save_baseline:
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to record one")
+    
+    if args.save_baseline:
+        save_results(results, baseline_path)
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,6 +6,9 @@ Depth maps enable parallax effects during transitions and 6DoF viewing.
 
 Usage:
     python depth_estimation.py [input_dir] [output_dir]
+    python depth_estimation.py --model base
+    python depth_estimation.py --latency-budget 20      # Pick model by benchmark
+    python depth_estimation.py --backend onnx           # ONNX Runtime on CPU
     
 Output:
     - Grayscale depth maps saved alongside panoramas
@@ -15,8 +18,11 @@ Output:
 import os
 import sys
 import json
+import time
+import platform
 from pathlib import Path
-from typing import Optional, Tuple
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
 import numpy as np
 from PIL import Image
 
@@ -30,10 +36,21 @@ except ImportError:
     HAS_RICH = False
     console = None
 
-# Depth Anything v2 model
-MODEL_ID = "depth-anything/Depth-Anything-V2-Small-hf"  # Options: Small, Base, Large
+# Depth Anything v2 models, ordered smallest to largest
+DEPTH_MODELS = {
+    "small": "depth-anything/Depth-Anything-V2-Small-hf",
+    "base": "depth-anything/Depth-Anything-V2-Base-hf",
+    "large": "depth-anything/Depth-Anything-V2-Large-hf",
+}
+MODEL_ID = DEPTH_MODELS["small"]  # Default when no latency budget is given
 DEVICE = None  # Auto-detect
 
+# Calibration timings and ONNX exports are cached per machine
+CACHE_DIR = Path(__file__).parent.parent / "panoramas" / "models"
+CALIBRATION_FILE = CACHE_DIR / "depth_calibration.json"
+CALIBRATION_RUNS = 2
+ONNX_INPUT_SIZE = (518, 1036)  # (height, width) the processor emits for 2:1 panoramas
+
 
 def get_device():
     """Get the best available device for inference"""
@@ -54,22 +71,211 @@ def get_device():
     return DEVICE
 
 
-def load_model():
-    """Load Depth Anything v2 model"""
+def load_model(model_id: str = MODEL_ID, backend: str = "torch"):
+    """
+    Load a Depth Anything v2 model.
+    
+    Args:
+        model_id: HuggingFace model ID (see DEPTH_MODELS)
+        backend: "torch" for eager transformers, "onnx" for ONNX Runtime on CPU
+    
+    Returns:
+        (processor, model) - model is callable as model(pixel_values=...)
+    """
     from transformers import AutoImageProcessor, AutoModelForDepthEstimation
-    import torch
     
-    device = get_device()
+    print(f"Loading model: {model_id} ({backend})")
+    processor = AutoImageProcessor.from_pretrained(model_id)
     
-    print(f"Loading model: {MODEL_ID}")
-    processor = AutoImageProcessor.from_pretrained(MODEL_ID)
-    model = AutoModelForDepthEstimation.from_pretrained(MODEL_ID)
+    if backend == "onnx":
+        return processor, OnnxDepthModel(export_onnx(model_id))
+    
+    device = get_device()
+    model = AutoModelForDepthEstimation.from_pretrained(model_id)
     model = model.to(device)
     model.eval()
     
     return processor, model
 
 
+class OnnxDepthModel:
+    """ONNX Runtime session with the same call signature as the transformers model"""
+    
+    def __init__(self, onnx_path: Path):
+        import onnxruntime as ort
+        
+        self.session = ort.InferenceSession(
+            str(onnx_path),
+            providers=["CPUExecutionProvider"]
+        )
+    
+    def __call__(self, pixel_values, **kwargs):
+        import torch
+        
+        (predicted_depth,) = self.session.run(
+            ["predicted_depth"],
+            {"pixel_values": pixel_values.cpu().numpy()}
+        )
+        return SimpleNamespace(predicted_depth=torch.from_numpy(predicted_depth))
+
+
+def export_onnx(model_id: str, cache_dir: Path = CACHE_DIR) -> Path:
+    """
+    Export a Depth Anything v2 model to ONNX, reusing a cached export if present.
+    
+    Returns:
+        Path to the .onnx file
+    """
+    onnx_path = cache_dir / f"{model_id.split('/')[-1]}.onnx"
+    if onnx_path.exists():
+        return onnx_path
+    
+    import torch
+    from transformers import AutoModelForDepthEstimation
+    
+    class DepthOnly(torch.nn.Module):
+        """Unwraps the model output so the graph has a single tensor output"""
+        
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+        
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).predicted_depth
+    
+    print(f"Exporting {model_id} to ONNX: {onnx_path}")
+    model = AutoModelForDepthEstimation.from_pretrained(model_id).eval()
+    dummy = torch.randn(1, 3, *ONNX_INPUT_SIZE)
+    
+    # Export to a temp file so an interrupted export is never picked up as cached
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = onnx_path.with_suffix(".onnx.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            DepthOnly(model),
+            (dummy,),
+            str(tmp_path),
+            input_names=["pixel_values"],
+            output_names=["predicted_depth"],
+            dynamic_axes={
+                "pixel_values": {0: "batch", 2: "height", 3: "width"},
+                "predicted_depth": {0: "batch", 1: "height", 2: "width"},
+            },
+            opset_version=17
+        )
+    tmp_path.replace(onnx_path)
+    
+    return onnx_path
+
+
+def load_calibration(path: Path = CALIBRATION_FILE) -> Dict[str, Dict[str, float]]:
+    """Load cached calibration timings (seconds per image)"""
+    if not path.exists():
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_calibration(calibration: Dict[str, Dict[str, float]], 
+                     path: Path = CALIBRATION_FILE):
+    """Save calibration timings"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    tmp_path.replace(path)
+
+
+def calibration_key(image_size: Tuple[int, int], backend: str) -> str:
+    """Calibration entries are specific to host, device, backend and image size"""
+    device = "cpu" if backend == "onnx" else get_device()
+    return f"{platform.node()}/{device}/{backend}/{image_size[0]}x{image_size[1]}"
+
+
+def benchmark_model(
+    image: Image.Image,
+    model_id: str,
+    backend: str = "torch",
+    runs: int = CALIBRATION_RUNS
+) -> float:
+    """
+    Time depth estimation for one image with the given model.
+    
+    Returns:
+        Mean seconds per image (after one warm-up run)
+    """
+    processor, model = load_model(model_id, backend)
+    
+    estimate_depth(image, processor, model)  # Warm-up
+    
+    start = time.perf_counter()
+    for _ in range(runs):
+        estimate_depth(image, processor, model)
+    
+    return (time.perf_counter() - start) / runs
+
+
+def select_model(
+    latency_budget: float,
+    sample_image: Image.Image,
+    backend: str = "torch",
+    calibration_file: Path = CALIBRATION_FILE,
+    recalibrate: bool = False
+) -> str:
+    """
+    Pick the largest model whose measured latency fits the budget.
+    
+    Models are benchmarked smallest-first on this machine and the timings
+    cached, so later runs select instantly. Larger models are not measured
+    once one model exceeds the budget.
+    
+    Args:
+        latency_budget: Seconds allowed per image
+        sample_image: Representative panorama (timing depends on its size)
+        backend: "torch" or "onnx"
+        calibration_file: Timing cache
+        recalibrate: Ignore cached timings for this machine
+    
+    Returns:
+        model_id: HuggingFace model ID
+    """
+    calibration = load_calibration(calibration_file)
+    key = calibration_key(sample_image.size, backend)
+    timings = {} if recalibrate else calibration.get(key, {})
+    
+    chosen = None
+    for name, model_id in DEPTH_MODELS.items():
+        if name not in timings:
+            print(f"Calibrating {name} model on {key}...")
+            timings[name] = benchmark_model(sample_image, model_id, backend)
+            calibration[key] = timings
+            save_calibration(calibration, calibration_file)
+        
+        print(f"  {name}: {timings[name]:.2f}s per image")
+        if timings[name] > latency_budget:
+            break
+        chosen = name
+    
+    if chosen is None:
+        chosen = "small"
+        print(f"  No model fits {latency_budget:.2f}s budget, using {chosen}")
+    else:
+        print(f"  Selected {chosen} for {latency_budget:.2f}s budget")
+    
+    return DEPTH_MODELS[chosen]
+
+
+def normalize_depth(depth: np.ndarray) -> np.ndarray:
+    """Scale a raw depth prediction to uint8 0-255 over its own min/max"""
+    depth_min = depth.min()
+    depth_max = depth.max()
+    depth_normalized = (depth - depth_min) / (depth_max - depth_min + 1e-8)
+    return (depth_normalized * 255).astype(np.uint8)
+
+
 def estimate_depth(
     image: Image.Image,
     processor,
@@ -113,14 +319,7 @@ def estimate_depth(
     ).squeeze()
     
     # Convert to numpy and normalize to 0-255
-    depth_np = prediction.cpu().numpy()
-    
-    # Normalize: invert so near objects are dark, far objects are bright
-    # This matches typical depth map conventions
-    depth_min = depth_np.min()
-    depth_max = depth_np.max()
-    depth_normalized = (depth_np - depth_min) / (depth_max - depth_min + 1e-8)
-    depth_normalized = (depth_normalized * 255).astype(np.uint8)
+    depth_normalized = normalize_depth(prediction.cpu().numpy())
     
     # Resize if needed
     if output_size and output_size != original_size:
@@ -270,8 +469,48 @@ def generate_depth_json(depth_dir: Path, panoramas_dir: Path, output_path: Path)
     print(f"  {len(mappings)} panoramas with depth maps")
 
 
+def find_sample_image(input_dir: Path) -> Optional[Path]:
+    """Find a representative panorama for calibration"""
+    image_extensions = {'.jpg', '.jpeg', '.png', '.webp'}
+    for f in sorted(input_dir.rglob("*")):
+        if f.is_file() and f.suffix.lower() in image_extensions:
+            return f
+    return None
+
+
 def main():
     """Main entry point"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="Generate depth maps with Depth Anything v2"
+    )
+    parser.add_argument("input_dir", nargs="?", help="Directory of panoramas")
+    parser.add_argument("output_dir", nargs="?", help="Output directory for depth maps")
+    parser.add_argument(
+        "--model",
+        choices=list(DEPTH_MODELS),
+        default="small",
+        help="Model size (default: small; ignored with --latency-budget)"
+    )
+    parser.add_argument(
+        "--latency-budget",
+        type=float,
+        help="Seconds per image; picks the largest model that fits on this machine"
+    )
+    parser.add_argument(
+        "--recalibrate",
+        action="store_true",
+        help="Re-run the model benchmark instead of using cached timings"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["torch", "onnx"],
+        default="torch",
+        help="Inference backend (onnx exports and caches the model for CPU)"
+    )
+    
+    args = parser.parse_args()
     
     print("=" * 60)
     print("BIG ISLAND VR - DEPTH ESTIMATION")
@@ -283,9 +522,8 @@ def main():
     default_input = project_root / "panoramas" / "stitched"
     default_output = project_root / "panoramas" / "depth"
     
-    # Parse args
-    input_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else default_input
-    output_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else default_output
+    input_dir = Path(args.input_dir) if args.input_dir else default_input
+    output_dir = Path(args.output_dir) if args.output_dir else default_output
     
     # Check input
     if not input_dir.exists():
@@ -299,11 +537,22 @@ def main():
     # Load model
     print("\n" + "-" * 40)
     try:
-        processor, model = load_model()
+        model_id = DEPTH_MODELS[args.model]
+        if args.latency_budget is not None:
+            sample_path = find_sample_image(input_dir)
+            if sample_path:
+                sample = Image.open(sample_path).convert("RGB")
+                model_id = select_model(
+                    args.latency_budget, sample,
+                    backend=args.backend,
+                    recalibrate=args.recalibrate
+                )
+        processor, model = load_model(model_id, args.backend)
     except Exception as e:
         print(f"\nFailed to load model: {e}")
         print("\nInstall requirements:")
         print("  pip install torch torchvision transformers")
+        print("  pip install onnx onnxruntime  # for --backend onnx")
         return 1
     
     print("-" * 40)
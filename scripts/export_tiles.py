@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Cubemap Tile Export for Big Island VR
+
+Converts processed equirectangular panoramas into six cube faces, each cut
+into a pyramid of fixed-size tiles, so the viewer can stream only the
+visible tiles at the resolution it needs instead of downloading the whole
+panorama first.
+
+Layout per location (<output>/<loc_id>/):
+    tiles.json                      Descriptor: faces, levels, URL pattern
+    <level>/<face>/<row>_<col>.jpg  Tiles
+
+Level 0 is a single tile per face; each further level doubles the face
+size, up to full resolution (a quarter of the panorama width, matching its
+pixel density at the horizon). Faces f, r, b, l look at headings 0°, 90°,
+180° and 270° (heading 0 is the panorama's left edge, as in
+stitch_equirectangular); u and d look straight up and down, with their top
+and bottom edges respectively adjoining b.
+
+Faces and levels are rendered in parallel on a thread pool (cv2 releases
+the GIL while remapping, resizing and encoding). Each location is written
+to a partial directory and renamed into place, so a descriptor always
+describes a complete export; unchanged panoramas are skipped.
+
+Usage:
+    python export_tiles.py                          # ../panoramas/processed -> ../panoramas/cubemaps
+    python export_tiles.py processed/ cubemaps/ --workers 8
+    python export_tiles.py --tile-size 256 --force
+    python batch_process.py --export-tiles          # Export each location processed
+"""
+
+import os
+import sys
+import json
+import math
+import shutil
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+import numpy as np
+import cv2
+
+from full_pipeline import file_digest
+from generate_transitions import Viewport, imwrite_params, perspective_maps
+from tracing import tracer, add_trace_arguments, start_tracing, export_traces
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+TILE_SIZE = 512
+TILE_QUALITY = 85  # JPEG quality of tiles
+EXPORT_WORKERS = os.cpu_count() or 1
+EXPORT_VERSION = 1  # Bump when the tiles change for an identical panorama
+DESCRIPTOR_NAME = "tiles.json"
+PANORAMA_SUFFIX = "_panorama.jpg"
+TILE_URL = "{level}/{face}/{row}_{col}.jpg"
+
+# Face -> (heading, pitch) of its center, degrees
+FACES = {
+    "f": (0, 0),
+    "r": (90, 0),
+    "b": (180, 0),
+    "l": (270, 0),
+    "u": (0, 90),
+    "d": (0, -90),
+}
+
+
+def face_size(pano_width: int) -> int:
+    """Full-resolution face edge: 90° at the panorama's horizontal density"""
+    return max(1, pano_width // 4)
+
+
+def level_sizes(size: int, tile_size: int = TILE_SIZE) -> list:
+    """Face edge per level, coarsest (a single tile) first"""
+    sizes = [size]
+    while sizes[-1] > tile_size:
+        sizes.append(math.ceil(sizes[-1] / 2))
+    return sizes[::-1]
+
+
+def render_face(pano: np.ndarray, face: str, size: int) -> np.ndarray:
+    """Project one cube face out of an equirectangular image"""
+    heading, pitch = FACES[face]
+    viewport = Viewport(fov=90.0, width=size, height=size, pitch=pitch)
+    with tracer.span("cube_face", cat="render", face=face, size=size):
+        map_x, map_y = perspective_maps(pano.shape[:2], viewport, heading)
+        return cv2.remap(pano, map_x, map_y, interpolation=cv2.INTER_LINEAR,
+                         borderMode=cv2.BORDER_WRAP)
+
+
+def write_level(face_image: np.ndarray, face: str, level: int, size: int,
+                tile_size: int, output_dir: Path, params: list) -> int:
+    """Resize a face to a level's size and write its tiles; returns the tile count"""
+    with tracer.span("tile_level", cat="io", face=face, level=level, size=size):
+        image = face_image
+        if size != face_image.shape[0]:
+            image = cv2.resize(face_image, (size, size), interpolation=cv2.INTER_AREA)
+        
+        level_dir = output_dir / str(level) / face
+        level_dir.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for row in range(math.ceil(size / tile_size)):
+            for col in range(math.ceil(size / tile_size)):
+                tile = image[row * tile_size:(row + 1) * tile_size,
+                             col * tile_size:(col + 1) * tile_size]
+                cv2.imwrite(str(level_dir / f"{row}_{col}.jpg"), tile, params)
+                count += 1
+        return count
+
+
+def location_id(panorama: Path) -> str:
+    name = panorama.name
+    return name[:-len(PANORAMA_SUFFIX)] if name.endswith(PANORAMA_SUFFIX) else panorama.stem
+
+
+def _load_descriptor(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(descriptor: Optional[Dict[str, Any]], panorama: Path,
+               tile_size: int, quality: int) -> bool:
+    """
+    Whether an export is up to date with its panorama and settings.
+    
+    Size and mtime are compared first; only when they differ is the
+    panorama hashed (e.g. relinked to an identical artifact).
+    """
+    if not descriptor or descriptor.get("version") != EXPORT_VERSION:
+        return False
+    if descriptor.get("tile_size") != tile_size or descriptor.get("quality") != quality:
+        return False
+    stat = panorama.stat()
+    source = descriptor.get("source", {})
+    if source.get("size") == stat.st_size and source.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    return source.get("sha256") == file_digest(panorama)
+
+
+def export_panorama(panorama: Path, output_dir: Path,
+                    tile_size: int = TILE_SIZE,
+                    quality: int = TILE_QUALITY,
+                    workers: int = EXPORT_WORKERS,
+                    force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Export one panorama as a cubemap tile pyramid.
+    
+    Args:
+        panorama: Equirectangular image (processed/<loc_id>_panorama.jpg)
+        output_dir: Tiles go to output_dir/<loc_id>/
+        force: Export even if the existing tiles are up to date
+    
+    Returns:
+        The descriptor, or None if the panorama could not be read
+    """
+    panorama, output_dir = Path(panorama), Path(output_dir)
+    loc_id = location_id(panorama)
+    target = output_dir / loc_id
+    
+    existing = _load_descriptor(target / DESCRIPTOR_NAME)
+    if not force and is_current(existing, panorama, tile_size, quality):
+        logger.info(f"Tiles up to date: {loc_id}")
+        return existing
+    
+    with tracer.span("load_panorama", cat="io", location=loc_id):
+        stat = panorama.stat()
+        digest = file_digest(panorama)
+        pano = cv2.imread(str(panorama), cv2.IMREAD_COLOR)
+    if pano is None:
+        logger.error(f"Failed to read panorama: {panorama}")
+        return None
+    
+    size = face_size(pano.shape[1])
+    sizes = level_sizes(size, tile_size)
+    params = imwrite_params("jpg", quality)
+    
+    partial = output_dir / f".{loc_id}.partial"
+    if partial.exists():
+        shutil.rmtree(partial)
+    partial.mkdir(parents=True)
+    
+    # Each face's levels start as soon as that face is rendered
+    with tracer.span("export_tiles", cat="stage", location=loc_id), \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        faces = {pool.submit(render_face, pano, face, size): face for face in FACES}
+        levels = []
+        for future in as_completed(faces):
+            face = faces[future]
+            face_image = future.result()
+            levels.extend(
+                pool.submit(write_level, face_image, face, level, level_size,
+                            tile_size, partial, params)
+                for level, level_size in enumerate(sizes)
+            )
+        tiles = sum(future.result() for future in levels)
+    
+    descriptor = {
+        "version": EXPORT_VERSION,
+        "type": "cubemap",
+        "source": {
+            "name": panorama.name,
+            "width": pano.shape[1],
+            "height": pano.shape[0],
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest,
+        },
+        "tile_size": tile_size,
+        "quality": quality,
+        "format": "jpg",
+        "url": TILE_URL,
+        "faces": {face: {"heading": heading, "pitch": pitch}
+                  for face, (heading, pitch) in FACES.items()},
+        "levels": [
+            {"level": level, "size": level_size, "tiles": math.ceil(level_size / tile_size)}
+            for level, level_size in enumerate(sizes)
+        ],
+    }
+    with open(partial / DESCRIPTOR_NAME, 'w') as f:
+        json.dump(descriptor, f, indent=2)
+    
+    # Swap the complete export into place
+    old = output_dir / f".{loc_id}.old"
+    if old.exists():
+        shutil.rmtree(old)
+    if target.exists():
+        os.replace(target, old)
+    os.replace(partial, target)
+    if old.exists():
+        shutil.rmtree(old)
+    
+    logger.info(f"Exported {loc_id}: {tiles} tiles, faces {size}px, {len(sizes)} levels")
+    return descriptor
+
+
+def export_all(panoramas: Iterable[Path], output_dir: Path,
+               tile_size: int = TILE_SIZE,
+               quality: int = TILE_QUALITY,
+               workers: int = EXPORT_WORKERS,
+               force: bool = False) -> Dict[str, int]:
+    """
+    Export panoramas one after another (each uses all workers).
+    
+    Returns:
+        Counts of "exported", "current" (skipped, up to date) and "failed"
+    """
+    counts = {"exported": 0, "current": 0, "failed": 0}
+    for panorama in panoramas:
+        panorama = Path(panorama)
+        try:
+            existing = _load_descriptor(output_dir / location_id(panorama) / DESCRIPTOR_NAME)
+            if not force and is_current(existing, panorama, tile_size, quality):
+                counts["current"] += 1
+                continue
+            descriptor = export_panorama(panorama, output_dir, tile_size, quality, workers,
+                                         force=True)
+        except Exception as e:
+            logger.error(f"Tile export failed for {panorama.name}: {e}")
+            descriptor = None
+        counts["exported" if descriptor is not None else "failed"] += 1
+    
+    logger.info(f"Tile export: {counts['exported']} exported, {counts['current']} up to date, "
+                f"{counts['failed']} failed -> {output_dir}")
+    return counts
+
+
+def main():
+    default_base = Path(__file__).parent.parent / "panoramas"
+    parser = argparse.ArgumentParser(description="Export panoramas as cubemap tile pyramids")
+    parser.add_argument("panoramas_dir", type=str, nargs="?",
+                        default=str(default_base / "processed"),
+                        help="Directory of *_panorama.jpg files")
+    parser.add_argument("output_dir", type=str, nargs="?",
+                        default=str(default_base / "cubemaps"),
+                        help="Output directory (one subdirectory per location)")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE,
+                        help=f"Tile edge in pixels (default: {TILE_SIZE})")
+    parser.add_argument("--quality", type=int, default=TILE_QUALITY,
+                        help=f"JPEG quality (default: {TILE_QUALITY})")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS,
+                        help=f"Threads rendering faces and levels (default: {EXPORT_WORKERS})")
+    parser.add_argument("--force", "-f", action="store_true",
+                        help="Re-export up-to-date locations")
+    add_trace_arguments(parser)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s',
+                        datefmt='%H:%M:%S')
+    start_tracing(args)
+    
+    panoramas = sorted(Path(args.panoramas_dir).glob(f"*{PANORAMA_SUFFIX}"))
+    if not panoramas:
+        logger.error(f"No panoramas found in {args.panoramas_dir}")
+        return 1
+    
+    counts = export_all(panoramas, Path(args.output_dir), args.tile_size, args.quality,
+                        args.workers, args.force)
+    export_traces(args)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
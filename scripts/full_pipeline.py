@@ -13,17 +13,27 @@ Usage:
 import os
 import sys
 import json
+import time
 import argparse
 import requests
 import logging
 import hashlib
+import queue
+import shutil
+import threading
+import multiprocessing
 from pathlib import Path
 from datetime import datetime
-from dataclasses import dataclass, asdict
-from typing import Optional, Tuple, List, Dict, Any
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+from typing import Optional, Tuple, List, Dict, Any, Callable, Iterable
 from PIL import Image
 import numpy as np
 
+from depth_estimation import DEPTH_MODELS, normalize_depth
+from tracing import tracer, add_trace_arguments, start_tracing, export_traces
+from memory_governor import MB, MemoryGovernor, add_memory_arguments, process_tree_rss
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -36,7 +46,35 @@ METADATA_URL = "https://maps.googleapis.com/maps/api/streetview/metadata"
 DEFAULT_TILE_SIZE = 640  # Max Street View API size
 DEFAULT_OUTPUT_WIDTH = 8192  # 8K equirectangular
 DEFAULT_UPSCALE_FACTOR = 4
-DEPTH_MODEL_ID = "depth-anything/Depth-Anything-V2-Small-hf"
+# Tile grid covering the full sphere: 90° FOV at 6 headings (for overlap) × 3 pitches
+TILE_HEADINGS = (0, 60, 120, 180, 240, 300)
+TILE_PITCHES = (-45, 0, 45)  # Look down, level, up
+TILE_COUNT = len(TILE_HEADINGS) * len(TILE_PITCHES)
+DEPTH_MODEL_ID = DEPTH_MODELS["small"]
+DEPTH_BACKEND = "torch"  # "torch" or "onnx" (CPU, exported and cached)
+
+STAGES = ("prepare", "download", "stitch", "upscale", "estimate_depth", "finalize")
+STITCH_WIDTH = 4096
+ESRGAN_MODEL_URL = 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth'
+ESRGAN_TILE = 400  # Process in tiles to save memory
+ARTIFACT_VERSION = 1  # Bump when a stage's output changes for identical inputs
+ARTIFACT_SUFFIXES = {"stitch": ".jpg", "upscale": ".jpg", "depth": ".png"}
+STALE_TEMP_SECONDS = 6 * 3600  # Temp outputs older than this were left by a crash
+STAGE_ARTIFACTS = {"stitch": "stitch", "upscale": "upscale", "estimate_depth": "depth"}
+
+# Stage-pipelined scheduling (PipelineScheduler)
+STAGE_WORKERS = {"download": 4, "stitch": 2, "model": 1}
+STAGE_QUEUE_SIZE = 2  # Locations buffered between stages
+
+# Memory model for plan_pipeline_memory() (rough upper bounds)
+TORCH_RUNTIME_BYTES = 600 * MB  # torch runtime, once per process
+ESRGAN_WEIGHTS_BYTES = 70 * MB
+ESRGAN_TILE_BYTES_PER_PIXEL = 512  # Activations per upscaled tile pixel (64 float32 features, x2)
+ESRGAN_TILES = (ESRGAN_TILE, 256, 192, 128)  # Candidates, largest (fastest) first
+DEPTH_MODEL_BYTES = {"Small": 100 * MB, "Base": 400 * MB, "Large": 1400 * MB}
+DEPTH_WIDTHS = (None, 8192, 4096, 2048)  # Depth output widths, None = full resolution
+DOWNLOAD_BYTES = 64 * MB  # Tiles and responses in flight per download worker
+STITCH_PROCESS_BYTES = 200 * MB  # Spawned interpreter with PIL, per stitch worker
 
 # Setup logging
 logging.basicConfig(
@@ -65,6 +103,326 @@ class PipelineResult:
             self.metadata = {}
 
 
+@dataclass
+class LocationJob:
+    """A location moving through the pipeline stages"""
+    name: str
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    pano_id: Optional[str] = None
+    description: str = ""
+    source: Optional[Dict[str, Any]] = None  # Caller's location record
+    start_time: datetime = field(default_factory=datetime.now)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    actual_lat: Optional[float] = None
+    actual_lng: Optional[float] = None
+    tiles_path: Optional[Path] = None
+    stitched_path: Optional[Path] = None
+    upscaled_path: Optional[Path] = None
+    depth_path: Optional[Path] = None
+    final_pano: Optional[Path] = None
+    final_depth: Optional[Path] = None
+    loc_id: Optional[str] = None
+    keys: Dict[str, str] = field(default_factory=dict)  # Stage -> artifact key
+    key_params: Dict[str, Dict] = field(default_factory=dict)
+    index: Optional[Dict] = None  # Store index from the previous run
+    cached: bool = True  # No stage had to run
+    cached_stages: List[str] = field(default_factory=list)  # Served from the store
+    timings: Dict[str, float] = field(default_factory=dict)  # Stage -> seconds
+    peak_rss_mb: Dict[str, int] = field(default_factory=dict)  # Stage -> MB
+    result: Optional[PipelineResult] = None
+    
+    def elapsed(self) -> float:
+        return (datetime.now() - self.start_time).total_seconds()
+    
+    def key_stage(self, stage: str, store: 'ArtifactStore', **params):
+        """Compute and remember a stage's artifact key"""
+        self.keys[stage] = store.key(stage, **params)
+        self.key_params[stage] = {"key": self.keys[stage], **params}
+    
+    def fail(self, error: str, **kwargs):
+        self.result = PipelineResult(
+            success=False,
+            location_name=self.name,
+            pano_id=self.pano_id,
+            error=error,
+            **kwargs
+        )
+
+
+@dataclass
+class LocationPlan:
+    """Work processing a location would do (FullPipeline.plan_location)"""
+    name: str
+    loc_id: Optional[str] = None
+    run: List[str] = field(default_factory=list)  # Stages that would do work
+    cached: List[str] = field(default_factory=list)  # Stages served from the store
+    requests: int = 0  # Street View API requests
+    note: str = ""
+
+
+def file_digest(path: Path) -> str:
+    """sha256 of a file's contents"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tiles_digest(tiles_dir: Path) -> str:
+    """Checksum over all tiles of a panorama (names and contents)"""
+    h = hashlib.sha256()
+    for tile in sorted(tiles_dir.glob("tile_*.jpg")):
+        h.update(tile.name.encode())
+        h.update(file_digest(tile).encode())
+    return h.hexdigest()
+
+
+def tiles_readable(tiles_dir: Path) -> bool:
+    """Whether every tile decodes fully (a truncated JPEG fails to load)"""
+    try:
+        for tile in tiles_dir.glob("tile_*.jpg"):
+            with Image.open(tile) as img:
+                img.load()
+        return True
+    except Exception:
+        return False
+
+
+def _reflink(src: Path, dst: Path):
+    """Copy-on-write clone (btrfs/XFS); raises OSError where unsupported"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflink not supported")
+    FICLONE = 0x40049409
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            dst.unlink(missing_ok=True)
+            raise
+
+
+def link_or_copy(src: Path, dst: Path) -> Optional[str]:
+    """
+    Place src at dst without copying data where possible.
+    
+    Tries a hardlink, then a reflink, then falls back to a copy; dst is
+    replaced atomically.
+    
+    Returns:
+        "hardlink", "reflink", "copy", or None if dst already is src
+    """
+    src, dst = Path(src), Path(dst)
+    if dst.exists() and os.path.samefile(src, dst):
+        return None
+    
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+        method = "hardlink"
+    except OSError:
+        try:
+            _reflink(src, tmp)
+            method = "reflink"
+        except OSError:
+            shutil.copy2(src, tmp)
+            method = "copy"
+    os.replace(tmp, dst)
+    return method
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of stage outputs.
+    
+    Each output lives under a key hashed from its stage, inputs and
+    parameters, so a hit is exact: changed tiles, widths or models give a
+    new key. Stored files are read-only since they are hardlinked into
+    stitched/, upscaled/, depth/ and processed/; writing through one of
+    those links would otherwise alter the store.
+    
+    Outputs are produced at a temporary path and renamed into place, so
+    a stored artifact is always complete. The index doubles as each
+    location's checkpoint: FullPipeline saves it after every stage.
+    """
+    
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.index_dir = self.root / "index"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+    
+    def key(self, stage: str, **params) -> str:
+        payload = json.dumps(
+            {"stage": stage, "version": ARTIFACT_VERSION, **params}, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def path(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}{suffix}"
+    
+    def get(self, key: str, suffix: str) -> Optional[Path]:
+        path = self.path(key, suffix)
+        return path if path.exists() else None
+    
+    def temp_path(self, key: str, suffix: str) -> Path:
+        """Temporary output path next to the artifact (keeps the suffix for encoders)"""
+        path = self.path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f".{key}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}")
+    
+    def put(self, key: str, suffix: str, produced: Path) -> Path:
+        """Move a finished output into the store (synced first, so it survives a crash)"""
+        path = self.path(key, suffix)
+        with open(produced, 'rb') as f:
+            os.fsync(f.fileno())
+        os.chmod(produced, 0o444)
+        os.replace(produced, path)
+        return path
+    
+    def adopt(self, key: str, suffix: str, existing: Path) -> Path:
+        """Take an output produced outside the store under this key"""
+        path = self.path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        link_or_copy(existing, path)
+        os.chmod(path, 0o444)
+        return path
+    
+    def load_index(self, loc_id: str) -> Optional[Dict]:
+        """Stage keys and parameters last used for a location"""
+        try:
+            with open(self.index_dir / f"{loc_id}.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save_index(self, loc_id: str, stages: Dict[str, Dict]):
+        """Replace a location's index atomically"""
+        path = self.index_dir / f"{loc_id}.json"
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(stages, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    
+    def remove_stale_temps(self, older_than: float = STALE_TEMP_SECONDS) -> int:
+        """Delete temporary outputs left behind by crashed runs"""
+        cutoff = time.time() - older_than
+        removed = 0
+        for tmp in self.root.glob("*/.*.tmp*"):
+            try:
+                if tmp.stat().st_mtime < cutoff:
+                    tmp.unlink()
+                    removed += 1
+            except OSError:
+                pass  # Removed or finished meanwhile
+        if removed:
+            logger.info(f"Removed {removed} stale temporary outputs from {self.root}")
+        return removed
+
+
+@dataclass
+class MemoryPlan:
+    """Pipeline settings chosen to fit a memory budget"""
+    esrgan_tile: int = ESRGAN_TILE
+    upscale: bool = True  # False when even the smallest tile does not fit
+    depth_max_width: Optional[int] = None
+    workers: Dict[str, int] = field(default_factory=lambda: dict(STAGE_WORKERS))
+    estimates: Dict[str, int] = field(default_factory=dict)  # Stage -> bytes
+
+
+def upscale_bytes(width: int, scale: int, tile: int) -> int:
+    """Peak memory of one Real-ESRGAN upscale of a width x width/2 panorama"""
+    pixels = width * (width // 2)
+    upscaled = pixels * scale * scale
+    return (
+        pixels * 3 * 5  # uint8 input + float32 tensor
+        + upscaled * 3 * 4  # float32 output accumulated over tiles
+        + upscaled * 3 * 2  # uint8 result + encode buffer
+        + (tile * scale) ** 2 * ESRGAN_TILE_BYTES_PER_PIXEL
+    )
+
+
+def depth_bytes(input_width: int, output_width: int) -> int:
+    """Peak memory of one depth estimate, excluding model weights"""
+    return (
+        input_width * (input_width // 2) * 3  # Decoded RGB input
+        + output_width * (output_width // 2) * 18  # float32 interpolation + normalize temporaries, uint8 out
+    )
+
+
+def plan_pipeline_memory(budget_mb: Optional[float],
+                         width: int = STITCH_WIDTH,
+                         scale: int = DEFAULT_UPSCALE_FACTOR,
+                         depth_model_id: str = DEPTH_MODEL_ID,
+                         workers: Optional[Dict[str, int]] = None) -> MemoryPlan:
+    """
+    Choose ESRGAN tile size, depth output width and stage worker counts
+    so the pipeline fits in budget_mb.
+    
+    Model workers are sized first (largest tile, then largest depth width
+    that fit), then as many model, stitch and download workers as fit, up
+    to the requested counts. Without a budget, defaults are returned.
+    """
+    requested = dict(STAGE_WORKERS)
+    requested.update({k: v for k, v in (workers or {}).items() if v})
+    plan = MemoryPlan(workers=dict(requested))
+    
+    depth_weights = next((size for name, size in DEPTH_MODEL_BYTES.items()
+                          if name in depth_model_id), DEPTH_MODEL_BYTES["Large"])
+    weights = ESRGAN_WEIGHTS_BYTES + depth_weights
+    base = max(process_tree_rss(), 200 * MB) + TORCH_RUNTIME_BYTES + weights
+    fixed = DOWNLOAD_BYTES + STITCH_PROCESS_BYTES  # At least one of each
+    
+    def estimates(tile, depth_width, upscale):
+        depth_input = width * scale if upscale else width
+        return {
+            "download": DOWNLOAD_BYTES,
+            "stitch": STITCH_PROCESS_BYTES + width * (width // 2) * 6,
+            "upscale": upscale_bytes(width, scale, tile) if upscale else 0,
+            "estimate_depth": depth_bytes(depth_input, min(depth_width or depth_input, depth_input)),
+        }
+    
+    if budget_mb is None:
+        plan.estimates = estimates(plan.esrgan_tile, None, True)
+        return plan
+    
+    available = budget_mb * MB - base - fixed
+    
+    # Largest tile that fits; without one, fall back to the stitched image
+    plan.esrgan_tile = next((t for t in ESRGAN_TILES
+                             if upscale_bytes(width, scale, t) <= available), ESRGAN_TILES[-1])
+    plan.upscale = upscale_bytes(width, scale, plan.esrgan_tile) <= available
+    
+    depth_input = width * scale if plan.upscale else width
+    plan.depth_max_width = next((w for w in DEPTH_WIDTHS
+                                 if depth_bytes(depth_input, min(w or depth_input, depth_input)) <= available),
+                                DEPTH_WIDTHS[-1])
+    
+    plan.estimates = estimates(plan.esrgan_tile, plan.depth_max_width, plan.upscale)
+    model_peak = max(plan.estimates["upscale"], plan.estimates["estimate_depth"])
+    
+    # Extra workers from whatever is left, models first
+    spare = max(0, available - model_peak)
+    extra_models = min(requested["model"] - 1, int(spare // (model_peak + weights)))
+    spare -= extra_models * (model_peak + weights)
+    extra_stitch = min(requested["stitch"] - 1, int(spare // plan.estimates["stitch"]))
+    spare -= extra_stitch * plan.estimates["stitch"]
+    extra_download = min(requested["download"] - 1, int(spare // DOWNLOAD_BYTES))
+    plan.workers = {
+        "download": 1 + extra_download,
+        "stitch": 1 + extra_stitch,
+        "model": 1 + extra_models,
+    }
+    return plan
+
+
 class StreetViewDownloader:
     """Downloads Street View tiles and stitches into equirectangular panoramas"""
     
@@ -82,7 +440,8 @@ class StreetViewDownloader:
         }
         
         try:
-            resp = self.session.get(METADATA_URL, params=params, timeout=10)
+            with tracer.span("metadata_request", cat="io"):
+                resp = self.session.get(METADATA_URL, params=params, timeout=10)
             data = resp.json()
             
             if data.get("status") == "OK":
@@ -102,7 +461,8 @@ class StreetViewDownloader:
         }
         
         try:
-            resp = self.session.get(METADATA_URL, params=params, timeout=10)
+            with tracer.span("metadata_request", cat="io"):
+                resp = self.session.get(METADATA_URL, params=params, timeout=10)
             data = resp.json()
             
             if data.get("status") == "OK":
@@ -119,17 +479,23 @@ class StreetViewDownloader:
         
         Street View API returns perspective views, so we download at multiple
         headings and pitches to cover the full sphere.
+        
+        Each tile is written to a temporary name and renamed when complete;
+        tiles already in output_dir (from an interrupted attempt) are kept.
         """
         output_dir.mkdir(parents=True, exist_ok=True)
         tiles = []
         
         # Cover full sphere: 360° horizontal, ~180° vertical
         # Using 90° FOV, we need 4 horizontal × 3 vertical = 12 images minimum
-        headings = [0, 60, 120, 180, 240, 300]  # 6 directions for better overlap
-        pitches = [-45, 0, 45]  # Look down, level, up
-        
-        for heading in headings:
-            for pitch in pitches:
+        for heading in TILE_HEADINGS:
+            for pitch in TILE_PITCHES:
+                filename = f"tile_h{heading:03d}_p{pitch:+03d}.jpg"
+                filepath = output_dir / filename
+                if filepath.exists():
+                    tiles.append(filepath)
+                    continue
+                
                 params = {
                     "pano": pano_id,
                     "size": f"{tile_size}x{tile_size}",
@@ -142,14 +508,14 @@ class StreetViewDownloader:
                 url = f"{STREETVIEW_URL}?" + "&".join(f"{k}={v}" for k, v in params.items())
                 
                 try:
-                    resp = self.session.get(url, timeout=30)
+                    with tracer.span("tile", cat="io", heading=heading, pitch=pitch):
+                        resp = self.session.get(url, timeout=30)
                     
                     if resp.status_code == 200 and len(resp.content) > 1000:
-                        filename = f"tile_h{heading:03d}_p{pitch:+03d}.jpg"
-                        filepath = output_dir / filename
-                        
-                        with open(filepath, "wb") as f:
+                        tmp = output_dir / f".{filename}.tmp"
+                        with open(tmp, "wb") as f:
                             f.write(resp.content)
+                        os.replace(tmp, filepath)
                         
                         tiles.append(filepath)
                         logger.debug(f"Downloaded: {filename}")
@@ -164,79 +530,86 @@ class StreetViewDownloader:
     
     def stitch_equirectangular(self, tiles_dir: Path, output_path: Path,
                                output_width: int = 4096) -> bool:
-        """
-        Stitch downloaded tiles into an equirectangular panorama.
-        
-        This uses a simplified planar projection approach.
-        For production, consider using PTGui or Hugin for better stitching.
-        """
-        output_height = output_width // 2  # 2:1 aspect for equirectangular
-        
-        # Load all tiles
-        tiles = sorted(tiles_dir.glob("tile_*.jpg"))
-        if not tiles:
-            logger.error("No tiles found to stitch")
-            return False
-        
-        # Create output canvas
-        result = Image.new('RGB', (output_width, output_height), (128, 128, 128))
-        
-        # Parse tiles and map to equirectangular coordinates
-        for tile_path in tiles:
-            # Parse filename: tile_h{heading}_p{pitch}.jpg
-            name = tile_path.stem
-            parts = name.split("_")
-            heading = int(parts[1][1:])  # h000 -> 0
-            pitch = int(parts[2][1:])    # p+00 -> 0
-            
-            try:
-                img = Image.open(tile_path)
-                
-                # Map heading (0-360) to x position (0 to width)
-                # heading 0 = center, heading 180 = edges
-                center_x = int((heading / 360) * output_width)
-                
-                # Map pitch (-90 to 90) to y position
-                # pitch 90 = top, pitch -90 = bottom, pitch 0 = middle
-                center_y = int(((90 - pitch) / 180) * output_height)
-                
-                # Calculate tile dimensions in output
-                fov_h_pixels = int((90 / 360) * output_width)
-                fov_v_pixels = int((90 / 180) * output_height)
-                
-                # Resize tile
-                tile_resized = img.resize((fov_h_pixels, fov_v_pixels), Image.LANCZOS)
-                
-                # Calculate paste position (centered on heading/pitch point)
-                paste_x = center_x - fov_h_pixels // 2
-                paste_y = center_y - fov_v_pixels // 2
-                
-                # Handle wrap-around for heading
-                if paste_x < 0:
-                    # Tile wraps from right side
-                    result.paste(tile_resized, (paste_x + output_width, paste_y))
-                if paste_x + fov_h_pixels > output_width:
-                    # Tile wraps to left side
-                    result.paste(tile_resized, (paste_x - output_width, paste_y))
-                
-                result.paste(tile_resized, (paste_x, paste_y))
-                
-            except Exception as e:
-                logger.warning(f"Failed to process tile {tile_path.name}: {e}")
-        
-        # Save result
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        result.save(output_path, quality=95, optimize=True)
-        logger.info(f"Saved stitched panorama: {output_path}")
-        
-        return True
+        """Stitch downloaded tiles (see stitch_equirectangular())"""
+        return stitch_equirectangular(tiles_dir, output_path, output_width)
+
+
+def stitch_equirectangular(tiles_dir: Path, output_path: Path,
+                           output_width: int = 4096) -> bool:
+    """
+    Stitch downloaded tiles into an equirectangular panorama.
+    
+    This uses a simplified planar projection approach.
+    For production, consider using PTGui or Hugin for better stitching.
+    """
+    output_height = output_width // 2  # 2:1 aspect for equirectangular
+    
+    # Load all tiles
+    tiles = sorted(tiles_dir.glob("tile_*.jpg"))
+    if not tiles:
+        logger.error("No tiles found to stitch")
+        return False
+    
+    # Create output canvas
+    result = Image.new('RGB', (output_width, output_height), (128, 128, 128))
+    
+    # Parse tiles and map to equirectangular coordinates
+    for tile_path in tiles:
+        # Parse filename: tile_h{heading}_p{pitch}.jpg
+        name = tile_path.stem
+        parts = name.split("_")
+        heading = int(parts[1][1:])  # h000 -> 0
+        pitch = int(parts[2][1:])    # p+00 -> 0
+    
+        try:
+            img = Image.open(tile_path)
+    
+            # Map heading (0-360) to x position (0 to width)
+            # heading 0 = center, heading 180 = edges
+            center_x = int((heading / 360) * output_width)
+    
+            # Map pitch (-90 to 90) to y position
+            # pitch 90 = top, pitch -90 = bottom, pitch 0 = middle
+            center_y = int(((90 - pitch) / 180) * output_height)
+    
+            # Calculate tile dimensions in output
+            fov_h_pixels = int((90 / 360) * output_width)
+            fov_v_pixels = int((90 / 180) * output_height)
+    
+            # Resize tile
+            tile_resized = img.resize((fov_h_pixels, fov_v_pixels), Image.LANCZOS)
+    
+            # Calculate paste position (centered on heading/pitch point)
+            paste_x = center_x - fov_h_pixels // 2
+            paste_y = center_y - fov_v_pixels // 2
+    
+            # Handle wrap-around for heading
+            if paste_x < 0:
+                # Tile wraps from right side
+                result.paste(tile_resized, (paste_x + output_width, paste_y))
+            if paste_x + fov_h_pixels > output_width:
+                # Tile wraps to left side
+                result.paste(tile_resized, (paste_x - output_width, paste_y))
+    
+            result.paste(tile_resized, (paste_x, paste_y))
+    
+        except Exception as e:
+            logger.warning(f"Failed to process tile {tile_path.name}: {e}")
+    
+    # Save result
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    result.save(output_path, quality=95, optimize=True)
+    logger.info(f"Saved stitched panorama: {output_path}")
+    
+    return True
 
 
 class AIUpscaler:
     """Upscales images using Real-ESRGAN"""
     
-    def __init__(self, scale: int = 4):
+    def __init__(self, scale: int = 4, tile: int = ESRGAN_TILE):
         self.scale = scale
+        self.tile = tile
         self.upsampler = None
         self._initialized = False
     
@@ -266,19 +639,17 @@ class AIUpscaler:
                 num_block=23, num_grow_ch=32, scale=4
             )
             
-            # Model weights URL
-            model_url = 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth'
-            
-            self.upsampler = RealESRGANer(
-                scale=self.scale,
-                model_path=model_url,
-                model=model,
-                tile=400,  # Process in tiles to save memory
-                tile_pad=10,
-                pre_pad=0,
-                half=half,
-                device=device
-            )
+            with tracer.span("model_load", cat="model", model="Real-ESRGAN"):
+                self.upsampler = RealESRGANer(
+                    scale=self.scale,
+                    model_path=ESRGAN_MODEL_URL,
+                    model=model,
+                    tile=self.tile,
+                    tile_pad=10,
+                    pre_pad=0,
+                    half=half,
+                    device=device
+                )
             
             self._initialized = True
             return True
@@ -291,6 +662,10 @@ class AIUpscaler:
             logger.error(f"Failed to initialize Real-ESRGAN: {e}")
             return False
     
+    def fingerprint(self) -> Dict[str, Any]:
+        """Parameters that determine the upscaled output"""
+        return {"model": ESRGAN_MODEL_URL, "scale": self.scale, "tile": self.tile}
+    
     def upscale(self, input_path: Path, output_path: Path) -> bool:
         """Upscale an image file"""
         if not self._ensure_initialized():
@@ -306,7 +681,8 @@ class AIUpscaler:
             
             logger.info(f"Upscaling {input_path.name} ({img.shape[1]}x{img.shape[0]} → {img.shape[1]*self.scale}x{img.shape[0]*self.scale})")
             
-            output, _ = self.upsampler.enhance(img, outscale=self.scale)
+            with tracer.span("esrgan", cat="model", width=img.shape[1], height=img.shape[0]):
+                output, _ = self.upsampler.enhance(img, outscale=self.scale)
             
             output_path.parent.mkdir(parents=True, exist_ok=True)
             cv2.imwrite(str(output_path), output)
@@ -322,21 +698,32 @@ class AIUpscaler:
 class DepthEstimator:
     """Generates depth maps using Depth Anything v2"""
     
-    def __init__(self, model_id: str = DEPTH_MODEL_ID):
+    def __init__(self, model_id: str = DEPTH_MODEL_ID,
+                 latency_budget: Optional[float] = None,
+                 backend: str = DEPTH_BACKEND,
+                 max_width: Optional[int] = None):
         self.model_id = model_id
+        self.latency_budget = latency_budget
+        self.backend = backend
+        self.max_width = max_width  # Cap on depth map width (memory)
         self.processor = None
         self.model = None
         self.device = None
         self._initialized = False
     
-    def _ensure_initialized(self):
-        """Lazy initialization of the model"""
+    def _ensure_initialized(self, sample_image: Optional[Image.Image] = None):
+        """
+        Lazy initialization of the model.
+        
+        With a latency budget, the model size is chosen from a calibration
+        benchmark run on the first image processed.
+        """
         if self._initialized:
             return True
         
         try:
             import torch
-            from transformers import AutoImageProcessor, AutoModelForDepthEstimation
+            from depth_estimation import load_model, select_model
             
             # Determine device
             if torch.cuda.is_available():
@@ -346,12 +733,16 @@ class DepthEstimator:
             else:
                 self.device = 'cpu'
             
-            logger.info(f"Loading Depth Anything v2 on {self.device}")
+            if self.latency_budget is not None and sample_image is not None:
+                with tracer.span("depth_calibrate", cat="model"):
+                    self.model_id = select_model(
+                        self.latency_budget, sample_image, backend=self.backend
+                    )
+            
+            logger.info(f"Loading Depth Anything v2 ({self.model_id}, {self.backend}) on {self.device}")
             
-            self.processor = AutoImageProcessor.from_pretrained(self.model_id)
-            self.model = AutoModelForDepthEstimation.from_pretrained(self.model_id)
-            self.model = self.model.to(self.device)
-            self.model.eval()
+            with tracer.span("model_load", cat="model", model=self.model_id):
+                self.processor, self.model = load_model(self.model_id, self.backend)
             
             self._initialized = True
             return True
@@ -364,17 +755,42 @@ class DepthEstimator:
             logger.error(f"Failed to initialize depth model: {e}")
             return False
     
+    def fingerprint(self, sample_path: Optional[Path] = None) -> Dict[str, Any]:
+        """
+        Parameters that determine the depth output.
+        
+        With a latency budget the model is only known after calibration,
+        so the model is initialized on sample_path first.
+        """
+        if self.latency_budget is not None and not self._initialized and sample_path:
+            try:
+                self._ensure_initialized(Image.open(sample_path).convert('RGB'))
+            except Exception as e:
+                logger.warning(f"Could not resolve depth model: {e}")
+        params = {"model": self.model_id, "backend": self.backend}
+        if self.max_width:
+            params["max_width"] = self.max_width
+        return params
+    
     def estimate(self, input_path: Path, output_path: Path) -> bool:
         """Generate depth map for an image"""
-        if not self._ensure_initialized():
+        try:
+            image = Image.open(input_path).convert('RGB')
+        except Exception as e:
+            logger.error(f"Failed to read image: {e}")
+            return False
+        
+        if not self._ensure_initialized(image):
             return False
         
         try:
             import torch
             
-            # Load image
-            image = Image.open(input_path).convert('RGB')
             original_size = image.size
+            output_size = original_size
+            if self.max_width and original_size[0] > self.max_width:
+                output_size = (self.max_width,
+                               round(original_size[1] * self.max_width / original_size[0]))
             
             logger.info(f"Estimating depth for {input_path.name} ({original_size[0]}x{original_size[1]})")
             
@@ -382,23 +798,20 @@ class DepthEstimator:
             inputs = self.processor(images=image, return_tensors="pt")
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
             
-            with torch.no_grad():
+            with torch.no_grad(), tracer.span("depth_model", cat="model", model=self.model_id):
                 outputs = self.model(**inputs)
                 predicted_depth = outputs.predicted_depth
             
-            # Interpolate to original size
+            # Interpolate to original size (or the memory-capped width)
             prediction = torch.nn.functional.interpolate(
                 predicted_depth.unsqueeze(1),
-                size=(original_size[1], original_size[0]),
+                size=(output_size[1], output_size[0]),
                 mode="bicubic",
                 align_corners=False
             ).squeeze()
             
             # Normalize to 0-255
-            depth_np = prediction.cpu().numpy()
-            depth_min, depth_max = depth_np.min(), depth_np.max()
-            depth_normalized = (depth_np - depth_min) / (depth_max - depth_min + 1e-8)
-            depth_normalized = (depth_normalized * 255).astype(np.uint8)
+            depth_normalized = normalize_depth(prediction.cpu().numpy())
             
             # Save
             output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -422,19 +835,39 @@ class FullPipeline:
     2. Stitch into equirectangular panorama
     3. Upscale with Real-ESRGAN (4x)
     4. Generate depth map with Depth Anything v2
+    
+    Stage outputs are kept in an ArtifactStore keyed by their inputs and
+    parameters, so a re-run only redoes stages whose inputs changed, and
+    processed/ is populated by links rather than copies.
     """
     
     def __init__(self, output_base: Path, 
                  upscale_factor: int = DEFAULT_UPSCALE_FACTOR,
-                 skip_existing: bool = True):
+                 skip_existing: bool = True,
+                 depth_model_id: str = DEPTH_MODEL_ID,
+                 depth_latency_budget: Optional[float] = None,
+                 depth_backend: str = DEPTH_BACKEND,
+                 memory_budget_mb: Optional[float] = None):
         self.output_base = Path(output_base)
         self.upscale_factor = upscale_factor
         self.skip_existing = skip_existing
         
+        # Memory budget: pick tile size and depth resolution, track stage RSS
+        self.memory_budget_mb = memory_budget_mb
+        self.governor = MemoryGovernor(memory_budget_mb)
+        # A latency budget may select any model size; plan for the largest
+        self._planned_model = DEPTH_MODELS["large"] if depth_latency_budget else depth_model_id
+        self.memory_plan = self.plan_memory()
+        
         # Initialize components
         self.downloader = StreetViewDownloader()
-        self.upscaler = AIUpscaler(scale=upscale_factor)
-        self.depth_estimator = DepthEstimator()
+        self.upscaler = AIUpscaler(scale=upscale_factor, tile=self.memory_plan.esrgan_tile)
+        self.depth_estimator = DepthEstimator(
+            model_id=depth_model_id,
+            latency_budget=depth_latency_budget,
+            backend=depth_backend,
+            max_width=self.memory_plan.depth_max_width
+        )
         
         # Create output directories
         self.tiles_dir = self.output_base / "tiles"
@@ -446,6 +879,21 @@ class FullPipeline:
         for d in [self.tiles_dir, self.stitched_dir, self.upscaled_dir, 
                   self.depth_dir, self.processed_dir]:
             d.mkdir(parents=True, exist_ok=True)
+        
+        self.store = ArtifactStore(self.output_base / "artifacts")
+        self.store.remove_stale_temps()
+    
+    def plan_memory(self, workers: Optional[Dict[str, int]] = None) -> MemoryPlan:
+        """Settings fitting the memory budget for the given stage workers"""
+        plan = plan_pipeline_memory(self.memory_budget_mb, STITCH_WIDTH, self.upscale_factor,
+                                    self._planned_model, workers)
+        if self.governor.enabled:
+            depth_width = plan.depth_max_width or "full"
+            logger.info(f"Memory budget {self.memory_budget_mb:.0f} MB: ESRGAN tile "
+                        f"{plan.esrgan_tile if plan.upscale else 'n/a (upscaling disabled)'}, "
+                        f"depth width {depth_width}, workers " +
+                        ", ".join(f"{k}={v}" for k, v in plan.workers.items()))
+        return plan
     
     def _get_location_id(self, name: str, lat: float = None, lng: float = None, 
                          pano_id: str = None) -> str:
@@ -471,159 +919,575 @@ class FullPipeline:
         Returns:
             PipelineResult with paths to generated files
         """
-        start_time = datetime.now()
+        job = LocationJob(name=name, lat=lat, lng=lng, pano_id=pano_id,
+                          description=description)
+        
+        for stage in STAGES:
+            self.run_stage(job, stage)
+            if job.result is not None:
+                break
+        
+        return job.result
+    
+    def run_stage(self, job: LocationJob, stage: str, *args):
+        """
+        Run one stage under a trace span and the memory governor,
+        recording its time and peak RSS on the job.
+        
+        Timings and peaks so far are attached to the result's metadata
+        ("timings", "peak_rss_mb") once the location is finished, failed
+        or skipped. After each stage the location's checkpoint is saved.
+        """
+        with self.governor.stage(stage, self.memory_plan.estimates.get(stage, 0)) as memory, \
+                tracer.span(stage, location=job.name) as span:
+            getattr(self, stage)(job, *args)
+        if job.loc_id and stage != "prepare":
+            self._checkpoint(job, stage)
+        job.timings[stage] = round(span.duration, 3)
+        job.peak_rss_mb[stage] = memory["peak_rss"] // MB
+        if job.result is not None:
+            job.result.metadata["timings"] = dict(job.timings)
+            job.result.metadata["peak_rss_mb"] = dict(job.peak_rss_mb)
+    
+    def plan_location(self, name: str, lat: float = None, lng: float = None,
+                      pano_id: str = None, loc_id: str = None) -> LocationPlan:
+        """
+        Stages processing a location would run, judged from the tiles,
+        artifact store and index on disk: no request is made and no model
+        is loaded.
+        
+        Args:
+            loc_id: Output ID of a location known only by coordinates, whose
+                panorama ID is otherwise only resolved by the metadata request
+        """
+        plan = LocationPlan(name=name)
+        if not pano_id and not (lat and lng):
+            plan.note = "no coordinates or panorama ID"
+            return plan
+        
+        plan.run.append("prepare")
+        plan.requests = 1  # Metadata lookup
+        loc_id = self._get_location_id(name, pano_id=pano_id) if pano_id else loc_id
+        if not loc_id:
+            plan.note = "never processed; panorama resolved at run time"
+            plan.run.extend(s for s in STAGES[1:] if s != "upscale" or self.memory_plan.upscale)
+            plan.requests += TILE_COUNT
+            return plan
+        
+        plan.loc_id = loc_id
+        job = LocationJob(name=name, pano_id=pano_id)
+        self._set_paths(job, loc_id)
+        
+        # Once a stage runs, later keys depend on its new output. Old tiles
+        # are not decoded here (too slow for a plan); a checksum must match
+        changed = not self._tiles_trusted(job, verify=False)
+        if changed:
+            plan.run.append("download")
+            plan.requests += TILE_COUNT - len(list(self._partial_tiles_path(job).glob("*.jpg")))
+        
+        def check(stage: str, link_path: Path):
+            nonlocal changed
+            if not changed and self._cached_output(job, STAGE_ARTIFACTS[stage], link_path):
+                plan.cached.append(stage)
+            else:
+                plan.run.append(stage)
+                changed = True
+        
+        check("stitch", job.stitched_path)
+        
+        if self.memory_plan.upscale:
+            if not changed:
+                self._key_upscale(job, self.upscaler)
+            check("upscale", job.upscaled_path)
+        elif not changed:
+            job.keys["upscale"] = job.keys["stitch"]
+        
+        if not changed:
+            estimator = self.depth_estimator
+            if estimator.latency_budget is not None and not estimator._initialized:
+                # The model is chosen by calibration; assume the indexed one
+                entry = (job.index or {}).get("depth", {})
+                if entry.get("input") == job.keys["upscale"]:
+                    job.keys["depth"] = entry["key"]
+                else:
+                    changed = True
+                    plan.note = "depth model chosen at run time"
+            else:
+                self._key_depth(job, estimator)
+        check("estimate_depth", job.depth_path)
+        
+        plan.run.append("finalize")
+        return plan
+    
+    def _checkpoint(self, job: LocationJob, stage: str):
+        """
+        Save the location's stage states (its store index) atomically.
         
+        Entries: "download" (tiles checksum), "stitch"/"upscale"/"depth"
+        (artifact keys and parameters), "promote" (keys linked into
+        processed/) and "checkpoint" (last stage run, and whether it
+        failed). A rerun restarts at the first stage without a stored
+        output; earlier outputs are only trusted when they match.
+        """
+        failed = job.result is not None and not job.result.success
+        self.store.save_index(job.loc_id, {
+            **job.key_params,
+            "checkpoint": {"stage": stage, "failed": failed,
+                           "time": datetime.now().isoformat()},
+        })
+    
+    # ------------------------------------------------------------------------
+    # Stages. Each takes a LocationJob and sets job.result when the location
+    # is finished, failed or skipped; later stages are then not run.
+    # ------------------------------------------------------------------------
+    
+    def prepare(self, job: LocationJob):
+        """Step 1: resolve panorama metadata and output paths"""
         logger.info("=" * 60)
-        logger.info(f"Processing: {name}")
-        if lat and lng:
-            logger.info(f"Coordinates: ({lat}, {lng})")
-        if pano_id:
-            logger.info(f"Panorama ID: {pano_id}")
+        logger.info(f"Processing: {job.name}")
+        if job.lat and job.lng:
+            logger.info(f"Coordinates: ({job.lat}, {job.lng})")
+        if job.pano_id:
+            logger.info(f"Panorama ID: {job.pano_id}")
         logger.info("=" * 60)
         
-        # Step 1: Get panorama metadata
         logger.info("\n[Step 1/4] Getting Street View metadata...")
         
-        if pano_id:
-            metadata = self.downloader.get_pano_by_id(pano_id)
-        elif lat and lng:
-            metadata = self.downloader.get_pano_metadata(lat, lng)
+        if job.pano_id:
+            metadata = self.downloader.get_pano_by_id(job.pano_id)
+        elif job.lat and job.lng:
+            metadata = self.downloader.get_pano_metadata(job.lat, job.lng)
         else:
-            return PipelineResult(
-                success=False,
-                location_name=name,
-                error="Must provide either coordinates (lat/lng) or panorama ID"
-            )
+            job.fail("Must provide either coordinates (lat/lng) or panorama ID")
+            return
         
         if not metadata:
-            return PipelineResult(
-                success=False,
-                location_name=name,
-                error="No Street View coverage found"
-            )
+            job.fail("No Street View coverage found")
+            return
         
-        pano_id = metadata.get("pano_id")
-        actual_lat = metadata.get("location", {}).get("lat", lat)
-        actual_lng = metadata.get("location", {}).get("lng", lng)
-        
-        logger.info(f"Found panorama: {pano_id}")
-        
-        # Generate location ID
-        loc_id = self._get_location_id(name, actual_lat, actual_lng, pano_id)
-        
-        # Define output paths
-        tiles_path = self.tiles_dir / loc_id
-        stitched_path = self.stitched_dir / f"{loc_id}_pano.jpg"
-        upscaled_path = self.upscaled_dir / f"{loc_id}_4x.jpg"
-        depth_path = self.depth_dir / f"{loc_id}_depth.png"
-        
-        # Check if already processed
-        final_pano = self.processed_dir / f"{loc_id}_panorama.jpg"
-        final_depth = self.processed_dir / f"{loc_id}_depth.png"
-        
-        if self.skip_existing and final_pano.exists() and final_depth.exists():
-            logger.info("Location already processed, skipping...")
-            processing_time = (datetime.now() - start_time).total_seconds()
-            return PipelineResult(
-                success=True,
-                location_name=name,
-                pano_id=pano_id,
-                panorama_path=str(final_pano),
-                depth_path=str(final_depth),
-                processing_time_seconds=processing_time,
-                metadata={
-                    "lat": actual_lat,
-                    "lng": actual_lng,
-                    "description": description,
-                    "skipped": True
-                }
-            )
+        job.metadata = metadata
+        job.pano_id = metadata.get("pano_id")
+        job.actual_lat = metadata.get("location", {}).get("lat", job.lat)
+        job.actual_lng = metadata.get("location", {}).get("lng", job.lng)
+        
+        logger.info(f"Found panorama: {job.pano_id}")
         
-        # Step 2: Download tiles
+        self._set_paths(job, self._get_location_id(job.name, job.actual_lat, job.actual_lng,
+                                                   job.pano_id))
+        
+        checkpoint = (job.index or {}).get("checkpoint", {})
+        if checkpoint.get("failed") or checkpoint.get("stage", "finalize") != "finalize":
+            done = ["download"] if "download" in job.index else []
+            done += [stage for stage, suffix in ARTIFACT_SUFFIXES.items()
+                     if stage in job.index and self.store.get(job.index[stage]["key"], suffix)]
+            logger.info(f"Resuming after {'failed ' if checkpoint.get('failed') else ''}"
+                        f"{checkpoint.get('stage')} stage (checkpointed: {', '.join(done) or 'none'})")
+    
+    def _set_paths(self, job: LocationJob, loc_id: str):
+        """Output paths (links to artifacts in the store) and the store index"""
+        job.loc_id = loc_id
+        job.tiles_path = self.tiles_dir / loc_id
+        job.stitched_path = self.stitched_dir / f"{loc_id}_pano.jpg"
+        job.upscaled_path = self.upscaled_dir / f"{loc_id}_4x.jpg"
+        job.depth_path = self.depth_dir / f"{loc_id}_depth.png"
+        job.final_pano = self.processed_dir / f"{loc_id}_panorama.jpg"
+        job.final_depth = self.processed_dir / f"{loc_id}_depth.png"
+        
+        job.index = self.store.load_index(loc_id)
+    
+    def download(self, job: LocationJob):
+        """Step 2: download Street View tiles and key the stitch on their checksums"""
         logger.info("\n[Step 2/4] Downloading Street View tiles...")
         
-        if not tiles_path.exists() or not list(tiles_path.glob("*.jpg")):
-            tiles = self.downloader.download_tiles(pano_id, tiles_path)
-            if not tiles:
-                return PipelineResult(
-                    success=False,
-                    location_name=name,
-                    pano_id=pano_id,
-                    error="Failed to download tiles"
-                )
+        if self._tiles_trusted(job):
+            logger.info(f"Using existing tiles in {job.tiles_path}")
         else:
-            logger.info(f"Using existing tiles in {tiles_path}")
+            # Tiles land in a partial directory, renamed once complete; a
+            # retry after a crash or failed tiles only fetches those missing
+            partial = self._partial_tiles_path(job)
+            tiles = self.downloader.download_tiles(job.pano_id, partial)
+            if len(tiles) < TILE_COUNT:
+                job.fail(f"Failed to download tiles ({len(tiles)}/{TILE_COUNT}); "
+                         f"the next run fetches the rest")
+                return
+            if job.tiles_path.exists():
+                shutil.rmtree(job.tiles_path)
+            os.replace(partial, job.tiles_path)
+            self._key_stitch(job)
         
-        # Step 3: Stitch panorama
-        logger.info("\n[Step 3/4] Stitching equirectangular panorama...")
+        job.key_params["download"] = {
+            "tiles": job.key_params["stitch"]["tiles"],
+            "count": len(list(job.tiles_path.glob("tile_*.jpg")))
+        }
+    
+    def _partial_tiles_path(self, job: LocationJob) -> Path:
+        return self.tiles_dir / f".{job.loc_id}.partial"
+    
+    def _tiles_trusted(self, job: LocationJob, verify: bool = True) -> bool:
+        """
+        Whether the existing tiles can be used, keying the stitch on them.
         
-        if not stitched_path.exists():
-            if not self.downloader.stitch_equirectangular(tiles_path, stitched_path):
-                return PipelineResult(
-                    success=False,
-                    location_name=name,
-                    pano_id=pano_id,
-                    error="Failed to stitch panorama"
-                )
+        The set must be complete, and match the checksum checkpointed when
+        it was downloaded. Tiles from before checkpoints must all decode
+        (skipped with verify=False).
+        """
+        if len(list(job.tiles_path.glob("tile_*.jpg"))) < TILE_COUNT:
+            return False
+        self._key_stitch(job)
+        state = (job.index or {}).get("download")
+        if state is not None:
+            if state.get("tiles") == job.key_params["stitch"]["tiles"]:
+                return True
+            logger.warning(f"Tiles in {job.tiles_path} do not match their checkpoint")
+            return False
+        return not verify or tiles_readable(job.tiles_path)
+    
+    # Artifact keys, shared by the stages and plan_location()
+    
+    def _key_stitch(self, job: LocationJob):
+        with tracer.span("checksum", cat="io"):
+            digest = tiles_digest(job.tiles_path)
+        job.key_stage("stitch", self.store, tiles=digest, width=STITCH_WIDTH)
+    
+    def _key_upscale(self, job: LocationJob, upscaler: 'AIUpscaler'):
+        job.key_stage("upscale", self.store, input=job.keys["stitch"], **upscaler.fingerprint())
+    
+    def _key_depth(self, job: LocationJob, depth_estimator: 'DepthEstimator',
+                   sample_path: Optional[Path] = None):
+        job.key_stage("depth", self.store, input=job.keys["upscale"],
+                      **depth_estimator.fingerprint(sample_path))
+    
+    def _cached_output(self, job: LocationJob, stage: str, link_path: Path) -> Optional[Path]:
+        """
+        Existing output for a stage's key: the stored artifact, or an output
+        from before the store existed for a location it has never indexed
+        (adopted by _artifact). None if the stage has to run.
+        """
+        if not self.skip_existing:
+            return None
+        path = self.store.get(job.keys[stage], ARTIFACT_SUFFIXES[stage])
+        if path is None and job.index is None and link_path.exists():
+            return link_path
+        return path
+    
+    def _artifact(self, job: LocationJob, stage: str, link_path: Path,
+                  produce: Callable[[Path], bool]) -> Optional[Path]:
+        """
+        Store path of a stage's output, running produce(tmp_path) only on a miss.
+        
+        The artifact is also linked at link_path (the stitched/, upscaled/
+        and depth/ names other scripts read). Outputs from before the store
+        existed are adopted once, for locations the store has never indexed.
+        """
+        key = job.keys[stage]
+        suffix = ARTIFACT_SUFFIXES[stage]
+        with tracer.span("store_lookup", cat="io"):
+            path = self._cached_output(job, stage, link_path)
+        
+        if path == link_path:
+            path = self.store.adopt(key, suffix, link_path)
+            logger.info(f"Adopted existing {stage} output: {link_path}")
+        elif path is not None:
+            logger.info(f"Using cached {stage} output ({key[:12]})")
+        
+        if path is not None:
+            job.cached_stages.append(stage)
         else:
-            logger.info(f"Using existing stitched panorama: {stitched_path}")
+            job.cached = False
+            tmp = self.store.temp_path(key, suffix)
+            try:
+                if not produce(tmp):
+                    return None
+                path = self.store.put(key, suffix, tmp)
+            finally:
+                tmp.unlink(missing_ok=True)
         
-        # Step 4: Upscale with Real-ESRGAN
+        link_or_copy(path, link_path)
+        return path
+    
+    def stitch(self, job: LocationJob, executor: Optional[Executor] = None):
+        """Step 3: stitch tiles, optionally in an executor (e.g. a process pool)"""
+        logger.info("\n[Step 3/4] Stitching equirectangular panorama...")
+        
+        def produce(tmp: Path) -> bool:
+            if executor is not None:
+                return executor.submit(
+                    stitch_equirectangular, job.tiles_path, tmp, STITCH_WIDTH
+                ).result()
+            return self.downloader.stitch_equirectangular(job.tiles_path, tmp, STITCH_WIDTH)
+        
+        if self._artifact(job, "stitch", job.stitched_path, produce) is None:
+            job.fail("Failed to stitch panorama")
+    
+    def upscale(self, job: LocationJob, upscaler: Optional['AIUpscaler'] = None):
+        """Step 4a: upscale with Real-ESRGAN, falling back to the stitched image"""
         logger.info("\n[Step 4/4a] Upscaling with Real-ESRGAN...")
+        upscaler = upscaler or self.upscaler
         
-        if not upscaled_path.exists():
-            if not self.upscaler.upscale(stitched_path, upscaled_path):
-                # Continue with un-upscaled version
-                logger.warning("Upscaling failed, using original resolution")
-                upscaled_path = stitched_path
-        else:
-            logger.info(f"Using existing upscaled image: {upscaled_path}")
+        if not self.memory_plan.upscale:
+            logger.warning("Upscaling skipped: it does not fit the memory budget")
+            job.upscaled_path = job.stitched_path
+            job.keys["upscale"] = job.keys["stitch"]
+            return
         
-        # Step 5: Generate depth map
+        self._key_upscale(job, upscaler)
+        if self._artifact(job, "upscale", job.upscaled_path,
+                          lambda tmp: upscaler.upscale(job.stitched_path, tmp)) is None:
+            # Continue with un-upscaled version
+            logger.warning("Upscaling failed, using original resolution")
+            job.upscaled_path = job.stitched_path
+            job.keys["upscale"] = job.keys["stitch"]
+    
+    def estimate_depth(self, job: LocationJob,
+                       depth_estimator: Optional['DepthEstimator'] = None):
+        """Step 4b: generate the depth map"""
         logger.info("\n[Step 4/4b] Generating depth map with Depth Anything v2...")
+        depth_estimator = depth_estimator or self.depth_estimator
         
-        if not depth_path.exists():
-            if not self.depth_estimator.estimate(upscaled_path, depth_path):
-                return PipelineResult(
-                    success=False,
-                    location_name=name,
-                    pano_id=pano_id,
-                    panorama_path=str(upscaled_path),
-                    error="Failed to generate depth map"
-                )
-        else:
-            logger.info(f"Using existing depth map: {depth_path}")
-        
-        # Copy final outputs to processed directory
-        import shutil
-        shutil.copy2(upscaled_path, final_pano)
-        shutil.copy2(depth_path, final_depth)
+        self._key_depth(job, depth_estimator, job.upscaled_path)
+        if self._artifact(job, "depth", job.depth_path,
+                          lambda tmp: depth_estimator.estimate(job.upscaled_path, tmp)) is None:
+            job.fail("Failed to generate depth map", panorama_path=str(job.upscaled_path))
+    
+    def finalize(self, job: LocationJob):
+        """Link final outputs into the processed directory"""
+        with tracer.span("promote", cat="io"):
+            promoted = [
+                link_or_copy(job.upscaled_path, job.final_pano),
+                link_or_copy(job.depth_path, job.final_depth),
+            ]
+        skipped = job.cached and promoted == [None, None]
+        job.key_params["promote"] = {"panorama": job.keys["upscale"], "depth": job.keys["depth"]}
         
-        processing_time = (datetime.now() - start_time).total_seconds()
+        processing_time = job.elapsed()
         
         logger.info("\n" + "=" * 60)
-        logger.info("✓ Processing complete!")
-        logger.info(f"  Panorama: {final_pano}")
-        logger.info(f"  Depth:    {final_depth}")
+        if skipped:
+            logger.info("Location already processed with identical inputs, skipping...")
+        else:
+            logger.info("✓ Processing complete!")
+        logger.info(f"  Panorama: {job.final_pano}")
+        logger.info(f"  Depth:    {job.final_depth}")
         logger.info(f"  Time:     {processing_time:.1f}s")
         logger.info("=" * 60)
         
-        return PipelineResult(
+        metadata = {
+            "lat": job.actual_lat,
+            "lng": job.actual_lng,
+            "description": job.description,
+            "date_captured": job.metadata.get("date", ""),
+            "copyright": job.metadata.get("copyright", ""),
+            "artifacts": dict(job.keys),
+            "cached_stages": list(job.cached_stages)
+        }
+        if skipped:
+            metadata["skipped"] = True
+        
+        job.result = PipelineResult(
             success=True,
-            location_name=name,
-            pano_id=pano_id,
-            panorama_path=str(final_pano),
-            upscaled_path=str(upscaled_path),
-            depth_path=str(final_depth),
+            location_name=job.name,
+            pano_id=job.pano_id,
+            panorama_path=str(job.final_pano),
+            upscaled_path=str(job.upscaled_path),
+            depth_path=str(job.final_depth),
             processing_time_seconds=processing_time,
-            metadata={
-                "lat": actual_lat,
-                "lng": actual_lng,
-                "description": description,
-                "date_captured": metadata.get("date", ""),
-                "copyright": metadata.get("copyright", "")
-            }
+            metadata=metadata
+        )
+
+
+class PipelineScheduler:
+    """
+    Runs FullPipeline stages as queue-connected worker pools.
+    
+    Stages:
+    - download: I/O threads for metadata and tile downloads
+    - stitch:   threads feeding a process pool (stitching is CPU-bound)
+    - model:    threads that each own an upscaler and depth estimator,
+                so model weights stay loaded on one worker
+    
+    Stages are joined by bounded queues, so a slow stage blocks the ones
+    upstream instead of letting finished work pile up. Throughput is set
+    by the slowest stage rather than the sum of all stages.
+    """
+    
+    def __init__(self, pipeline: 'FullPipeline',
+                 workers: Optional[Dict[str, int]] = None,
+                 queue_size: int = STAGE_QUEUE_SIZE):
+        self.pipeline = pipeline
+        self.workers = dict(STAGE_WORKERS)
+        self.workers.update({k: v for k, v in (workers or {}).items() if v})
+        if pipeline.governor.enabled:
+            # Only as many workers as the memory budget allows
+            self.workers = pipeline.plan_memory(self.workers).workers
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stitch_pool = None
+        
+        # Model worker 0 reuses the pipeline's models; others get their own
+        self._models = [(pipeline.upscaler, pipeline.depth_estimator)]
+        for _ in range(1, self.workers["model"]):
+            self._models.append((
+                AIUpscaler(scale=pipeline.upscale_factor, tile=pipeline.upscaler.tile),
+                DepthEstimator(
+                    model_id=pipeline.depth_estimator.model_id,
+                    latency_budget=pipeline.depth_estimator.latency_budget,
+                    backend=pipeline.depth_estimator.backend,
+                    max_width=pipeline.depth_estimator.max_width
+                )
+            ))
+    
+    def _download(self, job: LocationJob, slot: int):
+        self.pipeline.run_stage(job, "prepare")
+        if job.result is None:
+            self.pipeline.run_stage(job, "download")
+    
+    def _stitch(self, job: LocationJob, slot: int):
+        self.pipeline.run_stage(job, "stitch", self._stitch_pool)
+    
+    def _model(self, job: LocationJob, slot: int):
+        upscaler, depth_estimator = self._models[slot]
+        self.pipeline.run_stage(job, "upscale", upscaler)
+        if job.result is None:
+            self.pipeline.run_stage(job, "estimate_depth", depth_estimator)
+        if job.result is None:
+            self.pipeline.run_stage(job, "finalize")
+    
+    def _worker(self, stage: str, slot: int, fn, inbox: queue.Queue,
+                outbox: queue.Queue, remaining: Dict[str, int], downstream: int):
+        while True:
+            job = inbox.get()
+            if job is None:
+                break
+            if self._stop.is_set():
+                continue
+            if job.result is None:
+                try:
+                    fn(job, slot)
+                except Exception as e:
+                    logger.error(f"{stage} failed for {job.name}: {e}")
+                    job.fail(str(e))
+            outbox.put(job)
+        
+        # The last worker of a stage shuts down the next one
+        with self._lock:
+            remaining[stage] -= 1
+            last = remaining[stage] == 0
+        if last:
+            for _ in range(downstream):
+                outbox.put(None)
+    
+    def run(self, locations: Iterable[Dict[str, Any]],
+            on_result: Optional[Callable[[Dict[str, Any], PipelineResult], None]] = None
+            ) -> List[PipelineResult]:
+        """
+        Process locations (dicts with name/lat/lng/pano_id/description).
+        
+        Results arrive in completion order; on_result is called for each
+        from the calling thread. On KeyboardInterrupt, in-flight work is
+        abandoned and the interrupt is re-raised.
+        """
+        stages = [
+            ("download", self._download),
+            ("stitch", self._stitch),
+            ("model", self._model),
+        ]
+        counts = [self.workers[name] for name, _ in stages]
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(stages) + 1)]
+        remaining = {name: count for (name, _), count in zip(stages, counts)}
+        
+        logger.info("Stage workers: " + ", ".join(
+            f"{name}={count}" for (name, _), count in zip(stages, counts)))
+        
+        self._stop.clear()
+        self._stitch_pool = ProcessPoolExecutor(
+            max_workers=self.workers["stitch"],
+            mp_context=multiprocessing.get_context("spawn")
         )
+        
+        threads = []
+        for i, (name, fn) in enumerate(stages):
+            downstream = counts[i + 1] if i + 1 < len(stages) else 1
+            for slot in range(counts[i]):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(name, slot, fn, queues[i], queues[i + 1], remaining, downstream),
+                    name=f"pipeline-{name}-{slot}",
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+        
+        def feed():
+            for loc in locations:
+                if self._stop.is_set():
+                    break
+                job = LocationJob(
+                    name=loc.get("name", "Unknown"),
+                    lat=loc.get("lat"),
+                    lng=loc.get("lng"),
+                    pano_id=loc.get("pano_id"),
+                    description=loc.get("description", ""),
+                    source=loc
+                )
+                queues[0].put(job)
+            for _ in range(counts[0]):
+                queues[0].put(None)
+        
+        feeder = threading.Thread(target=feed, name="pipeline-feed", daemon=True)
+        feeder.start()
+        
+        results = []
+        try:
+            while True:
+                job = queues[-1].get()
+                if job is None:
+                    break
+                results.append(job.result)
+                if on_result:
+                    on_result(job.source, job.result)
+        except BaseException:
+            self._stop.set()
+            self._stitch_pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        
+        for t in threads:
+            t.join()
+        self._stitch_pool.shutdown()
+        return results
+
+
+def add_stage_arguments(parser: argparse.ArgumentParser):
+    """Add stage-pipelined scheduling options (used by batch_process.py)"""
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Overlap download, stitch and model stages across locations")
+    parser.add_argument("--download-workers", type=int,
+                        help=f"Download threads (default: {STAGE_WORKERS['download']})")
+    parser.add_argument("--stitch-workers", type=int,
+                        help=f"Stitching processes (default: {STAGE_WORKERS['stitch']})")
+    parser.add_argument("--model-workers", type=int,
+                        help=f"Upscale/depth workers, each with its own models "
+                             f"(default: {STAGE_WORKERS['model']})")
+
+
+def stage_workers_from_args(args: argparse.Namespace) -> Dict[str, int]:
+    """Stage worker counts given on the command line"""
+    return {
+        "download": args.download_workers,
+        "stitch": args.stitch_workers,
+        "model": args.model_workers,
+    }
+
+
+def add_depth_arguments(parser: argparse.ArgumentParser):
+    """Add depth model selection options (shared with batch_process.py)"""
+    parser.add_argument("--depth-model", choices=list(DEPTH_MODELS), default="small",
+                        help="Depth model size (ignored with --depth-budget)")
+    parser.add_argument("--depth-budget", type=float,
+                        help="Depth latency budget in seconds per image; "
+                             "picks the largest model that fits on this machine")
+    parser.add_argument("--depth-backend", choices=["torch", "onnx"], default=DEPTH_BACKEND,
+                        help="Depth inference backend (onnx runs an exported model on CPU)")
 
 
 def main():
@@ -652,12 +1516,16 @@ Examples:
     parser.add_argument("--config", type=str, help="JSON config file with locations")
     parser.add_argument("--location", type=str, help="Location name from config")
     parser.add_argument("--no-skip", action="store_true", help="Reprocess existing files")
+    add_depth_arguments(parser)
+    add_memory_arguments(parser)
+    add_trace_arguments(parser)
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
     
     args = parser.parse_args()
     
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
+    start_tracing(args)
     
     # Determine output directory
     if args.output:
@@ -668,7 +1536,11 @@ Examples:
     # Initialize pipeline
     pipeline = FullPipeline(
         output_base=output_base,
-        skip_existing=not args.no_skip
+        skip_existing=not args.no_skip,
+        depth_model_id=DEPTH_MODELS[args.depth_model],
+        depth_latency_budget=args.depth_budget,
+        depth_backend=args.depth_backend,
+        memory_budget_mb=args.memory_budget
     )
     
     # Process from config file
@@ -701,10 +1573,6 @@ Examples:
                 pano_id=loc.get("pano_id"),
                 description=loc.get("description", "")
             )
-            
-            if not result.success:
-                logger.error(f"Failed: {result.error}")
-                return 1
         else:
             logger.error("Specify --location when using --config")
             return 1
@@ -717,10 +1585,6 @@ Examples:
             lng=args.lng,
             description=args.description
         )
-        
-        if not result.success:
-            logger.error(f"Failed: {result.error}")
-            return 1
     
     elif args.pano_id:
         result = pipeline.process_location(
@@ -728,15 +1592,18 @@ Examples:
             pano_id=args.pano_id,
             description=args.description
         )
-        
-        if not result.success:
-            logger.error(f"Failed: {result.error}")
-            return 1
     
     else:
         parser.print_help()
         return 1
     
+    pipeline.governor.log_summary()
+    export_traces(args)
+    
+    if not result.success:
+        logger.error(f"Failed: {result.error}")
+        return 1
+    
     # Print result summary
     print("\n" + json.dumps(asdict(result), indent=2))
     return 0
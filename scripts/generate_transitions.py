@@ -7,21 +7,43 @@ than a simple crossfade.
 
 Usage:
     python generate_transitions.py [panoramas_dir] [output_dir] [--frames N]
+    python generate_transitions.py --workers 8     # Render pairs in parallel
+    python generate_transitions.py --viewport --headings ../ai-motion/locations.json
+    python generate_transitions.py --plan graph    # Only edges from routes/nearby
 
 Output:
     - Image sequences for each transition
     - Optional: MP4 video files
+
+Frames are streamed from the renderer to the writers through a bounded
+queue, so memory use does not grow with frame count.
 """
 
 import os
 import sys
+import re
 import json
+import time
+import hashlib
+import queue
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field, replace
+from multiprocessing import shared_memory
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional
 import numpy as np
 from PIL import Image
 import cv2
 
+from tracing import tracer, add_trace_arguments, start_tracing, export_traces
+from memory_governor import MB, MemoryGovernor, add_memory_arguments, process_tree_rss
+
 # Progress
 try:
     from tqdm import tqdm
@@ -34,13 +56,103 @@ except ImportError:
 # Configuration
 DEFAULT_FRAMES = 30  # 1 second at 30fps
 TRANSITION_MODE = "depth_warp"  # "depth_warp", "crossfade", "morph"
+FRAME_QUEUE_SIZE = 4  # Frames buffered between renderer and writers
+SEQUENCE_FORMAT = "jpg"  # "jpg", "png", "webp"
+SEQUENCE_QUALITY = 95  # JPEG/WebP quality
+ENCODE_WORKERS = min(4, os.cpu_count() or 1)  # cv2.imwrite releases the GIL
+ASSET_CACHE_MB = 2048  # Decoded panoramas/depth maps kept between pairs
+FLOW_METHOD = "farneback"  # Morph optical flow: "farneback" or "dis" (faster)
+FLOW_SCALE = 1.0  # Morph flow is estimated at this fraction of full resolution
+VIDEO_CODEC = "libx264"
+VIDEO_PRESET = "medium"
+VIDEO_CRF = 20
+SYMMETRIC_MODES = {"crossfade"}  # B->A is A->B played backwards
+MANIFEST_VERSION = 1  # Bump when rendering changes output for identical inputs
+PARALLAX_FRACTION = 0.05  # Max depth-warp shift as a fraction of the full 360° width
+VERTICAL_PARALLAX = 0.3  # Vertical shift relative to horizontal shift
+DEPTH_TEXTURE_WIDTH = 1024  # Depth texture width for parametric export
+PARAMS_VERSION = 1  # Parametric transition JSON format
+
+# Memory model for plan_transition_memory(): bytes per rendered pixel held by
+# a pair's engine (coordinate grid, displacement fields, remap maps, blend
+# buffers or optical flow), plus 8 bytes per input pixel for both panoramas
+# and depth maps, and 3 per pixel for each buffered frame
+RENDER_BYTES_PER_PIXEL = {"depth_warp": 80, "crossfade": 6, "morph": 64}
+INPUT_BYTES_PER_PIXEL = 8
+WORKER_PROCESS_BYTES = 150 * MB  # Interpreter with numpy/OpenCV per render worker
+
+# Blend masks: alpha = clip(field * slope + offset + speed * progress, 0, 1),
+# where field is x/width for wipe and distance from centre (0-1) for radial
+MASK_STYLES = {
+    "wipe": {"slope": 5.0, "offset": 0.5, "speed": -5.0},
+    "radial": {"slope": -5.0, "offset": 0.5, "speed": 7.5},
+}
+
+
+@dataclass
+class Viewport:
+    """Perspective view rendered instead of the full equirectangular frame"""
+    fov: float = 100.0  # Horizontal field of view, degrees
+    width: int = 1920
+    height: int = 1080
+    pitch: float = 0.0
+    heading: float = 0.0  # Used when a pair has no heading of its own
+    
+    @property
+    def focal(self) -> float:
+        """Focal length in pixels"""
+        return (self.width / 2) / np.tan(np.radians(self.fov) / 2)
+    
+    @property
+    def max_shift(self) -> float:
+        """Depth-warp shift in viewport pixels matching the equirectangular parallax"""
+        return self.focal * np.radians(360.0 * PARALLAX_FRACTION)
+
+
+@dataclass
+class EncoderSettings:
+    """Video encoder settings for the ffmpeg pipe"""
+    codec: str = VIDEO_CODEC
+    preset: str = VIDEO_PRESET
+    crf: int = VIDEO_CRF
+    fps: int = 30
+    threads: int = 0  # ffmpeg threads per encode (0 = ffmpeg default)
+    preview_scale: Optional[float] = None  # Second, downscaled rendition
+
+
+@dataclass
+class TransitionSettings:
+    """Rendering and output settings applied to every pair"""
+    num_frames: int = DEFAULT_FRAMES
+    mode: str = TRANSITION_MODE
+    make_video: bool = True
+    make_sequence: bool = True
+    sequence_format: str = SEQUENCE_FORMAT
+    sequence_quality: int = SEQUENCE_QUALITY
+    encode_workers: int = ENCODE_WORKERS
+    flow_scale: float = FLOW_SCALE
+    flow_method: str = FLOW_METHOD
+    viewport: Optional[Viewport] = None
+    encoder: EncoderSettings = field(default_factory=EncoderSettings)
+    queue_size: int = FRAME_QUEUE_SIZE  # Frames buffered between renderer and writers
+
+
+def load_image(path: Path) -> np.ndarray:
+    """Load a panorama image as an RGB array"""
+    return np.array(Image.open(path).convert("RGB"))
+
+
+def load_depth(path: Path, shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """Load a depth map, resized to (height, width) if given"""
+    depth = np.array(Image.open(path).convert("L"))
+    if shape is not None and depth.shape != shape:
+        depth = cv2.resize(depth, (shape[1], shape[0]))
+    return depth
 
 
 def load_image_pair(pano1_path: Path, pano2_path: Path) -> Tuple[np.ndarray, np.ndarray]:
     """Load two panorama images as numpy arrays"""
-    img1 = np.array(Image.open(pano1_path).convert("RGB"))
-    img2 = np.array(Image.open(pano2_path).convert("RGB"))
-    return img1, img2
+    return load_image(pano1_path), load_image(pano2_path)
 
 
 def load_depth_pair(
@@ -48,9 +160,194 @@ def load_depth_pair(
     depth2_path: Path
 ) -> Tuple[np.ndarray, np.ndarray]:
     """Load two depth maps as numpy arrays"""
-    depth1 = np.array(Image.open(depth1_path).convert("L"))
-    depth2 = np.array(Image.open(depth2_path).convert("L"))
-    return depth1, depth2
+    return load_depth(depth1_path), load_depth(depth2_path)
+
+
+def load_pair_assets(pair: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Load a pair's images and depth maps, with depth resized to match"""
+    img1, img2 = load_image_pair(pair['pano1'], pair['pano2'])
+    depth1 = load_depth(pair['depth1'], img1.shape[:2])
+    depth2 = load_depth(pair['depth2'], img2.shape[:2])
+    return img1, img2, depth1, depth2
+
+
+class AssetCache:
+    """
+    Byte-bounded LRU cache of decoded panoramas and depth maps.
+    
+    Entries are keyed by path and mtime (depth maps also by the image
+    shape they were resized to), so chained pairs A->B, B->C decode B
+    once and a re-processed file is never served stale. Cached arrays are
+    read-only. prefetch_pair() decodes the next pair on a background
+    thread while the current one renders; concurrent requests for the
+    same asset wait for a single decode.
+    """
+    
+    def __init__(self, max_bytes: int = ASSET_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.decodes = 0
+        self.prefetcher = ThreadPoolExecutor(max_workers=1)
+    
+    def _get(self, key: tuple, load) -> np.ndarray:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            future = self.loading.get(key)
+            owner = future is None
+            if owner:
+                future = self.loading[key] = Future()
+        
+        if not owner:
+            return future.result()
+        
+        try:
+            array = load()
+        except Exception as e:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(e)
+            raise
+        
+        array.flags.writeable = False
+        with self.lock:
+            del self.loading[key]
+            self.decodes += 1
+            self.entries[key] = array
+            self.bytes += array.nbytes
+            # Evict least recently used, always keeping the newest entry
+            while self.bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted.nbytes
+        future.set_result(array)
+        return array
+    
+    def get_image(self, path: Path) -> np.ndarray:
+        key = ("image", str(path), path.stat().st_mtime_ns)
+        return self._get(key, lambda: load_image(path))
+    
+    def get_depth(self, path: Path, shape: Tuple[int, int]) -> np.ndarray:
+        key = ("depth", str(path), path.stat().st_mtime_ns, shape)
+        return self._get(key, lambda: load_depth(path, shape))
+    
+    def get_pair(self, pair: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Same as load_pair_assets(), served from the cache"""
+        img1 = self.get_image(pair['pano1'])
+        img2 = self.get_image(pair['pano2'])
+        depth1 = self.get_depth(pair['depth1'], img1.shape[:2])
+        depth2 = self.get_depth(pair['depth2'], img2.shape[:2])
+        return img1, img2, depth1, depth2
+    
+    def prefetch_pair(self, pair: dict):
+        """Decode a pair's assets in the background (errors surface on get)"""
+        def prefetch():
+            try:
+                self.get_pair(pair)
+            except Exception:
+                pass
+        self.prefetcher.submit(prefetch)
+    
+    def close(self):
+        self.prefetcher.shutdown(wait=True)
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+
+def ease_in_out_cubic(t: float) -> float:
+    """Ease in-out cubic"""
+    if t < 0.5:
+        return 4 * t * t * t
+    return 1 - pow(-2 * t + 2, 3) / 2
+
+
+def frame_schedule(num_frames: int) -> List[float]:
+    """Eased progress value (0-1) for each frame of a transition"""
+    if num_frames < 2:
+        return [1.0] * num_frames
+    return [ease_in_out_cubic(i / (num_frames - 1)) for i in range(num_frames)]
+
+
+class CoordinateGrid:
+    """Base pixel coordinate maps (H, W), shared by every warp of that size"""
+    
+    def __init__(self, h: int, w: int):
+        self.h, self.w = h, w
+        self.x = np.empty((h, w), dtype=np.float32)
+        self.y = np.empty((h, w), dtype=np.float32)
+        self.x[:] = np.arange(w, dtype=np.float32)
+        self.y[:] = np.arange(h, dtype=np.float32)[:, np.newaxis]
+
+
+class DepthWarper:
+    """
+    Depth-based parallax warp of one image with precomputed displacement.
+    
+    The per-pixel shift for displacement=1 is computed once from the depth
+    map. Each warp() is then a scaled add into reused map buffers, a
+    conversion to fixed-point maps and a single cv2.remap. The returned
+    array is reused by the next call.
+    """
+    
+    def __init__(
+        self,
+        image: np.ndarray,
+        depth: np.ndarray,
+        direction: str = "forward",
+        grid: Optional[CoordinateGrid] = None,
+        max_shift: Optional[float] = None
+    ):
+        h, w = depth.shape
+        self.image = image
+        self.grid = grid if grid is not None else CoordinateGrid(h, w)
+        
+        # Near objects (dark) move more, far objects (bright) move less.
+        # Max shift in pixels at displacement 1 (default: 5% of width)
+        if max_shift is None:
+            max_shift = w * PARALLAX_FRACTION
+        if direction == "backward":
+            max_shift = -max_shift
+        
+        self.shift_x = (1.0 - depth.astype(np.float32) / 255.0) * np.float32(max_shift)
+        # Slight vertical parallax for realism
+        self.shift_y = self.shift_x * np.float32(VERTICAL_PARALLAX)
+        
+        # Reused per-frame buffers
+        self.map_x = np.empty((h, w), dtype=np.float32)
+        self.map_y = np.empty((h, w), dtype=np.float32)
+        self.map1 = np.empty((h, w, 2), dtype=np.int16)
+        self.map2 = np.empty((h, w), dtype=np.uint16)
+        self.out = np.empty_like(image)
+    
+    def warp(self, displacement: float) -> np.ndarray:
+        """Warp the image by displacement (0-1)"""
+        h, w = self.grid.h, self.grid.w
+        
+        cv2.scaleAdd(self.shift_x, displacement, self.grid.x, dst=self.map_x)
+        cv2.scaleAdd(self.shift_y, displacement, self.grid.y, dst=self.map_y)
+        np.clip(self.map_x, 0, w - 1, out=self.map_x)
+        np.clip(self.map_y, 0, h - 1, out=self.map_y)
+        
+        cv2.convertMaps(
+            self.map_x, self.map_y, cv2.CV_16SC2,
+            dstmap1=self.map1, dstmap2=self.map2
+        )
+        cv2.remap(
+            self.image,
+            self.map1,
+            self.map2,
+            interpolation=cv2.INTER_LINEAR,
+            dst=self.out,
+            borderMode=cv2.BORDER_REPLICATE
+        )
+        
+        return self.out
 
 
 def depth_warp(
@@ -63,6 +360,7 @@ def depth_warp(
     Warp an image using depth-based displacement.
     
     Creates a parallax effect where near objects move more than far objects.
+    For several frames of the same image use DepthWarper directly.
     
     Args:
         image: RGB image (H, W, 3)
@@ -73,48 +371,238 @@ def depth_warp(
     Returns:
         warped_image: Warped RGB image
     """
-    h, w = depth.shape
+    return DepthWarper(image, depth, direction).warp(displacement)
+
+
+class WarpSequence:
+    """
+    Depth-warped frames of one image over a transition's frame schedule.
+    
+    A location's forward (as source) or backward (as destination) warp
+    frames do not depend on the other panorama, so they can be shared by
+    every pair it takes part in. With a cache path, frames are replayed
+    from a memory-mapped .npy if another pair already rendered them;
+    otherwise they are rendered and recorded there. The file is renamed
+    into place only once all frames are written.
+    """
+    
+    def __init__(
+        self,
+        image: np.ndarray,
+        depth: np.ndarray,
+        direction: str,
+        max_shift: Optional[float] = None,
+        num_frames: Optional[int] = None,
+        cache_path: Optional[Path] = None
+    ):
+        self.image = image
+        self.depth = depth
+        self.direction = direction
+        self.max_shift = max_shift
+        self.grid = None
+        self.warper = None
+        self.cached = None
+        self.recording = None
+        self.recorded = 0
+        self.cache_path = cache_path
+        
+        if cache_path is not None and num_frames:
+            if cache_path.exists():
+                self.cached = np.load(cache_path, mmap_mode='r')
+            else:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                self._tmp_path = cache_path.with_name(f"{cache_path.stem}.{os.getpid()}.tmp.npy")
+                self.recording = np.lib.format.open_memmap(
+                    self._tmp_path, mode='w+', dtype=image.dtype,
+                    shape=(num_frames,) + image.shape
+                )
     
-    # Normalize depth to 0-1
-    depth_norm = depth.astype(np.float32) / 255.0
+    def warp(self, displacement: float, index: Optional[int] = None) -> np.ndarray:
+        """Warped frame at this displacement (index selects the cached frame)"""
+        if self.cached is not None and index is not None:
+            return self.cached[index]
+        
+        if self.warper is None:
+            self.warper = DepthWarper(
+                self.image, self.depth, self.direction, self.grid, self.max_shift
+            )
+        out = self.warper.warp(displacement)
+        
+        if self.recording is not None and index is not None:
+            self.recording[index] = out
+            self.recorded += 1
+            if self.recorded == len(self.recording):
+                self.recording.flush()
+                self.recording = None
+                os.replace(self._tmp_path, self.cache_path)
+        
+        return out
+
+
+class TransitionMask:
+    """
+    Blend mask with the progress-independent shape precomputed.
     
-    # Invert so far=0, near=1 (near objects should move more)
-    depth_factor = 1.0 - depth_norm
+    Every style in MASK_STYLES is clip(field + offset(progress), 0, 256)
+    in 8.8 fixed point, so a frame only adds a scalar to the field. Wipe
+    masks are a single row that broadcasts over the image.
+    """
     
-    # Create displacement field
-    # Near objects move more, far objects move less
-    max_shift = displacement * w * 0.05  # Max 5% of width
+    def __init__(self, shape: Tuple[int, int], style: str = "fade"):
+        h, w = shape
+        self.style = style
+        
+        if style == "wipe":
+            x = np.linspace(0, 1, w, dtype=np.float32)
+            self.field = (x * 256.0 * MASK_STYLES[style]["slope"])[np.newaxis, :]
+        elif style == "radial":
+            y, x = np.ogrid[:h, :w]
+            cx, cy = w / 2, h / 2
+            dist = np.sqrt((x - cx) ** 2 + (y - cy) ** 2)
+            dist_norm = dist / np.sqrt(cx ** 2 + cy ** 2)
+            self.field = (dist_norm * 256.0 * MASK_STYLES[style]["slope"]).astype(np.float32)
+        else:
+            self.style = "fade"
+            self.field = None
+        
+        if self.field is not None:
+            self._scratch = np.empty(self.field.shape, dtype=np.float32)
+            self.alpha = np.empty(self.field.shape + (1,), dtype=np.uint16)
+            self.inv_alpha = np.empty_like(self.alpha)
     
-    if direction == "backward":
-        max_shift = -max_shift
+    def _offset(self, progress: float) -> float:
+        params = MASK_STYLES[self.style]
+        return 256.0 * (params["offset"] + params["speed"] * progress)
     
-    # Horizontal displacement based on depth
-    shift_x = (depth_factor * max_shift).astype(np.float32)
+    def update(self, progress: float) -> bool:
+        """
+        Compute alpha/inv_alpha (uint16, 0-256) for this progress.
+        
+        Returns:
+            False for uniform masks, which need no per-pixel alpha
+        """
+        if self.field is None:
+            return False
+        
+        np.add(self.field, self._offset(progress), out=self._scratch)
+        np.clip(self._scratch, 0, 256, out=self._scratch)
+        np.copyto(self.alpha[..., 0], self._scratch, casting='unsafe')
+        np.subtract(256, self.alpha, out=self.inv_alpha)
+        return True
+
+
+class TransitionEngine:
+    """
+    Renders frames of one panorama pair.
     
-    # Also add slight vertical parallax for realism
-    shift_y = (depth_factor * max_shift * 0.3).astype(np.float32)
+    Everything that does not depend on progress - coordinate grid, depth
+    displacement fields, mask shape and frame buffers - is set up once per
+    pair. render() then costs one remap per source plus an integer blend.
+    """
     
-    # Create mesh grid
-    y_coords, x_coords = np.meshgrid(np.arange(h), np.arange(w), indexing='ij')
+    def __init__(
+        self,
+        img1: np.ndarray,
+        img2: np.ndarray,
+        depth1: np.ndarray,
+        depth2: np.ndarray,
+        mode: str = "depth_warp",
+        mask_style: str = "fade",
+        flow_scale: float = FLOW_SCALE,
+        flow_method: str = FLOW_METHOD,
+        max_shift: Optional[float] = None,
+        num_frames: Optional[int] = None,
+        warp_cache: Tuple[Optional[Path], Optional[Path]] = (None, None)
+    ):
+        self.img1, self.img2 = img1, img2
+        self.mode = mode
+        self.out = np.empty_like(img1)
+        
+        if mode == "depth_warp":
+            self.warper1 = WarpSequence(
+                img1, depth1, "forward", max_shift, num_frames, warp_cache[0]
+            )
+            self.warper2 = WarpSequence(
+                img2, depth2, "backward", max_shift, num_frames, warp_cache[1]
+            )
+            self.warper1.grid = self.warper2.grid = CoordinateGrid(*depth1.shape) \
+                if self.warper1.cached is None and self.warper2.cached is None else None
+            self.mask = TransitionMask(img1.shape[:2], mask_style)
+            if self.mask.field is not None:
+                self._acc = np.empty(img1.shape, dtype=np.uint16)
+                self._tmp = np.empty(img1.shape, dtype=np.uint16)
+        elif mode == "morph":
+            self.morpher = FlowMorpher(img1, img2, flow_scale, flow_method)
     
-    # Apply displacement
-    map_x = (x_coords + shift_x).astype(np.float32)
-    map_y = (y_coords + shift_y).astype(np.float32)
+    def _blend(self, src1: np.ndarray, src2: np.ndarray, progress: float):
+        """Blend src1 -> src2 into self.out with the transition mask"""
+        if not self.mask.update(progress):
+            cv2.addWeighted(src1, 1 - progress, src2, progress, 0, dst=self.out)
+            return
+        
+        # out = (src1 * (256 - a) + src2 * a + 128) >> 8, in uint16
+        np.multiply(src1, self.mask.inv_alpha, out=self._acc)
+        np.multiply(src2, self.mask.alpha, out=self._tmp)
+        np.add(self._acc, self._tmp, out=self._acc)
+        np.add(self._acc, 128, out=self._acc)
+        np.right_shift(self._acc, 8, out=self._acc)
+        np.copyto(self.out, self._acc, casting='unsafe')
     
-    # Clamp to valid range
-    map_x = np.clip(map_x, 0, w - 1)
-    map_y = np.clip(map_y, 0, h - 1)
+    def render(self, progress: float, index: Optional[int] = None) -> np.ndarray:
+        """
+        Render the frame at eased progress (0-1).
+        
+        index is the frame's position in the schedule, needed to replay
+        or record shared warp frames.
+        
+        Returns:
+            Frame buffer, overwritten by the next render() call
+        """
+        if self.mode == "crossfade":
+            cv2.addWeighted(self.img1, 1 - progress, self.img2, progress, 0, dst=self.out)
+            
+        elif self.mode == "depth_warp":
+            # Warp source forward (into the screen), destination backward (from behind)
+            warped1 = self.warper1.warp(progress, index)
+            warped2 = self.warper2.warp(1 - progress, index)
+            self._blend(warped1, warped2, progress)
+            
+        elif self.mode == "morph":
+            # Optical flow-based morph, flow computed once per pair
+            self.morpher.morph(progress, out=self.out)
+            
+        else:
+            self.out[:] = self.img1 if progress < 0.5 else self.img2
+        
+        return self.out
+
+
+def iter_transition_frames(
+    img1: np.ndarray,
+    img2: np.ndarray,
+    depth1: np.ndarray,
+    depth2: np.ndarray,
+    num_frames: int,
+    mode: str = "depth_warp",
+    mask_style: str = "fade",
+    flow_scale: float = FLOW_SCALE,
+    flow_method: str = FLOW_METHOD,
+    max_shift: Optional[float] = None,
+    warp_cache: Tuple[Optional[Path], Optional[Path]] = (None, None)
+) -> Iterator[np.ndarray]:
+    """
+    Yield transition frames one at a time.
     
-    # Remap image
-    warped = cv2.remap(
-        image,
-        map_x,
-        map_y,
-        interpolation=cv2.INTER_LINEAR,
-        borderMode=cv2.BORDER_REPLICATE
+    Each yielded array is a reused buffer and is only valid until the
+    next frame is requested; copy it to keep it. warp_cache gives .npy
+    paths for sharing the source/destination warp frames between pairs.
+    """
+    engine = TransitionEngine(
+        img1, img2, depth1, depth2, mode, mask_style, flow_scale, flow_method,
+        max_shift, num_frames, warp_cache
     )
-    
-    return warped
+    for i, eased in enumerate(frame_schedule(num_frames)):
+        yield engine.render(eased, i)
 
 
 def generate_transition_frames(
@@ -123,62 +611,34 @@ def generate_transition_frames(
     depth1: np.ndarray,
     depth2: np.ndarray,
     num_frames: int,
-    mode: str = "depth_warp"
+    mode: str = "depth_warp",
+    mask_style: str = "fade",
+    flow_scale: float = FLOW_SCALE,
+    flow_method: str = FLOW_METHOD
 ) -> List[np.ndarray]:
     """
     Generate transition frames between two panoramas.
     
+    Holds every frame in memory; use iter_transition_frames() with
+    stream_frames() for large panoramas.
+    
     Args:
         img1, img2: Source and destination images
         depth1, depth2: Corresponding depth maps
         num_frames: Number of intermediate frames
         mode: Transition mode
+        mask_style: Blend mask for depth_warp ("fade", "wipe", "radial")
+        flow_scale, flow_method: Optical flow settings for morph
     
     Returns:
         frames: List of transition frame arrays
     """
-    frames = []
-    
-    for i in range(num_frames):
-        # Progress from 0 to 1
-        t = i / (num_frames - 1)
-        
-        # Ease in-out cubic
-        if t < 0.5:
-            eased = 4 * t * t * t
-        else:
-            eased = 1 - pow(-2 * t + 2, 3) / 2
-        
-        if mode == "crossfade":
-            # Simple crossfade
-            frame = cv2.addWeighted(img1, 1 - eased, img2, eased, 0)
-            
-        elif mode == "depth_warp":
-            # Depth-warped transition with parallax
-            
-            # Warp source image forward (into the screen)
-            warped1 = depth_warp(img1, depth1, eased, direction="forward")
-            
-            # Warp destination image backward (from behind)
-            warped2 = depth_warp(img2, depth2, 1 - eased, direction="backward")
-            
-            # Blend with vignette for smoother transition
-            alpha = create_transition_mask(img1.shape[:2], eased)
-            
-            # Composite
-            frame = (warped1 * (1 - alpha[:, :, np.newaxis]) + 
-                    warped2 * alpha[:, :, np.newaxis]).astype(np.uint8)
-            
-        elif mode == "morph":
-            # Optical flow-based morph (more expensive)
-            frame = morph_transition(img1, img2, eased)
-            
-        else:
-            frame = img1 if t < 0.5 else img2
-        
-        frames.append(frame)
-    
-    return frames
+    return [
+        frame.copy() for frame in iter_transition_frames(
+            img1, img2, depth1, depth2, num_frames, mode, mask_style,
+            flow_scale, flow_method
+        )
+    ]
 
 
 def create_transition_mask(
@@ -224,6 +684,94 @@ def create_transition_mask(
     return np.full((h, w), progress, dtype=np.float32)
 
 
+def estimate_flow(
+    img1: np.ndarray,
+    img2: np.ndarray,
+    scale: float = FLOW_SCALE,
+    method: str = FLOW_METHOD
+) -> np.ndarray:
+    """
+    Optical flow from img1 to img2 at full resolution.
+    
+    With scale < 1 the flow is estimated on downscaled grayscale images
+    and upsampled, with vectors rescaled to full-resolution pixels.
+    
+    Returns:
+        flow: Float32 array (H, W, 2)
+    """
+    h, w = img1.shape[:2]
+    
+    # Convert to grayscale for flow calculation
+    gray1 = cv2.cvtColor(img1, cv2.COLOR_RGB2GRAY)
+    gray2 = cv2.cvtColor(img2, cv2.COLOR_RGB2GRAY)
+    
+    if scale != 1.0:
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        gray1 = cv2.resize(gray1, size, interpolation=cv2.INTER_AREA)
+        gray2 = cv2.resize(gray2, size, interpolation=cv2.INTER_AREA)
+    
+    if method == "dis":
+        dis = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_FAST)
+        flow = dis.calc(gray1, gray2, None)
+    else:
+        flow = cv2.calcOpticalFlowFarneback(
+            gray1, gray2, None,
+            pyr_scale=0.5, levels=3, winsize=15,
+            iterations=3, poly_n=5, poly_sigma=1.2, flags=0
+        )
+    
+    if scale != 1.0:
+        flow = cv2.resize(flow, (w, h), interpolation=cv2.INTER_LINEAR)
+        flow *= np.float32(1.0 / scale)
+    
+    return flow
+
+
+class FlowMorpher:
+    """
+    Optical flow morph between two images with the flow computed once.
+    
+    Each morph() scales the cached flow by t into reused map buffers and
+    runs one remap per image.
+    """
+    
+    def __init__(
+        self,
+        img1: np.ndarray,
+        img2: np.ndarray,
+        flow_scale: float = FLOW_SCALE,
+        flow_method: str = FLOW_METHOD,
+        grid: Optional[CoordinateGrid] = None
+    ):
+        h, w = img1.shape[:2]
+        self.img1, self.img2 = img1, img2
+        self.grid = grid if grid is not None else CoordinateGrid(h, w)
+        
+        flow = estimate_flow(img1, img2, flow_scale, flow_method)
+        self.flow_x = np.ascontiguousarray(flow[:, :, 0])
+        self.flow_y = np.ascontiguousarray(flow[:, :, 1])
+        
+        # Reused per-frame buffers
+        self.map_x = np.empty((h, w), dtype=np.float32)
+        self.map_y = np.empty((h, w), dtype=np.float32)
+        self.warped1 = np.empty_like(img1)
+        self.warped2 = np.empty_like(img2)
+    
+    def _warp(self, image: np.ndarray, amount: float, dst: np.ndarray):
+        cv2.scaleAdd(self.flow_x, amount, self.grid.x, dst=self.map_x)
+        cv2.scaleAdd(self.flow_y, amount, self.grid.y, dst=self.map_y)
+        cv2.remap(image, self.map_x, self.map_y, cv2.INTER_LINEAR, dst=dst)
+    
+    def morph(self, t: float, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Morph frame at progress t (0-1)"""
+        # Warp both images toward the middle
+        self._warp(self.img1, t, self.warped1)
+        self._warp(self.img2, -(1 - t), self.warped2)
+        
+        # Blend
+        return cv2.addWeighted(self.warped1, 1 - t, self.warped2, t, 0, dst=out)
+
+
 def morph_transition(
     img1: np.ndarray,
     img2: np.ndarray,
@@ -232,85 +780,328 @@ def morph_transition(
     """
     Create a morph transition using optical flow.
     More expensive but can produce smoother results for similar scenes.
+    For several frames of the same pair use FlowMorpher directly.
     """
-    # Convert to grayscale for flow calculation
-    gray1 = cv2.cvtColor(img1, cv2.COLOR_RGB2GRAY)
-    gray2 = cv2.cvtColor(img2, cv2.COLOR_RGB2GRAY)
+    return FlowMorpher(img1, img2).morph(t)
+
+
+def imwrite_params(format: str, quality: int = SEQUENCE_QUALITY) -> List[int]:
+    """OpenCV encoder parameters for an image format"""
+    format = format.lower()
+    if format in ['jpg', 'jpeg']:
+        return [cv2.IMWRITE_JPEG_QUALITY, quality]
+    if format == 'webp':
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return []
+
+
+class ImageSequenceWriter:
+    """
+    Writes frames as a numbered image sequence, encoding on a thread pool.
     
-    # Calculate optical flow
-    flow = cv2.calcOpticalFlowFarneback(
-        gray1, gray2, None,
-        pyr_scale=0.5, levels=3, winsize=15,
-        iterations=3, poly_n=5, poly_sigma=1.2, flags=0
-    )
+    write() converts the frame to BGR into one of a few reused buffers and
+    queues the encode. When every buffer is being encoded, write() blocks,
+    which holds back the renderer instead of queueing frames without bound.
+    """
+    
+    def __init__(
+        self,
+        output_dir: Path,
+        base_name: str,
+        format: str = SEQUENCE_FORMAT,
+        quality: int = SEQUENCE_QUALITY,
+        workers: int = ENCODE_WORKERS
+    ):
+        self.output_dir = output_dir
+        self.base_name = base_name
+        self.format = format
+        self.params = imwrite_params(format, quality)
+        self.count = 0
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        self.workers = max(1, workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.free = queue.Queue()
+        self.allocated = 0
+        self.futures = []
+    
+    def _acquire_buffer(self, frame: np.ndarray) -> np.ndarray:
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            pass
+        if self.allocated < self.workers * 2:
+            self.allocated += 1
+            return np.empty_like(frame)
+        return self.free.get()  # Backpressure: wait for an encode to finish
+    
+    def _encode(self, filepath: Path, frame_bgr: np.ndarray):
+        try:
+            if not cv2.imwrite(str(filepath), frame_bgr, self.params):
+                raise IOError(f"Failed to write {filepath}")
+        finally:
+            self.free.put(frame_bgr)
+    
+    def write(self, frame: np.ndarray):
+        filename = f"{self.base_name}_{self.count:04d}.{self.format}"
+        filepath = self.output_dir / filename
+        
+        # Replace rather than overwrite, in case the file is hardlinked
+        # into a derived (reversed) sequence
+        if filepath.exists():
+            filepath.unlink()
+        
+        # Convert RGB to BGR for OpenCV
+        frame_bgr = self._acquire_buffer(frame)
+        cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=frame_bgr)
+        
+        self.futures.append(self.pool.submit(self._encode, filepath, frame_bgr))
+        self.futures = [f for f in self.futures if not f.done() or f.exception()]
+        self.count += 1
+    
+    def close(self):
+        """Wait for pending encodes; raises the first encode error"""
+        self.pool.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        remove_stale_frames(self.output_dir, self.base_name, self.format, self.count)
+
+
+def remove_stale_frames(directory: Path, base_name: str, format: str, count: int):
+    """Delete frames numbered count and up, left by an earlier, longer sequence"""
+    for path in directory.glob(f"{base_name}_*.{format}"):
+        index = path.stem[len(base_name) + 1:]
+        if index.isdigit() and int(index) >= count:
+            path.unlink()
+
+
+def find_ffmpeg() -> Optional[str]:
+    """Locate an ffmpeg binary (system install or imageio-ffmpeg's bundled copy)"""
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+class FfmpegWriter:
+    """
+    Encodes frames by piping raw RGB straight into an ffmpeg subprocess.
+    
+    ffmpeg is started on the first frame (its size is needed for the raw
+    input). With preview_scale, one process writes both the full
+    rendition and a downscaled one ("<name>_preview.mp4"). close() reports
+    encode throughput and output size.
+    """
+    
+    def __init__(self, output_path: Path, encoder: EncoderSettings, ffmpeg: str):
+        self.output_path = output_path
+        self.encoder = encoder
+        self.ffmpeg = ffmpeg
+        self.proc = None
+        self.stderr = None
+        self.count = 0
+        self.start = None
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    @property
+    def outputs(self) -> List[Path]:
+        outputs = [self.output_path]
+        if self.encoder.preview_scale:
+            outputs.append(self.output_path.with_name(
+                f"{self.output_path.stem}_preview{self.output_path.suffix}"
+            ))
+        return outputs
+    
+    def _codec_args(self) -> List[str]:
+        enc = self.encoder
+        args = ["-c:v", enc.codec, "-crf", str(enc.crf), "-pix_fmt", "yuv420p"]
+        if enc.codec in ("libx264", "libx265"):
+            args += ["-preset", enc.preset]
+        elif enc.codec.startswith("libvpx"):
+            args += ["-b:v", "0"]
+        if enc.threads:
+            args += ["-threads", str(enc.threads)]
+        if self.output_path.suffix == ".mp4":
+            args += ["-movflags", "+faststart"]
+        return args
+    
+    def _command(self, width: int, height: int) -> List[str]:
+        cmd = [
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{width}x{height}", "-r", str(self.encoder.fps),
+            "-i", "-",
+        ]
+        # yuv420p needs even dimensions
+        even = "pad=ceil(iw/2)*2:ceil(ih/2)*2"
+        outputs = self.outputs
+        
+        if len(outputs) == 1:
+            return cmd + ["-vf", even] + self._codec_args() + [str(outputs[0])]
+        
+        scale = self.encoder.preview_scale
+        cmd += [
+            "-filter_complex",
+            f"[0:v]{even},split=2[full][small];"
+            f"[small]scale=trunc(iw*{scale}/2)*2:-2[preview]",
+        ]
+        cmd += ["-map", "[full]"] + self._codec_args() + [str(outputs[0])]
+        cmd += ["-map", "[preview]"] + self._codec_args() + [str(outputs[1])]
+        return cmd
+    
+    def write(self, frame: np.ndarray):
+        if self.proc is None:
+            h, w = frame.shape[:2]
+            self.stderr = tempfile.TemporaryFile()
+            self.start = time.perf_counter()
+            self.proc = subprocess.Popen(
+                self._command(w, h),
+                stdin=subprocess.PIPE,
+                stderr=self.stderr
+            )
+        self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        self.count += 1
+    
+    def close(self) -> Optional[dict]:
+        """Finish the encode; raises if ffmpeg failed"""
+        if self.proc is None:
+            return None
+        
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.proc.wait()
+        seconds = time.perf_counter() - self.start
+        
+        self.stderr.seek(0)
+        errors = self.stderr.read().decode(errors="replace").strip()
+        self.stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {returncode}: {errors}")
+        
+        sizes = {path.name: path.stat().st_size for path in self.outputs}
+        fps = self.count / seconds if seconds > 0 else 0.0
+        size_text = ", ".join(f"{name} {size / 1e6:.2f} MB" for name, size in sizes.items())
+        print(f"  Video: {self.count} frames in {seconds:.1f}s ({fps:.1f} fps) - {size_text}")
+        
+        return {"frames": self.count, "seconds": seconds, "fps": fps, "bytes": sizes}
+
+
+def open_video_writer(
+    output_path: Path,
+    encoder: Optional[EncoderSettings] = None
+) -> Optional[FfmpegWriter]:
+    """Open an FfmpegWriter, or return None if no ffmpeg binary is available"""
+    ffmpeg = find_ffmpeg()
+    if ffmpeg is None:
+        print("  WARNING: ffmpeg not found, skipping video generation")
+        print("  Install ffmpeg or: pip install imageio-ffmpeg")
+        return None
+    return FfmpegWriter(output_path, encoder or EncoderSettings(), ffmpeg)
+
+
+def stream_frames(
+    frames: Iterable[np.ndarray],
+    sinks: list,
+    queue_size: int = FRAME_QUEUE_SIZE
+) -> int:
+    """
+    Stream frames to writers on a background thread.
+    
+    Each frame is copied into a small pool of buffers and handed to the
+    writer thread through a bounded queue. The renderer blocks when all
+    buffers are in flight, so at most queue_size + 1 frames exist at once
+    regardless of frame count. Writers are closed when the stream ends.
     
-    h, w = gray1.shape
+    Args:
+        frames: Frame iterable (frames may be reused buffers)
+        sinks: Objects with write(frame) and close()
+        queue_size: Maximum frames waiting to be written
+    
+    Returns:
+        Number of frames written
+    """
+    pending = queue.Queue(maxsize=queue_size)
+    free = queue.Queue()
+    errors = []
     
-    # Create coordinate grids
-    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    def writer():
+        while True:
+            buf = pending.get()
+            if buf is None:
+                return
+            if not errors:
+                try:
+                    with tracer.span("write_frame", cat="io"):
+                        for sink in sinks:
+                            sink.write(buf)
+                except Exception as e:
+                    errors.append(e)
+            free.put(buf)
     
-    # Interpolated coordinates
-    map_x1 = x + flow[:, :, 0] * t
-    map_y1 = y + flow[:, :, 1] * t
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
     
-    map_x2 = x - flow[:, :, 0] * (1 - t)
-    map_y2 = y - flow[:, :, 1] * (1 - t)
+    count = 0
+    allocated = 0
+    try:
+        for frame in frames:
+            if errors:
+                break
+            try:
+                buf = free.get_nowait()
+            except queue.Empty:
+                if allocated <= queue_size:
+                    buf = np.empty_like(frame)
+                    allocated += 1
+                else:
+                    buf = free.get()  # Backpressure: wait for the writer
+            np.copyto(buf, frame)
+            pending.put(buf)
+            count += 1
+    finally:
+        pending.put(None)
+        thread.join()
+        with tracer.span("close_writers", cat="io"):
+            for sink in sinks:
+                sink.close()
     
-    # Warp both images toward the middle
-    warped1 = cv2.remap(img1, map_x1, map_y1, cv2.INTER_LINEAR)
-    warped2 = cv2.remap(img2, map_x2, map_y2, cv2.INTER_LINEAR)
+    if errors:
+        raise errors[0]
     
-    # Blend
-    return cv2.addWeighted(warped1, 1 - t, warped2, t, 0)
+    return count
 
 
 def save_frames(
-    frames: List[np.ndarray],
+    frames: Iterable[np.ndarray],
     output_dir: Path,
     base_name: str,
-    format: str = "jpg"
+    format: str = SEQUENCE_FORMAT,
+    quality: int = SEQUENCE_QUALITY,
+    workers: int = ENCODE_WORKERS
 ):
     """Save frames as image sequence"""
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    for i, frame in enumerate(frames):
-        filename = f"{base_name}_{i:04d}.{format}"
-        filepath = output_dir / filename
-        
-        # Convert RGB to BGR for OpenCV
-        frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        
-        if format.lower() in ['jpg', 'jpeg']:
-            cv2.imwrite(str(filepath), frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
-        else:
-            cv2.imwrite(str(filepath), frame_bgr)
+    writer = ImageSequenceWriter(output_dir, base_name, format, quality, workers)
+    stream_frames(frames, [writer])
 
 
 def frames_to_video(
-    frames: List[np.ndarray],
+    frames: Iterable[np.ndarray],
     output_path: Path,
-    fps: int = 30
+    fps: int = 30,
+    encoder: Optional[EncoderSettings] = None
 ):
     """Convert frames to MP4 video"""
-    try:
-        import imageio
-        
-        # imageio expects RGB
-        with imageio.get_writer(
-            str(output_path),
-            fps=fps,
-            codec='libx264',
-            quality=8,
-            pixelformat='yuv420p'
-        ) as writer:
-            for frame in frames:
-                writer.append_data(frame)
-        
-        print(f"  Video saved: {output_path}")
-        
-    except ImportError:
-        print("  imageio not installed, skipping video generation")
-        print("  Install with: pip install imageio imageio-ffmpeg")
+    encoder = encoder or EncoderSettings(fps=fps)
+    writer = open_video_writer(output_path, encoder)
+    if writer:
+        stream_frames(frames, [writer])
 
 
 def find_transition_pairs(panoramas_dir: Path, depth_dir: Path) -> List[dict]:
@@ -342,6 +1133,8 @@ def find_transition_pairs(panoramas_dir: Path, depth_dir: Path) -> List[dict]:
                 if depth1 and depth2:
                     pairs.append({
                         'name': f"{loc1.get('name', 'loc1')}_to_{loc2.get('name', 'loc2')}",
+                        'source': loc1.get('name', pano1.stem),
+                        'target': loc2.get('name', pano2.stem),
                         'pano1': pano1,
                         'pano2': pano2,
                         'depth1': depth1,
@@ -364,6 +1157,8 @@ def find_transition_pairs(panoramas_dir: Path, depth_dir: Path) -> List[dict]:
             if depth1 and depth2:
                 pairs.append({
                     'name': f"{pano1.stem}_to_{pano2.stem}",
+                    'source': pano1.stem,
+                    'target': pano2.stem,
                     'pano1': pano1,
                     'pano2': pano2,
                     'depth1': depth1,
@@ -373,54 +1168,934 @@ def find_transition_pairs(panoramas_dir: Path, depth_dir: Path) -> List[dict]:
     return pairs
 
 
-def find_panorama(directory: Path, identifier: str) -> Optional[Path]:
-    """Find a panorama file by identifier"""
-    for ext in ['.jpg', '.jpeg', '.png', '.webp']:
-        # Try exact match
-        path = directory / f"{identifier}{ext}"
-        if path.exists():
-            return path
-        
-        # Try with _equirect suffix
-        path = directory / f"{identifier}_equirect{ext}"
-        if path.exists():
-            return path
-        
-        # Try partial match
-        for f in directory.glob(f"*{identifier}*{ext}"):
-            if '_depth' not in f.stem:
-                return f
-    
-    return None
+def slugify(name: str) -> str:
+    """Filesystem-safe name for a location"""
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
 
 
-def find_depth(depth_dir: Path, pano_stem: str) -> Optional[Path]:
-    """Find a depth map for a panorama"""
-    # Try direct match
-    depth_path = depth_dir / f"{pano_stem}_depth.png"
-    if depth_path.exists():
-        return depth_path
+def build_navigation_graph(data: dict, include_nearby: bool = True) -> List[Tuple[str, str]]:
+    """
+    Directed edges (source, target) that viewers can actually navigate.
     
-    # Try without suffix
-    base_name = pano_stem.replace('_equirect', '').replace('_4x', '')
-    depth_path = depth_dir / f"{base_name}_depth.png"
-    if depth_path.exists():
-        return depth_path
+    Consecutive stops of every route are linked in both directions (the
+    viewer has next and previous), and each location links to its
+    `nearby` locations. Edges keep first-seen order and are de-duplicated.
+    """
+    names = {loc["name"] for loc in data.get("locations", [])}
+    edges = {}
     
-    return None
+    for route in data.get("routes", {}).values():
+        stops = route.get("stops", []) if isinstance(route, dict) else route
+        for a, b in zip(stops, stops[1:]):
+            edges[(a, b)] = True
+            edges[(b, a)] = True
+    
+    if include_nearby:
+        for loc in data.get("locations", []):
+            for other in loc.get("nearby", []):
+                if other in names and other != loc["name"]:
+                    edges[(loc["name"], other)] = True
+    
+    return list(edges)
 
 
-def generate_all_transitions(
+def find_location_assets(
+    loc: dict,
+    panoramas_dir: Path,
+    depth_dir: Path
+) -> Tuple[Optional[Path], Optional[Path]]:
+    """Panorama and depth map for a locations.json entry"""
+    pano = Path(loc["panorama_path"]) if loc.get("panorama_path") else None
+    if pano is None or not pano.exists():
+        pano = None
+        for identifier in (loc.get("pano_id", "")[:12], loc.get("pano_id"), loc["name"]):
+            if identifier:
+                pano = find_panorama(panoramas_dir, identifier)
+                if pano:
+                    break
+    if pano is None:
+        return None, None
+    
+    depth = Path(loc["depth_path"]) if loc.get("depth_path") else None
+    if depth is None or not depth.exists():
+        depth = find_depth(depth_dir, pano.stem)
+    return pano, depth
+
+
+def plan_transition_pairs(
+    locations_file: Path,
+    panoramas_dir: Path,
+    depth_dir: Path,
+    mode: str = TRANSITION_MODE,
+    include_nearby: bool = True
+) -> List[dict]:
+    """
+    Plan pairs from the navigation graph in locations.json.
+    
+    Only route and nearby edges with both panoramas and depth maps
+    available are returned. For symmetric modes, the reverse of an edge
+    that is already planned is marked 'reverse_of' so it can be derived
+    from the forward frames instead of rendered.
+    """
+    with open(locations_file) as f:
+        data = json.load(f)
+    
+    by_name = {loc["name"]: loc for loc in data.get("locations", [])}
+    assets = {}
+    pairs = []
+    planned = {}
+    missing = set()
+    
+    for source, target in build_navigation_graph(data, include_nearby):
+        for name in (source, target):
+            if name not in assets and name in by_name:
+                assets[name] = find_location_assets(by_name[name], panoramas_dir, depth_dir)
+        
+        pano1, depth1 = assets.get(source, (None, None))
+        pano2, depth2 = assets.get(target, (None, None))
+        if not (pano1 and depth1):
+            missing.add(source)
+        if not (pano2 and depth2):
+            missing.add(target)
+        if source in missing or target in missing:
+            continue
+        
+        pair = {
+            'name': f"{slugify(source)}_to_{slugify(target)}",
+            'source': source,
+            'target': target,
+            'pano1': pano1,
+            'pano2': pano2,
+            'depth1': depth1,
+            'depth2': depth2
+        }
+        if mode in SYMMETRIC_MODES and (target, source) in planned:
+            pair['reverse_of'] = planned[(target, source)]
+        planned[(source, target)] = pair['name']
+        pairs.append(pair)
+    
+    if missing:
+        print(f"Skipping edges for {len(missing)} locations without panorama/depth")
+    
+    return pairs
+
+
+def derive_reversed_pair(
+    pair: dict,
+    output_dir: Path,
+    settings: TransitionSettings
+) -> int:
+    """
+    Write B->A outputs by playing the already-rendered A->B sequence backwards.
+    
+    Frames are hardlinked (or copied) in reverse order; the video is
+    encoded from the reversed sequence without re-rendering.
+    
+    Returns:
+        Number of frames written
+    """
+    forward_dir = sequence_dir(output_dir, pair['reverse_of'])
+    frames = [forward_dir / f"{pair['reverse_of']}_{i:04d}.{settings.sequence_format}"
+              for i in range(settings.num_frames)]
+    missing = sum(not f.exists() for f in frames)
+    if missing:
+        raise FileNotFoundError(f"{missing} of {len(frames)} frames to reverse missing "
+                                f"in {forward_dir}")
+    
+    target_dir = sequence_dir(output_dir, pair['name'])
+    target_dir.mkdir(parents=True, exist_ok=True)
+    reversed_frames = []
+    for i, src in enumerate(reversed(frames)):
+        dst = target_dir / f"{pair['name']}_{i:04d}.{settings.sequence_format}"
+        if dst.exists():
+            dst.unlink()
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        reversed_frames.append(dst)
+    remove_stale_frames(target_dir, pair['name'], settings.sequence_format, len(reversed_frames))
+    
+    if settings.make_video:
+        video = open_video_writer(video_path(output_dir, pair['name']), settings.encoder)
+        if video:
+            stream_frames(
+                (cv2.cvtColor(cv2.imread(str(f)), cv2.COLOR_BGR2RGB) for f in reversed_frames),
+                [video]
+            )
+    
+    return len(reversed_frames)
+
+
+def find_panorama(directory: Path, identifier: str) -> Optional[Path]:
+    """Find a panorama file by identifier"""
+    for ext in ['.jpg', '.jpeg', '.png', '.webp']:
+        # Try exact match
+        path = directory / f"{identifier}{ext}"
+        if path.exists():
+            return path
+        
+        # Try with _equirect suffix
+        path = directory / f"{identifier}_equirect{ext}"
+        if path.exists():
+            return path
+        
+        # Try partial match
+        for f in directory.glob(f"*{identifier}*{ext}"):
+            if '_depth' not in f.stem:
+                return f
+    
+    return None
+
+
+def find_depth(depth_dir: Path, pano_stem: str) -> Optional[Path]:
+    """Find a depth map for a panorama"""
+    # Try direct match
+    depth_path = depth_dir / f"{pano_stem}_depth.png"
+    if depth_path.exists():
+        return depth_path
+    
+    # Try without suffix
+    base_name = pano_stem.replace('_equirect', '').replace('_4x', '')
+    depth_path = depth_dir / f"{base_name}_depth.png"
+    if depth_path.exists():
+        return depth_path
+    
+    return None
+
+
+def perspective_maps(
+    pano_shape: Tuple[int, int],
+    viewport: Viewport,
+    heading: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Remap coordinates from a perspective viewport into an equirectangular image.
+    
+    Heading 0 is the left edge of the panorama and increases to the right,
+    matching stitch_equirectangular().
+    
+    Returns:
+        (map_x, map_y): Float32 arrays (viewport.height, viewport.width)
+    """
+    pano_h, pano_w = pano_shape
+    f = viewport.focal
+    
+    x = (np.arange(viewport.width, dtype=np.float32) - viewport.width / 2 + 0.5) / f
+    y_up = -(np.arange(viewport.height, dtype=np.float32) - viewport.height / 2 + 0.5) / f
+    x, y_up = np.meshgrid(x, y_up)
+    
+    # Camera ray rotated up by pitch: forward=(0, sin p, cos p), up=(0, cos p, -sin p)
+    pitch = np.radians(viewport.pitch)
+    dir_y = y_up * np.cos(pitch) + np.sin(pitch)
+    dir_z = np.cos(pitch) - y_up * np.sin(pitch)
+    
+    lon = np.degrees(np.arctan2(x, dir_z)) + heading
+    lat = np.degrees(np.arctan2(dir_y, np.hypot(x, dir_z)))
+    
+    map_x = np.mod(lon / 360.0, 1.0) * pano_w - 0.5
+    map_y = (90.0 - lat) / 180.0 * pano_h - 0.5
+    
+    return map_x.astype(np.float32), map_y.astype(np.float32)
+
+
+def reproject_to_viewport(
+    image: np.ndarray,
+    viewport: Viewport,
+    heading: float,
+    maps: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> np.ndarray:
+    """Reproject an equirectangular image (or depth map) to a perspective viewport"""
+    if maps is None:
+        maps = perspective_maps(image.shape[:2], viewport, heading)
+    return cv2.remap(
+        image, maps[0], maps[1],
+        interpolation=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_WRAP
+    )
+
+
+def load_headings(path: Path) -> Dict[str, float]:
+    """
+    Load start headings from a locations file (e.g. ai-motion/locations.json).
+    
+    Returns:
+        Mapping of location name, slug and pano_id to heading in degrees
+    """
+    with open(path) as f:
+        data = json.load(f)
+    
+    headings = {}
+    for loc in data.get("locations", []):
+        if "heading" not in loc:
+            continue
+        for key in ("name", "slug", "pano_id"):
+            if loc.get(key):
+                headings[loc[key]] = float(loc["heading"])
+    return headings
+
+
+def sequence_dir(output_dir: Path, name: str) -> Path:
+    return output_dir / "sequences" / name
+
+
+def video_path(output_dir: Path, name: str) -> Path:
+    return output_dir / "videos" / f"{name}.mp4"
+
+
+class FileHashCache:
+    """SHA-256 of file contents, memoized on disk by path, size and mtime"""
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = {}
+        if path.exists():
+            try:
+                with open(path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+    
+    def digest(self, file: Path) -> str:
+        stat = file.stat()
+        key = str(file.resolve())
+        entry = self.entries.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        
+        sha = hashlib.sha256()
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        
+        self.entries[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha.hexdigest()
+        }
+        return self.entries[key]["sha256"]
+    
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        tmp_path.replace(self.path)
+
+
+def transition_hash(pair: dict, settings: TransitionSettings, hashes: FileHashCache) -> str:
+    """
+    Hash of everything that determines a pair's output: the contents of
+    both panoramas and depth maps, the heading and the rendering/encoder
+    settings (thread counts and buffering excluded).
+    """
+    fingerprint = asdict(settings)
+    fingerprint.pop("encode_workers")
+    fingerprint.pop("queue_size")
+    fingerprint["encoder"].pop("threads")
+    
+    payload = {
+        "version": MANIFEST_VERSION,
+        "inputs": {key: hashes.digest(Path(pair[key])) for key in ("pano1", "pano2", "depth1", "depth2")},
+        "heading": pair.get("heading"),
+        "settings": fingerprint,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def manifest_path(output_dir: Path, name: str) -> Path:
+    return output_dir / "manifests" / f"{name}.json"
+
+
+def is_up_to_date(output_dir: Path, pair: dict, settings: TransitionSettings) -> bool:
+    """True if the pair's manifest hash matches and its outputs exist"""
+    path = manifest_path(output_dir, pair['name'])
+    if not path.exists():
+        return False
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    
+    if manifest.get("hash") != pair['hash']:
+        return False
+    if settings.make_sequence and not sequence_dir(output_dir, pair['name']).exists():
+        return False
+    if settings.make_video and not video_path(output_dir, pair['name']).exists():
+        return False
+    return True
+
+
+def write_manifest(output_dir: Path, pair: dict, frames: int):
+    """Record the hash a pair's outputs were rendered from"""
+    path = manifest_path(output_dir, pair['name'])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "name": pair['name'],
+        "hash": pair['hash'],
+        "frames": frames,
+        "inputs": {key: str(pair[key]) for key in ("pano1", "pano2", "depth1", "depth2")},
+        "rendered": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    tmp_path.replace(path)
+
+
+def warp_sequence_key(
+    pano: Path,
+    depth: Path,
+    direction: str,
+    heading: Optional[float],
+    settings: TransitionSettings,
+    hashes: FileHashCache
+) -> str:
+    """Identity of a location's warp frames: inputs, direction, schedule and view"""
+    payload = {
+        "version": MANIFEST_VERSION,
+        "pano": hashes.digest(Path(pano)),
+        "depth": hashes.digest(Path(depth)),
+        "direction": direction,
+        "num_frames": settings.num_frames,
+        "heading": heading if settings.viewport else None,
+        "viewport": asdict(settings.viewport) if settings.viewport else None,
+        "parallax": PARALLAX_FRACTION,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:24]
+
+
+def assign_warp_cache(
+    pairs: List[dict],
+    settings: TransitionSettings,
+    hashes: FileHashCache,
+    cache_dir: Path
+):
+    """
+    Give pairs cache paths for warp sequences that more than one pair uses.
+    
+    A hub location's forward warp is shared by all its outgoing pairs and
+    its backward warp by all incoming ones. Sequences used once are not
+    cached.
+    """
+    keys = []
+    for pair in pairs:
+        keys.append((
+            warp_sequence_key(pair['pano1'], pair['depth1'], "forward",
+                              pair.get('heading'), settings, hashes),
+            warp_sequence_key(pair['pano2'], pair['depth2'], "backward",
+                              pair.get('heading'), settings, hashes),
+        ))
+    
+    uses = Counter(key for pair_keys in keys for key in pair_keys)
+    for pair, pair_keys in zip(pairs, keys):
+        pair['warp_cache'] = tuple(
+            cache_dir / f"{key}.npy" if uses[key] > 1 else None for key in pair_keys
+        )
+    
+    shared = sum(1 for count in uses.values() if count > 1)
+    if shared:
+        print(f"Sharing {shared} warp sequences across pairs ({cache_dir})")
+
+
+def write_depth_texture(depth_path: Path, out_path: Path, width: int = DEPTH_TEXTURE_WIDTH) -> Tuple[int, int]:
+    """
+    Write a downsampled 8-bit depth map for GPU warping.
+    
+    Returns:
+        Texture (width, height)
+    """
+    depth = load_depth(depth_path)
+    h, w = depth.shape
+    if w > width:
+        depth = cv2.resize(depth, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    cv2.imwrite(str(out_path), depth, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    return depth.shape[1], depth.shape[0]
+
+
+def transition_params(
+    pair: dict,
+    settings: TransitionSettings,
+    textures: Dict[str, str],
+    mask_style: str = "fade"
+) -> dict:
+    """
+    Parameters for the viewer to run a depth_warp transition on the GPU.
+    
+    Mirrors TransitionEngine: at eased progress p the source is warped by
+    p and the target by -(1 - p), each pixel shifting by
+    (1 - depth) * maxShift * displacement panorama widths horizontally
+    and verticalRatio times that vertically, then blended by the mask.
+    """
+    mask = {"style": mask_style if mask_style in MASK_STYLES else "fade"}
+    mask.update(MASK_STYLES.get(mask_style, {}))
+    
+    return {
+        "version": PARAMS_VERSION,
+        "name": pair['name'],
+        "source": {
+            "location": pair['source'],
+            "panorama": Path(pair['pano1']).name,
+            "depth": textures[str(pair['depth1'])],
+            "displacement": [0.0, 1.0],
+        },
+        "target": {
+            "location": pair['target'],
+            "panorama": Path(pair['pano2']).name,
+            "depth": textures[str(pair['depth2'])],
+            "displacement": [-1.0, 0.0],
+        },
+        "frames": settings.num_frames,
+        "duration": settings.num_frames / settings.encoder.fps,
+        "easing": "easeInOutCubic",
+        "parallax": {
+            "maxShift": PARALLAX_FRACTION,
+            "verticalRatio": VERTICAL_PARALLAX,
+            "depthNear": 0,
+            "depthFar": 255,
+        },
+        "mask": mask,
+    }
+
+
+def export_parametric_transitions(
+    pairs: List[dict],
+    output_dir: Path,
+    settings: TransitionSettings,
+    mask_style: str = "fade",
+    texture_width: int = DEPTH_TEXTURE_WIDTH
+) -> Path:
+    """
+    Write depth textures and per-pair JSON instead of rendered frames.
+    
+    Layout under output_dir/params:
+        depth/<location>.png    one downsampled depth map per location
+        <pair>.json             transition_params() for each pair
+        index.json              all pairs, for the viewer to look up
+    
+    Returns:
+        The params directory
+    """
+    params_dir = output_dir / "params"
+    textures = {}
+    index = []
+    
+    for pair in tqdm(pairs, desc="Exporting transition parameters"):
+        try:
+            for location, depth_path in ((pair['source'], pair['depth1']),
+                                         (pair['target'], pair['depth2'])):
+                key = str(depth_path)
+                if key not in textures:
+                    rel = f"depth/{slugify(location)}.png"
+                    write_depth_texture(Path(depth_path), params_dir / rel, texture_width)
+                    textures[key] = rel
+            
+            params = transition_params(pair, settings, textures, mask_style)
+            with open(params_dir / f"{pair['name']}.json", 'w') as f:
+                json.dump(params, f, indent=2)
+            index.append({
+                "name": pair['name'],
+                "source": pair['source'],
+                "target": pair['target'],
+                "params": f"{pair['name']}.json",
+            })
+        except Exception as e:
+            print(f"  {pair['name']}: Error: {e}")
+    
+    params_dir.mkdir(parents=True, exist_ok=True)
+    with open(params_dir / "index.json", 'w') as f:
+        json.dump({"version": PARAMS_VERSION, "transitions": index}, f, indent=2)
+    
+    size = sum(p.stat().st_size for p in params_dir.rglob("*") if p.is_file())
+    print(f"\nExported {len(index)} transitions, {len(textures)} depth textures "
+          f"({size / 1024:.0f} KB) to {params_dir}")
+    return params_dir
+
+
+def render_pair(
+    name: str,
+    img1: np.ndarray,
+    img2: np.ndarray,
+    depth1: np.ndarray,
+    depth2: np.ndarray,
+    output_dir: Path,
+    settings: TransitionSettings,
+    heading: Optional[float] = None,
+    warp_cache: Tuple[Optional[Path], Optional[Path]] = (None, None)
+) -> int:
+    """
+    Render one transition and write its image sequence and/or video.
+    
+    With settings.viewport, both panoramas and depth maps are reprojected
+    to the viewport at `heading` first, so only visible pixels are warped.
+    warp_cache shares per-location warp frames with other pairs.
+    
+    Returns:
+        Number of frames rendered
+    """
+    max_shift = None
+    viewport = settings.viewport
+    if viewport is not None:
+        if heading is None:
+            heading = viewport.heading
+        with tracer.span("reproject", cat="render"):
+            maps1 = perspective_maps(img1.shape[:2], viewport, heading)
+            maps2 = maps1 if img2.shape == img1.shape else \
+                perspective_maps(img2.shape[:2], viewport, heading)
+            img1 = reproject_to_viewport(img1, viewport, heading, maps1)
+            depth1 = reproject_to_viewport(depth1, viewport, heading, maps1)
+            img2 = reproject_to_viewport(img2, viewport, heading, maps2)
+            depth2 = reproject_to_viewport(depth2, viewport, heading, maps2)
+        max_shift = viewport.max_shift
+    
+    # Writers for image sequence and/or video
+    sinks = []
+    if settings.make_sequence:
+        sinks.append(ImageSequenceWriter(
+            sequence_dir(output_dir, name), name,
+            format=settings.sequence_format,
+            quality=settings.sequence_quality,
+            workers=settings.encode_workers
+        ))
+    if settings.make_video:
+        video = open_video_writer(video_path(output_dir, name), settings.encoder)
+        if video:
+            sinks.append(video)
+    
+    # Render and write frame by frame
+    frames = iter_transition_frames(
+        img1, img2, depth1, depth2,
+        num_frames=settings.num_frames,
+        mode=settings.mode,
+        flow_scale=settings.flow_scale,
+        flow_method=settings.flow_method,
+        max_shift=max_shift,
+        warp_cache=warp_cache
+    )
+    with tracer.span("render", cat="render", pair=name, mode=settings.mode):
+        return stream_frames(frames, sinks, settings.queue_size)
+
+
+class SharedArray:
+    """A numpy array backed by multiprocessing shared memory"""
+    
+    def __init__(self, shm: shared_memory.SharedMemory, shape: tuple, dtype):
+        self.shm = shm
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    
+    @classmethod
+    def create(cls, array: np.ndarray) -> 'SharedArray':
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = cls(shm, array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+    
+    @classmethod
+    def attach(cls, descriptor: tuple) -> 'SharedArray':
+        name, shape, dtype = descriptor
+        return cls(shared_memory.SharedMemory(name=name), shape, np.dtype(dtype))
+    
+    @property
+    def descriptor(self) -> tuple:
+        """Picklable (name, shape, dtype) handle for attach()"""
+        return (self.shm.name, self.array.shape, self.array.dtype.str)
+    
+    def close(self):
+        self.array = None
+        self.shm.close()
+    
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+class SharedAssetStore:
+    """
+    Decoded panoramas and depth maps in shared memory for worker processes.
+    
+    Each asset is decoded once and reference-counted by the pairs in
+    flight, so chained pairs (A->B, B->C) share B and memory is released
+    as soon as no pending pair needs it.
+    """
+    
+    def __init__(self):
+        self.blocks = {}
+        self.refs = {}
+    
+    def acquire(self, key: tuple, load) -> SharedArray:
+        if key not in self.blocks:
+            self.blocks[key] = SharedArray.create(load())
+            self.refs[key] = 0
+        self.refs[key] += 1
+        return self.blocks[key]
+    
+    def release(self, key: tuple):
+        self.refs[key] -= 1
+        if self.refs[key] == 0:
+            self.blocks.pop(key).unlink()
+            del self.refs[key]
+    
+    def acquire_pair(self, pair: dict) -> List[tuple]:
+        """Acquire a pair's four assets; returns their keys (in render order)"""
+        keys = []
+        shapes = []
+        try:
+            for pano in (pair['pano1'], pair['pano2']):
+                key = ("image", str(pano))
+                shapes.append(self.acquire(key, lambda: load_image(pano)).array.shape[:2])
+                keys.append(key)
+            for depth, shape in zip((pair['depth1'], pair['depth2']), shapes):
+                key = ("depth", str(depth), shape)
+                self.acquire(key, lambda: load_depth(depth, shape))
+                keys.append(key)
+        except Exception:
+            # Don't hold the assets already loaded until close()
+            for key in keys:
+                self.release(key)
+            raise
+        return keys
+    
+    def close(self):
+        for block in self.blocks.values():
+            block.unlink()
+        self.blocks.clear()
+        self.refs.clear()
+
+
+def _init_worker(cv2_threads: int):
+    """Cap OpenCV threads so workers do not oversubscribe the CPU"""
+    cv2.setNumThreads(cv2_threads)
+    tracer.drain()  # Spans inherited from the parent on fork
+
+
+def _render_pair_worker(
+    name: str,
+    descriptors: List[tuple],
+    output_dir: Path,
+    settings: TransitionSettings,
+    heading: Optional[float] = None,
+    warp_cache: Tuple[Optional[Path], Optional[Path]] = (None, None),
+    trace: bool = False
+) -> Tuple[int, float, List[dict]]:
+    """
+    Render a pair in a worker process from shared-memory assets.
+    
+    Returns the frame count, seconds taken, and (with trace) the worker's
+    spans for the parent to merge into its trace.
+    """
+    if trace:
+        tracer.enable()
+    blocks = [SharedArray.attach(d) for d in descriptors]
+    try:
+        with tracer.span("pair", pair=name) as span:
+            count = render_pair(
+                name, *[b.array for b in blocks], output_dir, settings, heading,
+                warp_cache
+            )
+    finally:
+        for block in blocks:
+            block.close()
+    return count, span.duration, tracer.drain()
+
+
+def render_pairs_parallel(
+    pairs: List[dict],
+    output_dir: Path,
+    settings: TransitionSettings,
+    workers: int
+) -> set:
+    """
+    Render pairs across a process pool.
+    
+    The parent decodes assets into shared memory while workers render,
+    keeping at most `workers` pairs in flight.
+    
+    Returns:
+        Names of the pairs rendered successfully
+    """
+    cv2_threads = max(1, (os.cpu_count() or 1) // workers)
+    settings = replace(
+        settings,
+        encode_workers=min(settings.encode_workers, cv2_threads),
+        encoder=replace(
+            settings.encoder,
+            threads=settings.encoder.threads or cv2_threads
+        )
+    )
+    store = SharedAssetStore()
+    pending = {}
+    done_count = 0
+    rendered = set()
+    
+    print(f"Rendering with {workers} workers ({cv2_threads} OpenCV threads each)")
+    
+    def collect(done):
+        nonlocal done_count
+        for future in done:
+            pair, keys = pending.pop(future)
+            name = pair['name']
+            done_count += 1
+            try:
+                count, seconds, spans = future.result()
+                tracer.add(spans)
+                print(f"  [{done_count}/{len(pairs)}] {name}: {count} frames in {seconds:.1f}s")
+                if 'hash' in pair:
+                    write_manifest(output_dir, pair, count)
+                rendered.add(name)
+            except Exception as e:
+                print(f"  [{done_count}/{len(pairs)}] {name}: Error: {e}")
+            for key in keys:
+                store.release(key)
+    
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(cv2_threads,)
+        ) as pool:
+            for pair in pairs:
+                if len(pending) >= workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                
+                try:
+                    with tracer.span("load_assets", cat="io", pair=pair['name']):
+                        keys = store.acquire_pair(pair)
+                except Exception as e:
+                    done_count += 1
+                    print(f"  [{done_count}/{len(pairs)}] {pair['name']}: Error: {e}")
+                    continue
+                
+                descriptors = [store.blocks[key].descriptor for key in keys]
+                future = pool.submit(
+                    _render_pair_worker, pair['name'], descriptors, output_dir,
+                    settings, pair.get('heading'), pair.get('warp_cache', (None, None)),
+                    tracer.enabled
+                )
+                pending[future] = (pair, keys)
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+    finally:
+        store.close()
+    return rendered
+
+
+@dataclass
+class TransitionMemoryPlan:
+    """Rendering settings chosen to fit a memory budget"""
+    workers: int
+    queue_size: int
+    cache_mb: int
+    pair_bytes: int  # Estimated peak of one pair's render
+
+
+def plan_transition_memory(
+    budget_mb: float,
+    input_pixels: int,
+    render_pixels: int,
+    mode: str,
+    workers: int,
+    queue_size: int = FRAME_QUEUE_SIZE,
+    encode_workers: int = ENCODE_WORKERS,
+    cache_mb: int = ASSET_CACHE_MB
+) -> TransitionMemoryPlan:
+    """
+    Choose worker count, frame buffer depth and asset cache size so
+    rendering fits in budget_mb.
+    
+    The frame queue is shortened first (it only smooths renderer/writer
+    jitter), then workers are dropped; the serial asset cache gets what
+    is left after one pair's render and the next pair's prefetch.
+    """
+    available = budget_mb * MB - process_tree_rss()
+    inputs = input_pixels * INPUT_BYTES_PER_PIXEL
+    
+    def pair_bytes(q):
+        frames = q + 1 + encode_workers  # Queue, renderer's buffer, encoder copies
+        return inputs + render_pixels * (RENDER_BYTES_PER_PIXEL.get(mode, 6) + 3 * frames)
+    
+    while queue_size > 1 and pair_bytes(queue_size) > available:
+        queue_size -= 1
+    
+    # Parallel: shared-memory inputs in the parent plus one process per pair
+    per_worker = pair_bytes(queue_size) + inputs + WORKER_PROCESS_BYTES
+    workers = max(1, min(workers, int(available // per_worker)))
+    
+    # Serial: cache holds the current pair's inputs; the rest is for reuse
+    spare = available - pair_bytes(queue_size) - inputs
+    cache_mb = max(inputs // MB, min(cache_mb, int(spare // MB)))
+    
+    return TransitionMemoryPlan(workers, queue_size, cache_mb, pair_bytes(queue_size))
+
+
+def image_pixels(path: Path) -> int:
+    """Pixel count from the image header, without decoding"""
+    with Image.open(path) as im:
+        return im.size[0] * im.size[1]
+
+
+def generate_all_transitions(
     panoramas_dir: Path,
     depth_dir: Path,
     output_dir: Path,
     num_frames: int = DEFAULT_FRAMES,
     make_video: bool = True,
-    mode: str = TRANSITION_MODE
+    mode: str = TRANSITION_MODE,
+    make_sequence: bool = True,
+    sequence_format: str = SEQUENCE_FORMAT,
+    sequence_quality: int = SEQUENCE_QUALITY,
+    encode_workers: int = ENCODE_WORKERS,
+    workers: int = 1,
+    cache_mb: int = ASSET_CACHE_MB,
+    flow_scale: float = FLOW_SCALE,
+    flow_method: str = FLOW_METHOD,
+    viewport: Optional[Viewport] = None,
+    headings: Optional[Dict[str, float]] = None,
+    encoder: Optional[EncoderSettings] = None,
+    force: bool = False,
+    locations_file: Optional[Path] = None,
+    warp_cache_dir: Optional[Path] = None,
+    keep_warp_cache: bool = False,
+    export: str = "frames",
+    mask_style: str = "fade",
+    texture_width: int = DEPTH_TEXTURE_WIDTH,
+    memory_budget_mb: Optional[float] = None
 ):
-    """Generate transitions for all panorama pairs"""
+    """
+    Generate transitions for all panorama pairs.
+    
+    Pairs come from the route/nearby graph in locations_file if given,
+    otherwise from metadata.json or sorted filenames.
+    
+    Pairs whose manifest hash (inputs + settings) matches their existing
+    output are skipped unless force is set.
+    
+    With warp_cache_dir, depth_warp frames of locations used by several
+    pairs are rendered once and shared (uncompressed, frames x H x W x 3
+    bytes per sequence); the cache is removed afterwards unless
+    keep_warp_cache is set.
+    
+    With a viewport, output goes to output_dir/viewport and each pair is
+    rendered at its source location's heading from `headings`.
     
-    pairs = find_transition_pairs(panoramas_dir, depth_dir)
+    With export="params", nothing is rendered: depth textures and per-pair
+    JSON for the viewer's GPU warp are written to output_dir/params.
+    
+    With memory_budget_mb, workers, frame buffering and the asset cache
+    are reduced to fit (see plan_transition_memory()), and peak RSS per
+    stage is logged.
+    """
+    
+    with tracer.span("plan_pairs"):
+        if locations_file is not None:
+            pairs = plan_transition_pairs(locations_file, panoramas_dir, depth_dir, mode)
+        else:
+            pairs = find_transition_pairs(panoramas_dir, depth_dir)
     
     if not pairs:
         print("No valid panorama pairs found.")
@@ -430,43 +2105,154 @@ def generate_all_transitions(
         return
     
     print(f"\nFound {len(pairs)} transition pairs")
+    
+    if export == "params":
+        settings = TransitionSettings(
+            num_frames=num_frames, mode="depth_warp",
+            encoder=encoder or EncoderSettings()
+        )
+        with tracer.span("export_params"):
+            export_parametric_transitions(pairs, output_dir, settings, mask_style, texture_width)
+        return
+    
+    if viewport is not None:
+        output_dir = output_dir / "viewport"
+        for pair in pairs:
+            pair['heading'] = (headings or {}).get(pair['source'], viewport.heading)
+        # A reverse looking elsewhere than its forward pair is a different view: render it
+        forward_headings = {pair['name']: pair['heading'] for pair in pairs}
+        for pair in pairs:
+            if 'reverse_of' in pair and forward_headings.get(pair['reverse_of']) != pair['heading']:
+                del pair['reverse_of']
+    
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    for pair in tqdm(pairs, desc="Generating transitions"):
+    settings = TransitionSettings(
+        num_frames=num_frames,
+        mode=mode,
+        make_video=make_video,
+        make_sequence=make_sequence,
+        sequence_format=sequence_format,
+        sequence_quality=sequence_quality,
+        encode_workers=encode_workers,
+        flow_scale=flow_scale,
+        flow_method=flow_method,
+        viewport=viewport,
+        encoder=encoder or EncoderSettings()
+    )
+    
+    governor = MemoryGovernor(memory_budget_mb)
+    if memory_budget_mb:
+        input_pixels = max(image_pixels(Path(p[key])) for p in pairs for key in ("pano1", "pano2"))
+        render_pixels = viewport.width * viewport.height if viewport else input_pixels
+        plan = plan_transition_memory(
+            memory_budget_mb, input_pixels, render_pixels, mode, workers,
+            settings.queue_size, encode_workers, cache_mb
+        )
+        workers, cache_mb = plan.workers, plan.cache_mb
+        settings = replace(settings, queue_size=plan.queue_size)
+        print(f"Memory budget {memory_budget_mb:.0f} MB: ~{plan.pair_bytes / MB:.0f} MB per pair, "
+              f"{workers} workers, {plan.queue_size} queued frames, {cache_mb} MB asset cache")
+    
+    # Skip pairs whose inputs and settings are unchanged
+    hashes = FileHashCache(output_dir / "manifests" / ".file_hashes.json")
+    with governor.stage("hash_inputs"), tracer.span("hash_inputs", pairs=len(pairs)):
+        for pair in pairs:
+            pair['hash'] = transition_hash(pair, settings, hashes)
+        hashes.save()
+    
+    forwards = {pair['name']: pair for pair in pairs}
+    if not force:
+        total = len(pairs)
+        pairs = [pair for pair in pairs if not is_up_to_date(output_dir, pair, settings)]
+        if len(pairs) < total:
+            print(f"Skipping {total - len(pairs)} unchanged pairs")
+    
+    # Reverses of symmetric transitions are derived after rendering
+    derived = [pair for pair in pairs if 'reverse_of' in pair and make_sequence]
+    pairs = [pair for pair in pairs if not ('reverse_of' in pair and make_sequence)]
+    if derived:
+        print(f"Deriving {len(derived)} reversed pairs from their forward frames")
+    
+    if warp_cache_dir is not None and mode == "depth_warp":
+        assign_warp_cache(pairs, settings, hashes, warp_cache_dir)
+        hashes.save()
+    
+    def render(batch: List[dict]) -> set:
+        with governor.stage("render_pairs"), \
+                tracer.span("render_pairs", pairs=len(batch), workers=workers):
+            if workers > 1:
+                return render_pairs_parallel(batch, output_dir, settings, workers)
+            return render_pairs_serial(batch, output_dir, settings, cache_mb)
+    
+    try:
+        rendered = render(pairs)
+    finally:
+        if warp_cache_dir is not None and not keep_warp_cache:
+            shutil.rmtree(warp_cache_dir, ignore_errors=True)
+    
+    # Only reverse forward frames that are current: rendered now, or unchanged
+    # and not attempted (a failed render may have left old or partial frames)
+    attempted = {pair['name'] for pair in pairs}
+    stale = [pair for pair in derived
+             if pair['reverse_of'] not in rendered and (
+                 pair['reverse_of'] in attempted or
+                 not is_up_to_date(output_dir, forwards[pair['reverse_of']], settings))]
+    if stale:
+        print(f"\nRendering {len(stale)} reversed pairs whose forward pair is not up to date")
+        derived = [pair for pair in derived if pair not in stale]
+        render(stale)
+    
+    for pair in derived:
+        print(f"\n{pair['name']} (reverse of {pair['reverse_of']})")
+        try:
+            with governor.stage("derive_reverse"), \
+                    tracer.span("derive_reverse", pair=pair['name']):
+                count = derive_reversed_pair(pair, output_dir, settings)
+            write_manifest(output_dir, pair, count)
+        except Exception as e:
+            print(f"  Error: {e}")
+    
+    governor.log_summary()
+
+
+def render_pairs_serial(
+    pairs: List[dict],
+    output_dir: Path,
+    settings: TransitionSettings,
+    cache_mb: int = ASSET_CACHE_MB
+) -> set:
+    """Render pairs one at a time, prefetching the next pair's assets; returns those rendered"""
+    cache = AssetCache(cache_mb * 1024 * 1024)
+    rendered = set()
+    
+    for i, pair in enumerate(tqdm(pairs, desc="Generating transitions")):
         print(f"\n{pair['name']}")
         
         try:
-            # Load images and depth maps
-            img1, img2 = load_image_pair(pair['pano1'], pair['pano2'])
-            depth1, depth2 = load_depth_pair(pair['depth1'], pair['depth2'])
+            # Load images and depth maps, then decode the next pair meanwhile
+            with tracer.span("load_assets", cat="io", pair=pair['name']):
+                img1, img2, depth1, depth2 = cache.get_pair(pair)
+            if i + 1 < len(pairs):
+                cache.prefetch_pair(pairs[i + 1])
             
-            # Resize depth to match image if needed
-            if depth1.shape != img1.shape[:2]:
-                depth1 = cv2.resize(depth1, (img1.shape[1], img1.shape[0]))
-            if depth2.shape != img2.shape[:2]:
-                depth2 = cv2.resize(depth2, (img2.shape[1], img2.shape[0]))
-            
-            # Generate frames
-            frames = generate_transition_frames(
-                img1, img2, depth1, depth2,
-                num_frames=num_frames,
-                mode=mode
-            )
-            
-            # Save as image sequence
-            seq_dir = output_dir / "sequences" / pair['name']
-            save_frames(frames, seq_dir, pair['name'])
-            print(f"  Saved {len(frames)} frames")
-            
-            # Save as video
-            if make_video:
-                video_path = output_dir / "videos" / f"{pair['name']}.mp4"
-                video_path.parent.mkdir(parents=True, exist_ok=True)
-                frames_to_video(frames, video_path)
+            with tracer.span("pair", pair=pair['name']):
+                count = render_pair(
+                    pair['name'], img1, img2, depth1, depth2, output_dir, settings,
+                    pair.get('heading'), pair.get('warp_cache', (None, None))
+                )
+            if settings.make_sequence:
+                print(f"  Saved {count} frames")
+            write_manifest(output_dir, pair, count)
+            rendered.add(pair['name'])
             
         except Exception as e:
             print(f"  Error: {e}")
             continue
+    
+    cache.close()
+    print(f"\nAsset cache: {cache.decodes} decodes, {cache.hits} hits")
+    return rendered
 
 
 def main():
@@ -501,14 +2287,177 @@ def main():
         action="store_true",
         help="Skip video generation"
     )
+    parser.add_argument(
+        "--no-sequence",
+        action="store_true",
+        help="Skip image sequence output"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["jpg", "png", "webp"],
+        default=SEQUENCE_FORMAT,
+        help=f"Image sequence format (default: {SEQUENCE_FORMAT})"
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=SEQUENCE_QUALITY,
+        help=f"JPEG/WebP quality (default: {SEQUENCE_QUALITY})"
+    )
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        default=ENCODE_WORKERS,
+        help=f"Image encoder threads (default: {ENCODE_WORKERS})"
+    )
+    parser.add_argument(
+        "--codec",
+        default=VIDEO_CODEC,
+        help=f"ffmpeg video codec, e.g. libx264, libx265, libvpx-vp9 (default: {VIDEO_CODEC})"
+    )
+    parser.add_argument(
+        "--preset",
+        default=VIDEO_PRESET,
+        help=f"x264/x265 preset (default: {VIDEO_PRESET})"
+    )
+    parser.add_argument(
+        "--crf",
+        type=int,
+        default=VIDEO_CRF,
+        help=f"Constant rate factor (default: {VIDEO_CRF})"
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        default=30,
+        help="Video frame rate (default: 30)"
+    )
+    parser.add_argument(
+        "--preview-scale",
+        type=float,
+        help="Also encode a downscaled rendition, e.g. 0.25"
+    )
+    parser.add_argument(
+        "--encode-threads",
+        type=int,
+        default=0,
+        help="ffmpeg threads per encode; with --workers defaults to cores / workers"
+    )
+    parser.add_argument(
+        "--plan",
+        choices=["sequential", "graph"],
+        default="sequential",
+        help="Pair panoramas sequentially, or along routes/nearby links in --locations"
+    )
+    parser.add_argument(
+        "--locations",
+        help="Locations JSON for --plan graph (default: panoramas/locations.json)"
+    )
+    parser.add_argument(
+        "--export",
+        choices=["frames", "params"],
+        default="frames",
+        help="Render frames, or export depth textures + JSON for the viewer's GPU warp"
+    )
+    parser.add_argument(
+        "--mask",
+        choices=["fade", "wipe", "radial"],
+        default="fade",
+        help="Blend mask for --export params (default: fade)"
+    )
+    parser.add_argument(
+        "--texture-width",
+        type=int,
+        default=DEPTH_TEXTURE_WIDTH,
+        help=f"Depth texture width for --export params (default: {DEPTH_TEXTURE_WIDTH})"
+    )
+    parser.add_argument(
+        "--share-warps",
+        action="store_true",
+        help="Render each location's depth warp frames once and reuse them across pairs"
+    )
+    parser.add_argument(
+        "--warp-cache",
+        help="Directory for shared warp frames (default: <output>/warp_cache)"
+    )
+    parser.add_argument(
+        "--keep-warp-cache",
+        action="store_true",
+        help="Keep shared warp frames for the next run"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate pairs even if their inputs and settings are unchanged"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Render pairs in N worker processes (default: 1)"
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=int,
+        default=ASSET_CACHE_MB,
+        help=f"Decoded asset cache size in MB (default: {ASSET_CACHE_MB})"
+    )
     parser.add_argument(
         "--mode",
         choices=["depth_warp", "crossfade", "morph"],
         default=TRANSITION_MODE,
         help=f"Transition mode (default: {TRANSITION_MODE})"
     )
+    parser.add_argument(
+        "--flow-method",
+        choices=["farneback", "dis"],
+        default=FLOW_METHOD,
+        help=f"Optical flow estimator for morph mode (default: {FLOW_METHOD})"
+    )
+    parser.add_argument(
+        "--flow-scale",
+        type=float,
+        default=FLOW_SCALE,
+        help=f"Resolution fraction for morph flow, e.g. 0.25 (default: {FLOW_SCALE})"
+    )
+    parser.add_argument(
+        "--viewport",
+        action="store_true",
+        help="Render only the viewer's perspective view instead of the full panorama"
+    )
+    parser.add_argument(
+        "--headings",
+        help="Locations JSON with per-location 'heading' (e.g. ai-motion/locations.json)"
+    )
+    parser.add_argument(
+        "--heading",
+        type=float,
+        default=0.0,
+        help="Viewport heading for locations without one (default: 0)"
+    )
+    parser.add_argument(
+        "--pitch",
+        type=float,
+        default=0.0,
+        help="Viewport pitch in degrees (default: 0)"
+    )
+    parser.add_argument(
+        "--fov",
+        type=float,
+        default=Viewport.fov,
+        help=f"Viewport horizontal field of view (default: {Viewport.fov})"
+    )
+    parser.add_argument(
+        "--size",
+        default=f"{Viewport.width}x{Viewport.height}",
+        help=f"Viewport resolution WxH (default: {Viewport.width}x{Viewport.height})"
+    )
+    add_memory_arguments(parser)
+    add_trace_arguments(parser)
     
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')  # Governor reports
+    start_tracing(args)
     
     print("=" * 60)
     print("BIG ISLAND VR - TRANSITION GENERATOR")
@@ -533,15 +2482,65 @@ def main():
         print("Run depth_estimation.py first")
         return 1
     
+    warp_cache_dir = None
+    if args.share_warps or args.warp_cache:
+        warp_cache_dir = Path(args.warp_cache) if args.warp_cache else \
+                         output_dir / "warp_cache"
+    
+    locations_file = None
+    if args.plan == "graph":
+        locations_file = Path(args.locations) if args.locations else \
+                         project_root / "panoramas" / "locations.json"
+    
+    viewport = None
+    headings = None
+    if args.viewport:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        viewport = Viewport(
+            fov=args.fov, width=width, height=height,
+            pitch=args.pitch, heading=args.heading
+        )
+        if args.headings:
+            headings = load_headings(Path(args.headings))
+    
     # Generate
-    generate_all_transitions(
-        panoramas_dir,
-        depth_dir,
-        output_dir,
-        num_frames=args.frames,
-        make_video=not args.no_video,
-        mode=args.mode
-    )
+    with tracer.span("transitions", cat="batch"):
+        generate_all_transitions(
+            panoramas_dir,
+            depth_dir,
+            output_dir,
+            num_frames=args.frames,
+            make_video=not args.no_video,
+            mode=args.mode,
+            make_sequence=not args.no_sequence,
+            sequence_format=args.format,
+            sequence_quality=args.quality,
+            encode_workers=args.encode_workers,
+            workers=args.workers,
+            cache_mb=args.cache_mb,
+            flow_scale=args.flow_scale,
+            flow_method=args.flow_method,
+            viewport=viewport,
+            headings=headings,
+            encoder=EncoderSettings(
+                codec=args.codec,
+                preset=args.preset,
+                crf=args.crf,
+                fps=args.fps,
+                threads=args.encode_threads,
+                preview_scale=args.preview_scale
+            ),
+            force=args.force,
+            locations_file=locations_file,
+            warp_cache_dir=warp_cache_dir,
+            keep_warp_cache=args.keep_warp_cache,
+            export=args.export,
+            mask_style=args.mask,
+            texture_width=args.texture_width,
+            memory_budget_mb=args.memory_budget
+        )
+    
+    export_traces(args)
     
     print("\n" + "=" * 60)
     print("DONE!")
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Location Catalog for Big Island VR
+
+SQLite store behind panoramas/locations.json. Each location is kept as its
+full JSON record plus indexed columns (name, route, region, pano_id,
+processing state), and route stops are a separate indexed table, so status
+and route queries do not scan the whole catalog. Updates are per-location
+transactions, so several scripts can record results without rewriting
+each other's changes.
+
+locations.json is imported once (or again with --import after content
+edits) and exported on demand; it is no longer written by processing runs.
+
+Usage:
+    python location_catalog.py --import        # Load locations.json, keeping processing state
+    python location_catalog.py --export        # Write locations.json from the catalog
+    python location_catalog.py --status        # Processing status per route
+"""
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+CATALOG_SUFFIX = ".sqlite"  # Catalog lives next to its JSON: locations.sqlite
+BUSY_TIMEOUT = 30.0  # Seconds to wait for another writer's transaction
+
+# Fields written by processing; kept when content is re-imported
+STATE_FIELDS = ("pano_id", "panorama_path", "depth_path", "processed", "processed_date")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    route TEXT,
+    region TEXT,
+    pano_id TEXT,
+    processed INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_locations_position ON locations(position);
+CREATE INDEX IF NOT EXISTS idx_locations_route ON locations(route);
+CREATE INDEX IF NOT EXISTS idx_locations_region ON locations(region);
+CREATE INDEX IF NOT EXISTS idx_locations_pano_id ON locations(pano_id);
+CREATE INDEX IF NOT EXISTS idx_locations_processed ON locations(processed);
+
+CREATE TABLE IF NOT EXISTS route_stops (
+    route TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (route, position)
+);
+CREATE INDEX IF NOT EXISTS idx_route_stops_name ON route_stops(name);
+
+-- Other top-level sections of locations.json (routes, audio_system, ...)
+CREATE TABLE IF NOT EXISTS sections (
+    key TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+def processed_fields(panorama_path: Optional[str], depth_path: Optional[str],
+                     processed_date: Optional[str] = None) -> Dict[str, Any]:
+    """Fields recorded on a successfully processed location"""
+    return {
+        "panorama_path": panorama_path,
+        "depth_path": depth_path,
+        "processed": True,
+        "processed_date": processed_date or datetime.now().isoformat(),
+    }
+
+
+def catalog_path(locations_file: Path) -> Path:
+    """Catalog database for a locations JSON file"""
+    return Path(locations_file).with_suffix(CATALOG_SUFFIX)
+
+
+class LocationCatalog:
+    """
+    Indexed SQLite catalog of locations and routes.
+    
+    Uses SQLite's default rollback journal rather than WAL, which needs
+    shared memory and does not work on NFS-mounted panoramas/ directories.
+    """
+    
+    def __init__(self, path: Path, timeout: float = BUSY_TIMEOUT):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+    
+    def close(self):
+        self.conn.close()
+    
+    def __enter__(self) -> 'LocationCatalog':
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction, taking the write lock up front"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+    
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM locations LIMIT 1").fetchone() is None
+    
+    @staticmethod
+    def _columns(loc: Dict[str, Any]) -> tuple:
+        return (
+            loc.get("route"),
+            loc.get("region"),
+            loc.get("pano_id"),
+            1 if loc.get("processed") else 0,
+            json.dumps(loc, ensure_ascii=False),
+        )
+    
+    # ------------------------------------------------------------------------
+    # Import / export
+    # ------------------------------------------------------------------------
+    
+    def import_json(self, locations_file: Path, keep_state: bool = True) -> int:
+        """
+        Replace the catalog's content with a locations.json file.
+        
+        With keep_state, processing fields (STATE_FIELDS) of locations
+        already in the catalog are kept where the file does not set them.
+        
+        Returns:
+            Number of locations imported
+        """
+        with open(locations_file) as f:
+            data = json.load(f)
+        
+        with self.transaction() as conn:
+            state = {}
+            if keep_state:
+                for row in conn.execute("SELECT name, data FROM locations"):
+                    record = json.loads(row["data"])
+                    state[row["name"]] = {k: record[k] for k in STATE_FIELDS if k in record}
+            
+            conn.execute("DELETE FROM locations")
+            conn.execute("DELETE FROM route_stops")
+            conn.execute("DELETE FROM sections")
+            
+            for position, (key, value) in enumerate(data.items()):
+                if key != "locations":
+                    conn.execute(
+                        "INSERT INTO sections (key, position, data) VALUES (?, ?, ?)",
+                        (key, position, json.dumps(value, ensure_ascii=False))
+                    )
+                else:
+                    conn.execute(
+                        "INSERT INTO sections (key, position, data) VALUES (?, ?, 'null')",
+                        (key, position)
+                    )
+            
+            locations = data.get("locations", [])
+            for position, loc in enumerate(locations):
+                for key, value in state.get(loc["name"], {}).items():
+                    loc.setdefault(key, value)
+                conn.execute(
+                    "INSERT OR REPLACE INTO locations "
+                    "(name, position, route, region, pano_id, processed, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (loc["name"], position) + self._columns(loc)
+                )
+            
+            for route, info in data.get("routes", {}).items():
+                for position, name in enumerate(info.get("stops", [])):
+                    conn.execute(
+                        "INSERT INTO route_stops (route, position, name) VALUES (?, ?, ?)",
+                        (route, position, name)
+                    )
+        
+        return len(locations)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """The catalog as a locations.json document"""
+        data = {}
+        for row in self.conn.execute("SELECT key, data FROM sections ORDER BY position"):
+            data[row["key"]] = json.loads(row["data"])
+        data["locations"] = self.locations()
+        return data
+    
+    def export_json(self, locations_file: Path):
+        """Write locations.json from a consistent snapshot, atomically"""
+        self.conn.execute("BEGIN")
+        try:
+            data = self.to_dict()
+        finally:
+            self.conn.execute("COMMIT")
+        
+        locations_file = Path(locations_file)
+        tmp = locations_file.with_name(f".{locations_file.name}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, locations_file)
+    
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+    
+    def locations(self, route: Optional[str] = None,
+                  region: Optional[str] = None,
+                  processed: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Location records in catalog order.
+        
+        A route returns its stops in tour order (or, for a route without
+        stops, locations whose 'route' field matches).
+        """
+        if route is not None:
+            rows = self.conn.execute(
+                "SELECT l.data FROM route_stops s JOIN locations l ON l.name = s.name "
+                "WHERE s.route = ? ORDER BY s.position", (route,)
+            ).fetchall()
+            if not rows:
+                rows = self.conn.execute(
+                    "SELECT data FROM locations WHERE route = ? ORDER BY position", (route,)
+                ).fetchall()
+            locations = [json.loads(row["data"]) for row in rows]
+            if region is not None:
+                locations = [l for l in locations if l.get("region") == region]
+            if processed is not None:
+                locations = [l for l in locations if bool(l.get("processed")) == processed]
+            return locations
+        
+        query, params = "SELECT data FROM locations", []
+        clauses = []
+        if region is not None:
+            clauses.append("region = ?")
+            params.append(region)
+        if processed is not None:
+            clauses.append("processed = ?")
+            params.append(1 if processed else 0)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY position"
+        return [json.loads(row["data"]) for row in self.conn.execute(query, params)]
+    
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute("SELECT data FROM locations WHERE name = ?", (name,)).fetchone()
+        return json.loads(row["data"]) if row else None
+    
+    def find_by_pano_id(self, pano_id: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT data FROM locations WHERE pano_id = ?", (pano_id,)
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
+    
+    def routes(self) -> Dict[str, Dict[str, Any]]:
+        row = self.conn.execute("SELECT data FROM sections WHERE key = 'routes'").fetchone()
+        return json.loads(row["data"]) if row else {}
+    
+    def counts(self) -> Dict[str, int]:
+        """Total, with panorama ID and processed location counts"""
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS total, COUNT(pano_id) AS with_pano, "
+            "COALESCE(SUM(processed), 0) AS processed FROM locations"
+        ).fetchone()
+        return dict(row)
+    
+    def route_progress(self) -> List[Dict[str, Any]]:
+        """Processed/total stops per route, in route order"""
+        rows = self.conn.execute(
+            "SELECT s.route AS route, COUNT(*) AS total, "
+            "COALESCE(SUM(l.processed), 0) AS processed "
+            "FROM route_stops s LEFT JOIN locations l ON l.name = s.name "
+            "GROUP BY s.route"
+        ).fetchall()
+        by_route = {row["route"]: dict(row) for row in rows}
+        return [by_route.get(route, {"route": route, "total": 0, "processed": 0})
+                for route in self.routes()]
+    
+    # ------------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------------
+    
+    def update_location(self, name: str, **fields) -> bool:
+        """
+        Set fields on one location in its own transaction.
+        
+        Returns:
+            False if the location is not in the catalog
+        """
+        return self.update_locations({name: fields}) == 1
+    
+    def update_locations(self, updates: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Apply {name: fields} to several locations in one transaction.
+        
+        Returns:
+            Number of locations found and updated
+        """
+        updated = 0
+        with self.transaction() as conn:
+            for name, fields in updates.items():
+                row = conn.execute("SELECT data FROM locations WHERE name = ?", (name,)).fetchone()
+                if row is None:
+                    continue
+                loc = json.loads(row["data"])
+                loc.update(fields)
+                conn.execute(
+                    "UPDATE locations SET route = ?, region = ?, pano_id = ?, processed = ?, "
+                    "data = ? WHERE name = ?",
+                    self._columns(loc) + (name,)
+                )
+                updated += 1
+        return updated
+    
+    def mark_processed(self, name: str, panorama_path: Optional[str],
+                       depth_path: Optional[str], processed_date: Optional[str] = None,
+                       **fields) -> bool:
+        """Record a successfully processed location"""
+        return self.update_location(
+            name, **processed_fields(panorama_path, depth_path, processed_date), **fields
+        )
+    
+    def set_section(self, key: str, value: Any):
+        """Set a top-level section (e.g. last_batch_run)"""
+        with self.transaction() as conn:
+            row = conn.execute("SELECT position FROM sections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                position = conn.execute(
+                    "SELECT COALESCE(MAX(position), -1) + 1 FROM sections"
+                ).fetchone()[0]
+            else:
+                position = row["position"]
+            conn.execute(
+                "INSERT OR REPLACE INTO sections (key, position, data) VALUES (?, ?, ?)",
+                (key, position, json.dumps(value, ensure_ascii=False))
+            )
+
+
+def open_catalog(locations_file: Path) -> LocationCatalog:
+    """Open the catalog for a locations file, importing it on first use"""
+    catalog = LocationCatalog(catalog_path(locations_file))
+    if catalog.is_empty() and Path(locations_file).exists():
+        count = catalog.import_json(locations_file)
+        print(f"Imported {count} locations into {catalog.path}")
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Big Island VR location catalog"
+    )
+    parser.add_argument("--locations", "-l", type=str,
+                        help="Locations JSON file (default: panoramas/locations.json)")
+    parser.add_argument("--import", dest="import_json", action="store_true",
+                        help="Re-import the JSON file, keeping processing state")
+    parser.add_argument("--export", action="store_true",
+                        help="Export the catalog to the JSON file")
+    parser.add_argument("--status", action="store_true",
+                        help="Show processing status")
+    
+    args = parser.parse_args()
+    
+    locations_file = Path(args.locations) if args.locations else \
+        Path(__file__).parent.parent / "panoramas" / "locations.json"
+    
+    with open_catalog(locations_file) as catalog:
+        if args.import_json:
+            count = catalog.import_json(locations_file)
+            print(f"Imported {count} locations from {locations_file}")
+        
+        if args.export:
+            catalog.export_json(locations_file)
+            print(f"Exported catalog to {locations_file}")
+        
+        if args.status or not (args.import_json or args.export):
+            counts = catalog.counts()
+            print(f"Locations: {counts['total']}, with Street View: {counts['with_pano']}, "
+                  f"processed: {counts['processed']}")
+            for route in catalog.route_progress():
+                print(f"  {route['route']}: {route['processed']}/{route['total']} processed")
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Memory Governor for Big Island VR
+
+Keeps concurrent pipeline stages under a node-level memory budget.
+
+Each stage is run inside governor.stage(name, estimate): the stage first
+reserves its estimated peak memory and waits while the memory already in
+use (resident RSS outside stages, such as loaded model weights and
+caches, plus the reservations of running stages, or the measured RSS if
+higher) leaves no room for it, or while measured RSS is over the budget.
+Concurrency thus adapts to the budget rather than to fixed worker counts.
+A background sampler records the peak RSS of this process and its
+children (stitch/render worker processes) while each stage runs; a stage
+whose observed growth exceeds its estimate has its estimate raised for
+later reservations.
+
+The ceiling is best-effort: the governor only delays stages, it cannot
+stop one from growing past its estimate. A stage starts regardless when
+no other stage is running, since waiting could not free anything; if it
+does not fit the budget even then, a warning says so. Keep it within
+budget by choosing smaller settings (the memory plans below).
+
+Without a budget nothing waits, but peaks are still recorded and logged.
+
+Stage memory estimates and the settings chosen to fit a budget (tile
+sizes, resolutions, worker counts) live with each script: see
+plan_pipeline_memory() in full_pipeline.py and plan_transition_memory()
+in generate_transitions.py.
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+SAMPLE_INTERVAL = 0.2  # Seconds between RSS samples while stages run
+ESTIMATE_MARGIN = 32 * MB  # Growth beyond an estimate that raises it
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def _proc_children(pid: int) -> List[int]:
+    children = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        try:
+            children.extend(int(c) for c in (task / "children").read_text().split())
+        except OSError:
+            pass
+    return children
+
+
+def process_tree_rss(pid: Optional[int] = None) -> int:
+    """
+    Resident memory in bytes of a process and all its descendants.
+    
+    Uses psutil if installed, else /proc (Linux); elsewhere falls back to
+    this process's peak RSS.
+    """
+    pid = pid or os.getpid()
+    
+    if HAS_PSUTIL:
+        try:
+            proc = psutil.Process(pid)
+            total = proc.memory_info().rss
+            for child in proc.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total
+        except psutil.Error:
+            return 0
+    
+    if Path("/proc/self/statm").exists():
+        total = 0
+        pending = [pid]
+        while pending:
+            p = pending.pop()
+            try:
+                total += _proc_rss(p)
+                pending.extend(_proc_children(p))
+            except OSError:
+                pass  # Exited meanwhile
+        return total
+    
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryGovernor:
+    """
+    Admission control and peak-RSS tracking for pipeline stages (best-effort ceiling).
+    
+    Args:
+        budget_mb: Node-level ceiling in MB, or None to only track peaks
+    """
+    
+    def __init__(self, budget_mb: Optional[float] = None):
+        self.budget = int(budget_mb * MB) if budget_mb else None
+        self.estimates: Dict[str, int] = {}  # Stage -> bytes, raised by observation
+        self.peaks: Dict[str, int] = {}  # Stage -> highest RSS seen while running
+        self._reserved = 0
+        self._baseline = 0  # RSS measured while no stage ran
+        self._rss = 0  # Latest RSS sample
+        self._over = False  # Latest sample exceeds the budget
+        self._active: Dict[int, List] = {}  # id -> [stage, start_rss, peak_rss, solo]
+        self._next_id = 0
+        self._cond = threading.Condition()
+        self._sampler = None
+    
+    @property
+    def enabled(self) -> bool:
+        return self.budget is not None
+    
+    def _sample(self):
+        while True:
+            with self._cond:
+                if not self._active:
+                    self._sampler = None
+                    self._over = False
+                    return
+            rss = process_tree_rss()
+            with self._cond:
+                self._rss = rss
+                for entry in self._active.values():
+                    entry[2] = max(entry[2], rss)
+                if self.budget:
+                    over = rss > self.budget
+                    if over and not self._over:
+                        logger.warning(f"RSS {rss / MB:.0f} MB exceeds the memory budget "
+                                       f"of {self.budget / MB:.0f} MB; holding back new stages")
+                    self._over = over
+                    self._cond.notify_all()
+            time.sleep(SAMPLE_INTERVAL)
+    
+    def _in_use(self) -> int:
+        """Memory counted against the budget: resident baseline plus reservations"""
+        return max(self._baseline + self._reserved, self._rss)
+    
+    def _fits(self, need: int) -> bool:
+        # Nothing running could free memory by finishing, so waiting is futile
+        if not self._active:
+            return True
+        return not self._over and self._in_use() + need <= self.budget
+    
+    @contextmanager
+    def stage(self, name: str, estimate: int = 0) -> Iterator[Dict]:
+        """
+        Run a stage under the budget.
+        
+        Waits until `estimate` bytes (or the stage's observed peak growth,
+        if higher) can be reserved. Yields a dict that holds "peak_rss"
+        (bytes) once the stage ends.
+        """
+        need = max(estimate, self.estimates.get(name, 0))
+        stats = {}
+        
+        with self._cond:
+            if self.budget:
+                waited = False
+                while not self._fits(need):
+                    if not waited:
+                        logger.debug(f"{name}: waiting for {need / MB:.0f} MB "
+                                     f"({self._in_use() / MB:.0f} MB in use)")
+                        waited = True
+                    self._cond.wait()
+                if not self._active:
+                    self._baseline = self._rss = process_tree_rss()
+                    if self._baseline + need > self.budget:
+                        logger.warning(
+                            f"{name}: estimated {need / MB:.0f} MB on top of "
+                            f"{self._baseline / MB:.0f} MB resident exceeds the memory budget "
+                            f"of {self.budget / MB:.0f} MB; running it alone")
+                self._reserved += need
+            
+            stage_id = self._next_id
+            self._next_id += 1
+            start_rss = process_tree_rss()
+            for entry in self._active.values():
+                entry[3] = False
+            self._active[stage_id] = [name, start_rss, start_rss, not self._active]
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name="memory-sampler",
+                                                 daemon=True)
+                self._sampler.start()
+        
+        try:
+            yield stats
+        finally:
+            end_rss = process_tree_rss()
+            with self._cond:
+                _, start_rss, peak, solo = self._active.pop(stage_id)
+                peak = max(peak, end_rss)
+                if self.budget:
+                    self._reserved -= need
+                if not self._active:
+                    self._baseline = self._rss = end_rss  # Includes what the stage left resident
+                self.peaks[name] = max(self.peaks.get(name, 0), peak)
+                
+                # Growth is only attributable to this stage if it ran alone
+                growth = peak - start_rss
+                if solo and growth > need + ESTIMATE_MARGIN:
+                    self.estimates[name] = growth
+                    if self.budget:
+                        logger.info(f"{name}: grew by {growth / MB:.0f} MB, above its "
+                                    f"{need / MB:.0f} MB estimate; reserving more from now on")
+                self._cond.notify_all()
+            
+            stats["peak_rss"] = peak
+            logger.debug(f"{name}: peak RSS {peak / MB:.0f} MB")
+    
+    def log_summary(self):
+        """Log the peak RSS seen per stage"""
+        if not self.peaks:
+            return
+        budget = f" (budget {self.budget / MB:.0f} MB)" if self.budget else ""
+        logger.info(f"Peak RSS per stage{budget}:")
+        for name, peak in self.peaks.items():
+            logger.info(f"  {name:<16} {peak / MB:>8.0f} MB")
+
+
+def add_memory_arguments(parser: argparse.ArgumentParser):
+    """Add the --memory-budget option (used by the pipeline scripts)"""
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="Node memory ceiling in MB (best-effort); tile sizes, "
+                             "resolutions, buffering and worker counts are chosen to fit "
+                             "it, and stages wait while memory in use leaves no room")
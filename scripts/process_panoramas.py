@@ -26,6 +26,8 @@ from typing import Optional, List, Dict, Tuple
 from PIL import Image
 import numpy as np
 
+from location_catalog import open_catalog
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -417,14 +419,12 @@ def main():
     locations_file = output_base / "locations.json"
     
     # Load locations
-    if not locations_file.exists():
-        print(f"\nLocations file not found: {locations_file}")
+    catalog = open_catalog(locations_file)
+    if catalog.is_empty():
+        print(f"\nNo locations in catalog (locations file: {locations_file})")
         return 1
     
-    with open(locations_file) as f:
-        data = json.load(f)
-    
-    locations = data.get("locations", [])
+    locations = catalog.locations()
     print(f"\nLoaded {len(locations)} locations from database")
     
     # Find locations with Street View coverage
@@ -471,6 +471,11 @@ def main():
         
         if result["success"]:
             successful += 1
+            # Record in the catalog as soon as each location is done
+            catalog.mark_processed(
+                result["name"], result["panorama_path"], result["depth_path"],
+                pano_id=result["pano_id"]
+            )
         else:
             failed += 1
     
@@ -485,19 +490,7 @@ def main():
             "results": results
         }, f, indent=2)
     
-    # Update locations.json with paths
-    for result in results:
-        if result["success"]:
-            for loc in data["locations"]:
-                if loc["name"] == result["name"]:
-                    loc["panorama_path"] = result["panorama_path"]
-                    loc["depth_path"] = result["depth_path"]
-                    loc["pano_id"] = result["pano_id"]
-                    loc["processed"] = True
-                    break
-    
-    with open(locations_file, "w") as f:
-        json.dump(data, f, indent=2)
+    catalog.close()
     
     # Summary
     print("\n" + "=" * 70)
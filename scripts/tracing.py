@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Span Tracing for Big Island VR
+
+Times pipeline stages and the work nested inside them (tile downloads,
+model calls, frame encoding) as spans, and exports them as a Chrome trace
+(open in chrome://tracing or https://ui.perfetto.dev) or as JSON lines.
+
+Spans always measure their duration, so callers can report timings; they
+are only kept for export once the tracer is enabled (--trace).
+
+Usage in scripts:
+    from tracing import tracer
+
+    with tracer.span("stitch", location=name) as span:
+        ...
+    print(span.duration)
+
+Usage:
+    python full_pipeline.py ... --trace run.json --trace run.jsonl
+    python tracing.py run.jsonl     # Total time per span name
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+@dataclass
+class Span:
+    """A timed block of work"""
+    name: str
+    cat: str
+    start: float  # Wall clock (epoch seconds), comparable across processes
+    duration: float = 0.0  # Seconds
+    pid: int = 0
+    tid: int = 0
+    thread: str = ""
+    args: Dict[str, Any] = field(default_factory=dict)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "cat": self.cat,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6),
+            "pid": self.pid,
+            "tid": self.tid,
+            "thread": self.thread,
+            "args": self.args,
+        }
+
+
+class Tracer:
+    """Collects spans from all threads of a process"""
+    
+    def __init__(self):
+        self.enabled = False
+        self._spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+    
+    def enable(self):
+        self.enabled = True
+    
+    @contextmanager
+    def span(self, name: str, cat: str = "stage", **args) -> Iterator[Span]:
+        """Time the enclosed block; extra keyword args are attached to the span"""
+        thread = threading.current_thread()
+        span = Span(name=name, cat=cat, start=time.time(), pid=os.getpid(),
+                    tid=threading.get_ident(), thread=thread.name, args=args)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            if self.enabled:
+                with self._lock:
+                    self._spans.append(span.to_dict())
+    
+    def add(self, spans: Iterable[Dict[str, Any]]):
+        """Add spans recorded elsewhere (e.g. returned by a worker process)"""
+        with self._lock:
+            self._spans.extend(spans)
+    
+    def drain(self) -> List[Dict[str, Any]]:
+        """Remove and return the recorded spans"""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        return spans
+    
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+    
+    def export(self, path: Path):
+        """Write spans as JSON lines (.jsonl) or a Chrome trace (anything else)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        spans = sorted(self.spans(), key=lambda s: s["start"])
+        with open(path, 'w') as f:
+            if path.suffix == ".jsonl":
+                for span in spans:
+                    f.write(json.dumps(span) + "\n")
+            else:
+                json.dump(chrome_trace(spans), f)
+        print(f"Trace: {len(spans)} spans written to {path}")
+
+
+def chrome_trace(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Chrome trace event format: complete ("X") events plus thread names"""
+    events = []
+    threads = {}
+    for span in spans:
+        events.append({
+            "name": span["name"],
+            "cat": span["cat"],
+            "ph": "X",
+            "ts": span["start"] * 1e6,
+            "dur": span["duration"] * 1e6,
+            "pid": span["pid"],
+            "tid": span["tid"],
+            "args": span["args"],
+        })
+        threads[(span["pid"], span["tid"])] = span["thread"]
+    
+    for (pid, tid), name in threads.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                       "args": {"name": name}})
+    
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def load_spans(path: Path) -> List[Dict[str, Any]]:
+    """Read spans back from either export format"""
+    path = Path(path)
+    with open(path) as f:
+        if path.suffix == ".jsonl":
+            return [json.loads(line) for line in f if line.strip()]
+        events = json.load(f)["traceEvents"]
+    return [
+        {"name": e["name"], "cat": e["cat"], "start": e["ts"] / 1e6,
+         "duration": e["dur"] / 1e6, "pid": e["pid"], "tid": e["tid"],
+         "args": e.get("args", {})}
+        for e in events if e.get("ph") == "X"
+    ]
+
+
+def summarize(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Count, total and max seconds per span name, slowest total first"""
+    stats = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+    for span in spans:
+        s = stats[span["name"]]
+        s["count"] += 1
+        s["total"] += span["duration"]
+        s["max"] = max(s["max"], span["duration"])
+    return dict(sorted(stats.items(), key=lambda kv: -kv[1]["total"]))
+
+
+def add_trace_arguments(parser: argparse.ArgumentParser):
+    """Add the --trace option (used by the pipeline scripts)"""
+    parser.add_argument("--trace", action="append", metavar="PATH",
+                        help="Write a span trace: .jsonl for JSON lines, otherwise "
+                             "Chrome trace format (repeatable)")
+
+
+def start_tracing(args: argparse.Namespace):
+    if args.trace:
+        tracer.enable()
+
+
+def export_traces(args: argparse.Namespace):
+    for path in args.trace or []:
+        tracer.export(Path(path))
+
+
+# Process-wide tracer used by all scripts
+tracer = Tracer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a span trace")
+    parser.add_argument("trace", type=str, help="Trace file (.json or .jsonl)")
+    args = parser.parse_args()
+    
+    stats = summarize(load_spans(Path(args.trace)))
+    print(f"{'Span':<24} {'Count':>7} {'Total s':>10} {'Mean s':>9} {'Max s':>9}")
+    for name, s in stats.items():
+        print(f"{name:<24} {s['count']:>7} {s['total']:>10.2f} "
+              f"{s['total'] / s['count']:>9.3f} {s['max']:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())